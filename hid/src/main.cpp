@@ -241,24 +241,35 @@ static void _cmdMouseWheelEvent(const uint8_t *data) { // 2 bytes
 	}
 }
 
-static uint8_t _handleRequest(const uint8_t *data) { // 8 bytes
-	if (PROTO::crc16(data, 6) == PROTO::merge8(data[6], data[7])) {
-#		define HANDLE(_handler) { _handler(data + 2); return PROTO::PONG::OK; }
-		switch (data[1]) {
-			case PROTO::CMD::PING:				return PROTO::PONG::OK;
-			case PROTO::CMD::SET_KEYBOARD:		HANDLE(_cmdSetKeyboard);
-			case PROTO::CMD::SET_MOUSE:			HANDLE(_cmdSetMouse);
-			case PROTO::CMD::SET_CONNECTED:		HANDLE(_cmdSetConnected);
-			case PROTO::CMD::CLEAR_HID:			HANDLE(_cmdClearHid);
-			case PROTO::CMD::KEYBOARD::KEY:		HANDLE(_cmdKeyEvent);
-			case PROTO::CMD::MOUSE::BUTTON:		HANDLE(_cmdMouseButtonEvent);
-			case PROTO::CMD::MOUSE::MOVE:		HANDLE(_cmdMouseMoveEvent);
-			case PROTO::CMD::MOUSE::RELATIVE:	HANDLE(_cmdMouseRelativeEvent);
-			case PROTO::CMD::MOUSE::WHEEL:		HANDLE(_cmdMouseWheelEvent);
-			case PROTO::CMD::REPEAT:	return 0;
-			default:					return PROTO::RESP::INVALID_ERROR;
+static uint8_t _handleCommand(const uint8_t *data) { // 5 bytes: cmd + 4 data bytes
+#	define HANDLE(_handler) { _handler(data + 1); return PROTO::PONG::OK; }
+	switch (data[0]) {
+		case PROTO::CMD::PING:				return PROTO::PONG::OK;
+		case PROTO::CMD::SET_KEYBOARD:		HANDLE(_cmdSetKeyboard);
+		case PROTO::CMD::SET_MOUSE:			HANDLE(_cmdSetMouse);
+		case PROTO::CMD::SET_CONNECTED:		HANDLE(_cmdSetConnected);
+		case PROTO::CMD::CLEAR_HID:			HANDLE(_cmdClearHid);
+		case PROTO::CMD::KEYBOARD::KEY:		HANDLE(_cmdKeyEvent);
+		case PROTO::CMD::MOUSE::BUTTON:		HANDLE(_cmdMouseButtonEvent);
+		case PROTO::CMD::MOUSE::MOVE:		HANDLE(_cmdMouseMoveEvent);
+		case PROTO::CMD::MOUSE::RELATIVE:	HANDLE(_cmdMouseRelativeEvent);
+		case PROTO::CMD::MOUSE::WHEEL:		HANDLE(_cmdMouseWheelEvent);
+		case PROTO::CMD::REPEAT:	return 0;
+		default:					return PROTO::RESP::INVALID_ERROR;
+	}
+#	undef HANDLE
+}
+
+static uint8_t _handleRequest(const uint8_t *data, uint8_t length) { // 8 bytes or a batch
+	if (PROTO::crc16(data, length - 2) == PROTO::merge8(data[length - 2], data[length - 1])) {
+		if (data[1] == PROTO::CMD::BATCH && length > 8) {
+			uint8_t code = PROTO::PONG::OK;
+			for (uint8_t index = 0; index < data[2] && code == PROTO::PONG::OK; ++index) {
+				code = _handleCommand(data + 3 + index * 5);
+			}
+			return code;
 		}
-#		undef HANDLE
+		return _handleCommand(data + 1);
 	}
 	return PROTO::RESP::CRC_ERROR;
 }
@@ -277,6 +288,7 @@ static void _sendResponse(uint8_t code) {
 	response[0] = PROTO::MAGIC_RESP;
 	if (code & PROTO::PONG::OK) {
 		response[1] = PROTO::PONG::OK;
+		response[4] = PROTO::FEATURES::BATCH;
 #		ifdef HID_DYNAMIC
 		if (_reset_required) {
 			response[1] |= PROTO::PONG::RESET_REQUIRED;
@@ -342,7 +354,7 @@ int main() {
 #	ifdef CMD_SERIAL
 	CMD_SERIAL.begin(CMD_SERIAL_SPEED);
 	unsigned long last = micros();
-	uint8_t buffer[8];
+	uint8_t buffer[PROTO::MAX_REQUEST_LENGTH];
 	uint8_t index = 0;
 #	elif defined(CMD_SPI)
 	spiBegin();
@@ -367,12 +379,12 @@ int main() {
 #		ifdef CMD_SERIAL
 		if (CMD_SERIAL.available() > 0) {
 			buffer[index] = (uint8_t)CMD_SERIAL.read();
-			if (index == 7) {
-				_sendResponse(_handleRequest(buffer));
+			++index;
+			if (index >= 3 && index == PROTO::getRequestLength(buffer)) {
+				_sendResponse(_handleRequest(buffer, index));
 				index = 0;
 			} else {
 				last = micros();
-				++index;
 			}
 		} else if (index > 0) {
 			if (is_micros_timed_out(last, CMD_SERIAL_TIMEOUT)) {
@@ -382,7 +394,8 @@ int main() {
 		}
 #		elif defined(CMD_SPI)
 		if (spiReady()) {
-			_sendResponse(_handleRequest(spiGet()));
+			const uint8_t *data = spiGet();
+			_sendResponse(_handleRequest(data, PROTO::getRequestLength(data)));
 		}
 #		endif
 	}
@@ -61,6 +61,10 @@ namespace PROTO {
 		};
 	};
 
+	namespace FEATURES { // Complex response
+		const uint8_t BATCH =	0b00000001;
+	};
+
 	namespace OUTPUTS2 { // Complex response
 		const uint8_t CONNECTABLE =		0b10000000;
 		const uint8_t CONNECTED =		0b01000000;
@@ -76,6 +80,7 @@ namespace PROTO {
 		const uint8_t SET_MOUSE =		0x04;
 		const uint8_t SET_CONNECTED =	0x05;
 		const uint8_t CLEAR_HID =		0x10;
+		const uint8_t BATCH =			0x20;
 
 		namespace KEYBOARD {
 			const uint8_t KEY =	0x11;
@@ -109,7 +114,17 @@ namespace PROTO {
 		};
 	};
 
-	uint16_t crc16(const uint8_t *buffer, unsigned length) {
+	const uint8_t BATCH_MAX_EVENTS = 8;
+	const uint8_t MAX_REQUEST_LENGTH = 3 + BATCH_MAX_EVENTS * 5 + 2; // Magic, cmd, count, events, crc
+
+	inline uint8_t getRequestLength(const uint8_t *data) { // At least 3 bytes must be received
+		if (data[1] == CMD::BATCH && data[2] > 1 && data[2] <= BATCH_MAX_EVENTS) {
+			return 3 + data[2] * 5 + 2;
+		}
+		return 8;
+	}
+
+	inline uint16_t crc16(const uint8_t *buffer, unsigned length) {
 		const uint16_t polinom = 0xA001;
 		uint16_t crc = 0xFFFF;
 
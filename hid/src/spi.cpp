@@ -25,8 +25,10 @@
 #include <Arduino.h>
 #include <SPI.h>
 
+#include "proto.h"
 
-static volatile uint8_t _spi_in[8] = {0};
+
+static volatile uint8_t _spi_in[PROTO::MAX_REQUEST_LENGTH] = {0};
 static volatile uint8_t _spi_in_index = 0;
 
 static volatile uint8_t _spi_out[8] = {0};
@@ -38,8 +40,12 @@ void spiBegin() {
 	SPCR = (1 << SPE) | (1 << SPIE); // Slave, SPI En, IRQ En
 }
 
+static bool _isInReady() {
+	return (_spi_in_index >= 3 && _spi_in_index == PROTO::getRequestLength((const uint8_t *)_spi_in));
+}
+
 bool spiReady() {
-	return (!_spi_out[0] && _spi_in_index == 8);
+	return (!_spi_out[0] && _isInReady());
 }
 
 const uint8_t *spiGet() {
@@ -71,11 +77,11 @@ ISR(SPI_STC_vect) {
 		if (!receiving && in != 0) {
 			receiving = true;
 		}
-		if (receiving && _spi_in_index < 8) {
+		if (receiving && _spi_in_index < PROTO::MAX_REQUEST_LENGTH && !_isInReady()) {
 			_spi_in[_spi_in_index] = in;
 			++_spi_in_index;
 		}
-		if (_spi_in_index == 8) {
+		if (_isInReady()) {
 			receiving = false;
 		}
 		SPDR = 0;
@@ -20,20 +20,10 @@
 # ========================================================================== #
 
 
-import os
-
 import aiofiles
-import aiofiles.base
-
-from . import aiotools
 
 
 # =====
 async def read(path: str) -> str:
     async with aiofiles.open(path) as afile:  # type: ignore
         return (await afile.read())
-
-
-async def afile_sync(afile: aiofiles.base.AiofilesContextManager) -> None:
-    await afile.flush()  # type: ignore
-    await aiotools.run_async(os.fsync, afile.fileno())  # type: ignore
@@ -20,19 +20,46 @@
 # ========================================================================== #
 
 
+import os
+import select
+import asyncio
 import multiprocessing
 import queue
+import struct
 
 from typing import Tuple
+from typing import List
 from typing import Dict
 from typing import Type
 from typing import TypeVar
 from typing import Generic
 from typing import Optional
+from typing import Any
 
 from . import aiotools
 
 
+# =====
+async def _wait_readable(fd: int, timeout: Optional[float]) -> bool:
+    # Ждем данных средствами эвентлупа без блокировки потока экзекутора.
+    # На один fd может ждать только одна корутина: add_reader() заменяет колбэк.
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def callback() -> None:
+        if not fut.done():
+            fut.set_result(None)
+
+    loop.add_reader(fd, callback)
+    try:
+        await asyncio.wait_for(fut, timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(fd)
+
+
 # =====
 _QueueItemT = TypeVar("_QueueItemT")
 
@@ -42,7 +69,11 @@ async def queue_get_last(  # pylint: disable=invalid-name
     timeout: float,
 ) -> Tuple[bool, Optional[_QueueItemT]]:
 
-    return (await aiotools.run_async(queue_get_last_sync, q, timeout))
+    if q.empty():
+        fd = q._reader.fileno()  # type: ignore  # pylint: disable=protected-access
+        if not (await _wait_readable(fd, timeout)):
+            return (False, None)
+    return queue_get_last_sync(q, 0)
 
 
 def queue_get_last_sync(  # pylint: disable=invalid-name
@@ -61,16 +92,112 @@ def queue_get_last_sync(  # pylint: disable=invalid-name
 
 # =====
 class AioProcessNotifier:
+    # Пайп вместо очереди: нотифаер можно дергать из дочерних процессов,
+    # а ожидание происходит прямо в эвентлупе через add_reader().
+
     def __init__(self) -> None:
-        self.__queue: "multiprocessing.Queue[None]" = multiprocessing.Queue()
+        (self.__read_fd, self.__write_fd) = os.pipe()
+        os.set_blocking(self.__read_fd, False)
+        os.set_blocking(self.__write_fd, False)
 
     def notify(self) -> None:
-        self.__queue.put_nowait(None)
+        try:
+            os.write(self.__write_fd, b"\0")
+        except BlockingIOError:
+            pass  # Пайп переполнен, значит пробуждение и так ожидается
 
     async def wait(self) -> None:
-        while not (await queue_get_last(self.__queue, 0.1))[0]:
+        while not self.__drain():
+            await _wait_readable(self.__read_fd, None)
+
+    def __drain(self) -> bool:
+        notified = False
+        while True:
+            try:
+                if not os.read(self.__read_fd, 4096):
+                    break
+                notified = True
+            except BlockingIOError:
+                break
+        return notified
+
+
+# =====
+class SharedRing:
+    # Кольцевой буфер фиксированных бинарных записей в разделяемой памяти.
+    # Вместо пиклинга и фидер-треда multiprocessing.Queue запись просто пакуется
+    # в буфер под локом. Читатель забирает все накопленные записи разом,
+    # а дверной звонок (пайп) дергается только при переходе из пустого состояния.
+
+    def __init__(self, record_fmt: str, capacity: int) -> None:
+        assert capacity > 0
+        self.__record = struct.Struct(record_fmt)
+        self.__capacity = capacity
+
+        self.__buf = multiprocessing.RawArray("B", self.__record.size * capacity)
+        self.__head = multiprocessing.RawValue("L", 0)  # Следующая запись для чтения
+        self.__tail = multiprocessing.RawValue("L", 0)  # Следующая запись для записи
+        self.__lock = multiprocessing.Lock()
+
+        (self.__bell_read_fd, self.__bell_write_fd) = os.pipe()
+        os.set_blocking(self.__bell_read_fd, False)
+        os.set_blocking(self.__bell_write_fd, False)
+
+    def fileno(self) -> int:
+        # Для select() в процессе-читателе
+        return self.__bell_read_fd
+
+    def put(self, *values: Any, clear: bool=False) -> bool:
+        # Очистка и запись под одним локом, чтобы не было гонки между процессами
+        with self.__lock:
+            if clear:
+                self.__head.value = self.__tail.value
+            (head, tail) = (self.__head.value, self.__tail.value)
+            if tail - head >= self.__capacity:
+                return False
+            self.__record.pack_into(self.__buf, (tail % self.__capacity) * self.__record.size, *values)  # type: ignore
+            self.__tail.value = tail + 1
+        if head == tail:
+            self.__ring()
+        return True
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__head.value = self.__tail.value
+
+    def qsize(self) -> int:
+        with self.__lock:
+            return (self.__tail.value - self.__head.value)
+
+    def wait(self, timeout: float) -> bool:
+        return bool(select.select([self.__bell_read_fd], [], [], timeout)[0])
+
+    def get_all(self) -> List[Tuple]:
+        # Звонок сбрасывается до чтения: запись, добавленная после этого, позвонит снова
+        self.__drain_bell()
+        with self.__lock:
+            (head, tail) = (self.__head.value, self.__tail.value)
+            records = [
+                self.__record.unpack_from(self.__buf, (index % self.__capacity) * self.__record.size)  # type: ignore
+                for index in range(head, tail)
+            ]
+            self.__head.value = tail
+        return records
+
+    def __ring(self) -> None:
+        try:
+            os.write(self.__bell_write_fd, b"\0")
+        except BlockingIOError:
             pass
 
+    def __drain_bell(self) -> None:
+        while True:
+            try:
+                if not os.read(self.__bell_read_fd, 4096):
+                    break
+            except BlockingIOError:
+                break
+
 
 # =====
 _SharedFlagT = TypeVar("_SharedFlagT", int, bool)
@@ -106,11 +233,22 @@ class AioSharedFlags(Generic[_SharedFlagT]):
             self.__notifier.notify()
 
     async def get(self) -> Dict[str, _SharedFlagT]:
+        # Лок нужен и для чтения: только он дает барьеры памяти между процессами.
+        # Писатель держит его считанные микросекунды, так что обычно он свободен
+        # и берется прямо в лупе, а в экзекьютор чтение уходит только при конфликте.
+        if self.__lock.acquire(block=False):
+            try:
+                return self.__get_flags()
+            finally:
+                self.__lock.release()
         return (await aiotools.run_async(self.__inner_get))
 
     def __inner_get(self) -> Dict[str, _SharedFlagT]:
         with self.__lock:
-            return {
-                key: self.__type(shared.value)
-                for (key, shared) in self.__flags.items()
-            }
+            return self.__get_flags()
+
+    def __get_flags(self) -> Dict[str, _SharedFlagT]:
+        return {
+            key: self.__type(shared.value)
+            for (key, shared) in self.__flags.items()
+        }
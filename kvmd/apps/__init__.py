@@ -356,6 +356,19 @@ def _get_config_scheme() -> Dict:
             "auth": {
                 "enabled": Option(True, type=valid_bool),
 
+                "cache": {
+                    "ttl":         Option(10.0, type=valid_float_f0),
+                    "fail_limit":  Option(5,    type=valid_int_f0),
+                    "fail_window": Option(60.0, type=valid_float_f0),
+                    "fail_delay":  Option(1.0,  type=valid_float_f0),
+                },
+
+                "tokens": {
+                    "idle_timeout": Option(0.0, type=valid_float_f0),
+                    "lifetime":     Option(0.0, type=valid_float_f0),
+                    "storage":      Option("",  type=valid_abs_path, if_empty=""),
+                },
+
                 "internal": {
                     "type":        Option("htpasswd"),
                     "force_users": Option([], type=valid_users_list),
@@ -455,6 +468,7 @@ def _get_config_scheme() -> Dict:
 
             "ocr": {
                 "langs": Option(["eng"], type=valid_string_list, unpack_as="default_langs"),
+                "pool_size": Option(2, type=valid_int_f1),
             },
 
             "snapshot": {
@@ -615,6 +629,34 @@ def _get_config_scheme() -> Dict:
             "desired_fps": Option(30, type=valid_stream_fps),
             "keymap":      Option("/usr/share/kvmd/keymaps/en-us", type=valid_abs_file),
 
+            "pacing": {
+                "enabled":     Option(True,  type=valid_bool, unpack_as="pacing_enabled"),
+                "min_fps":     Option(5,     type=functools.partial(valid_number, min=1, max=120), unpack_as="pacing_min_fps"),
+                "min_quality": Option(30,    type=valid_stream_quality, unpack_as="pacing_min_quality"),
+                "requality":   Option(False, type=valid_bool, unpack_as="pacing_requality"),
+                "queue_size":  Option(4,     type=valid_int_f1, unpack_as="fb_queue_size"),
+            },
+
+            "dirty": {
+                "enabled":   Option(False, type=valid_bool, unpack_as="dirty_enabled"),
+                "tile_size": Option(64,    type=functools.partial(valid_number, min=16, max=1024), unpack_as="dirty_tile_size"),
+                "threshold": Option(16,    type=functools.partial(valid_number, min=0, max=255), unpack_as="dirty_threshold"),
+            },
+
+            "text_cache": {
+                "max_size": Option(4 * 1024 * 1024, type=valid_int_f1, unpack_as="text_cache_max_size"),
+                "resolutions": Option(
+                    ["640x480", "800x600", "1024x768", "1280x720", "1280x1024", "1920x1080"],
+                    type=functools.partial(valid_string_list, subval=valid_stream_resolution),
+                    unpack_as="text_cache_resolutions",
+                ),
+                "qualities": Option(
+                    [80, 90],
+                    type=functools.partial(valid_string_list, subval=valid_stream_quality),
+                    unpack_as="text_cache_qualities",
+                ),
+            },
+
             "server": {
                 "host":        Option("::", type=valid_ip_or_host),
                 "port":        Option(5900, type=valid_port),
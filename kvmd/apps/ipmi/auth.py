@@ -55,6 +55,9 @@ class IpmiAuthManager:
     def get_credentials(self, ipmi_user: str) -> IpmiUserCredentials:
         return self.__credentials[ipmi_user]
 
+    def get_all_credentials(self) -> List[IpmiUserCredentials]:
+        return list(self.__credentials.values())
+
     def __parse_passwd_file(self, lines: List[str]) -> Dict[str, IpmiUserCredentials]:
         credentials: Dict[str, IpmiUserCredentials] = {}
         for (lineno, line) in enumerate(lines):
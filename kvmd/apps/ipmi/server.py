@@ -25,10 +25,14 @@ import select
 import asyncio
 import threading
 import multiprocessing
-import functools
 import queue
+import dataclasses
+import time
 
+from typing import Tuple
+from typing import List
 from typing import Dict
+from typing import Callable
 from typing import Optional
 
 import aiohttp
@@ -43,12 +47,50 @@ from ...logging import get_logger
 
 from ...clients.kvmd import KvmdClient
 
-from ... import aiotools
+from ... import tools
 
 from .auth import IpmiAuthManager
 
 
 # =====
+_DEFERRED_POLL_INTERVAL = 0.1
+_USER_CHECK_TTL = 10.0
+
+
+@dataclasses.dataclass(frozen=True)
+class _DeferredReply:
+    # Pyghmi адресует ответ по полям сессии, которые перезаписываются каждым входящим пакетом.
+    # Для ответа, отправляемого позже, их нужно запомнить в момент получения запроса.
+
+    session: IpmiServerSession
+    netfn: int
+    command: int
+    seqlun: int
+    clientaddr: int
+    rqlun: int
+
+    @classmethod
+    def capture(cls, session: IpmiServerSession) -> "_DeferredReply":
+        return _DeferredReply(
+            session=session,
+            netfn=session.clientnetfn,
+            command=session.clientcommand,
+            seqlun=session.seqlun,
+            clientaddr=session.clientaddr,
+            rqlun=session.rqlun,
+        )
+
+    def send(self, code: int, data: List[int]) -> None:
+        # Только из потока IPMI, иначе пакет может прийти посреди отправки
+        session = self.session
+        session.clientnetfn = self.netfn
+        session.clientcommand = self.command
+        session.seqlun = self.seqlun
+        session.clientaddr = self.clientaddr
+        session.rqlun = self.rqlun
+        session.send_ipmi_response(code=code, data=data)
+
+
 class IpmiServer(BaseIpmiServer):  # pylint: disable=too-many-instance-attributes,abstract-method
     # https://www.intel.com/content/dam/www/public/us/en/documents/product-briefs/ipmi-second-gen-interface-spec-v2-rev1-1.pdf
     # https://www.thomas-krenn.com/en/wiki/IPMI_Basics
@@ -82,6 +124,16 @@ class IpmiServer(BaseIpmiServer):  # pylint: disable=too-many-instance-attribute
         self.__sol_select_timeout = sol_select_timeout
         self.__sol_proxy_port = (sol_proxy_port or port)
 
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__ipmi_thread = threading.Thread(target=self.__ipmi_worker, daemon=True)
+        self.__ipmi_stop = False
+
+        self.__deferred_replies: "queue.SimpleQueue[Tuple[_DeferredReply, int, List[int]]]" = queue.SimpleQueue()
+        self.__deferred_count = 0  # Only for the IPMI thread
+
+        self.__atx_state: Optional[Dict] = None
+        self.__checked_users: Dict[str, float] = {}  # {ipmi_user: expire_ts}, written only by the loop
+
         self.__sol_lock = threading.Lock()
         self.__sol_console: Optional[IpmiConsole] = None
         self.__sol_thread: Optional[threading.Thread] = None
@@ -89,14 +141,54 @@ class IpmiServer(BaseIpmiServer):  # pylint: disable=too-many-instance-attribute
 
     def run(self) -> None:
         logger = get_logger(0)
-        logger.info("Listening IPMI on UPD [%s]:%d ...", self.__host, self.__port)
+        loop = asyncio.get_event_loop()
+        self.__loop = loop
         try:
-            while True:
-                IpmiSession.wait_for_rsp(self.__timeout)
-        except (SystemExit, KeyboardInterrupt):
-            pass
-        self.__stop_sol_worker()
-        logger.info("Bye-bye")
+            logger.info("Listening IPMI on UPD [%s]:%d ...", self.__host, self.__port)
+            loop.create_task(self.__atx_watcher())
+            self.__ipmi_thread.start()
+            try:
+                loop.run_forever()
+            except (SystemExit, KeyboardInterrupt):
+                pass
+            finally:
+                self.__ipmi_stop = True
+                self.__ipmi_thread.join()
+                self.__stop_sol_worker()
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(self.__kvmd.close())
+            loop.close()
+            logger.info("Bye-bye")
+
+    def __ipmi_worker(self) -> None:
+        # Pyghmi умеет только в блокирующий цикл обработки пакетов, поэтому он живет в отдельном потоке,
+        # а все походы в KVMD выполняются на основном лупе и никогда не блокируют этот цикл.
+        # Сессии pyghmi не потокобезопасны, так что результаты с лупа возвращаются через очередь
+        # и отправляются отсюда. Пока есть незавершенные запросы, очередь опрашивается чаще.
+        logger = get_logger(0)
+        while not self.__ipmi_stop:
+            try:
+                IpmiSession.wait_for_rsp(_DEFERRED_POLL_INTERVAL if self.__deferred_count else self.__timeout)
+                self.__send_deferred_replies()
+            except Exception:
+                logger.exception("Unexpected IPMI loop error")
+                time.sleep(1)
+
+    def __send_deferred_replies(self) -> None:
+        while True:
+            try:
+                (reply, code, data) = self.__deferred_replies.get_nowait()
+            except queue.Empty:
+                break
+            self.__deferred_count -= 1
+            try:
+                reply.send(code, data)
+            except Exception:
+                get_logger(0).exception("[%s]: Can't send IPMI reply", reply.session.sockaddr[0])
 
     # =====
 
@@ -114,8 +206,6 @@ class IpmiServer(BaseIpmiServer):  # pylint: disable=too-many-instance-attribute
         if handler is not None:
             try:
                 handler(request, session)
-            except (aiohttp.ClientError, asyncio.TimeoutError):
-                session.send_ipmi_response(code=0xFF)
             except Exception:
                 get_logger(0).exception("[%s]: Unexpected exception while handling IPMI request: netfn=%d; command=%d",
                                         session.sockaddr[0], request["netfn"], request["command"])
@@ -127,23 +217,66 @@ class IpmiServer(BaseIpmiServer):  # pylint: disable=too-many-instance-attribute
 
     def __get_power_state_handler(self, _: Dict, session: IpmiServerSession) -> None:
         # https://github.com/arcress0/ipmiutil/blob/e2f6e95127d22e555f959f136d9bb9543c763896/util/ireset.c#L654
-        result = self.__make_request(session, "atx.get_state() [power]", "atx.get_state")
-        data = [(0 if result["leds"]["power"] else 5)]
-        session.send_ipmi_response(data=data)
+        self.__reply_atx_state(session, "atx.get_state() [power]", (
+            lambda state: (0xFF, []) if state is None else (0, [(0 if state["leds"]["power"] else 5)])
+        ))
 
     def __get_selftest_status_handler(self, _: Dict, session: IpmiServerSession) -> None:
         # https://github.com/arcress0/ipmiutil/blob/e2f6e95127d22e555f959f136d9bb9543c763896/util/ihealth.c#L858
-        data = [0x0055]
-        try:
-            self.__make_request(session, "atx.get_state() [health]", "atx.get_state")
-        except Exception:
-            data = [0]
-        session.send_ipmi_response(data=data)
+        self.__reply_atx_state(session, "atx.get_state() [health]", (
+            lambda state: (0, [(0 if state is None else 0x0055)])
+        ))
 
     def __get_chassis_status_handler(self, _: Dict, session: IpmiServerSession) -> None:
-        result = self.__make_request(session, "atx.get_state() [chassis]", "atx.get_state")
-        data = [int(result["leds"]["power"]), 0, 0]
-        session.send_ipmi_response(data=data)
+        self.__reply_atx_state(session, "atx.get_state() [chassis]", (
+            lambda state: (0xFF, []) if state is None else (0, [int(state["leds"]["power"]), 0, 0])
+        ))
+
+    def __reply_atx_state(
+        self,
+        session: IpmiServerSession,
+        name: str,
+        make_response: Callable[[Optional[Dict]], Tuple[int, List[int]]],
+    ) -> None:
+
+        # Общий кеш состояния ATX отдается только тем, чья собственная учетка KVMD
+        # недавно прошла проверку. Иначе ответ откладывается до проверки на основном лупе.
+        if self.__checked_users.get(session.username.decode(), 0.0) > time.monotonic():
+            (code, data) = make_response(self.__atx_state)
+            session.send_ipmi_response(code=code, data=data)
+        else:
+            assert self.__loop is not None
+            reply = _DeferredReply.capture(session)
+            self.__deferred_count += 1
+            asyncio.run_coroutine_threadsafe(self.__check_user(reply, name, make_response), self.__loop)
+
+    async def __check_user(
+        self,
+        reply: _DeferredReply,
+        name: str,
+        make_response: Callable[[Optional[Dict]], Tuple[int, List[int]]],
+    ) -> None:
+
+        logger = get_logger(0)
+        session = reply.session
+        ok = False
+        try:
+            credentials = self.__auth_manager.get_credentials(session.username.decode())
+            logger.info("[%s]: Performing request %s from user %r (IPMI) as %r (KVMD)",
+                        session.sockaddr[0], name, credentials.ipmi_user, credentials.kvmd_user)
+            async with self.__kvmd.make_session(credentials.kvmd_user, credentials.kvmd_passwd) as kvmd_session:
+                ok = (await kvmd_session.auth.check())
+            if ok:
+                self.__checked_users[credentials.ipmi_user] = time.monotonic() + _USER_CHECK_TTL
+            else:
+                logger.error("[%s]: Can't perform request %s: KVMD credentials of user %r (IPMI) are invalid",
+                             session.sockaddr[0], name, credentials.ipmi_user)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logger.error("[%s]: Can't perform request %s: %s", session.sockaddr[0], name, err)
+        except Exception:
+            logger.exception("[%s]: Unexpected exception while performing request %s", session.sockaddr[0], name)
+        (code, data) = make_response(self.__atx_state if ok else None)
+        self.__deferred_replies.put((reply, code, data))
 
     def __chassis_control_handler(self, request: Dict, session: IpmiServerSession) -> None:
         action = {
@@ -153,29 +286,61 @@ class IpmiServer(BaseIpmiServer):  # pylint: disable=too-many-instance-attribute
             5: "off",
         }.get(request["data"][0], "")
         if action:
-            if not self.__make_request(session, f"atx.switch_power({action})", "atx.switch_power", action=action):
-                code = 0xC0  # Try again later
-            else:
-                code = 0
+            assert self.__loop is not None
+            # Ответ будет отправлен из потока IPMI, когда KVMD выполнит запрос
+            reply = _DeferredReply.capture(session)
+            self.__deferred_count += 1
+            asyncio.run_coroutine_threadsafe(self.__switch_power(reply, action), self.__loop)
         else:
-            code = 0xCC  # Invalid request
-        session.send_ipmi_response(code=code)
+            session.send_ipmi_response(code=0xCC)  # Invalid request
 
-    def __make_request(self, session: IpmiServerSession, name: str, method_path: str, **kwargs):  # type: ignore
-        async def runner():  # type: ignore
-            logger = get_logger(0)
+    async def __switch_power(self, reply: _DeferredReply, action: str) -> None:
+        logger = get_logger(0)
+        session = reply.session
+        name = f"atx.switch_power({action})"
+        code = 0xFF
+        try:
             credentials = self.__auth_manager.get_credentials(session.username.decode())
             logger.info("[%s]: Performing request %s from user %r (IPMI) as %r (KVMD)",
                         session.sockaddr[0], name, credentials.ipmi_user, credentials.kvmd_user)
+            async with self.__kvmd.make_session(credentials.kvmd_user, credentials.kvmd_passwd) as kvmd_session:
+                if await kvmd_session.atx.switch_power(action):
+                    code = 0
+                else:
+                    code = 0xC0  # Try again later
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logger.error("[%s]: Can't perform request %s: %s", session.sockaddr[0], name, err)
+        except Exception:
+            logger.exception("[%s]: Unexpected exception while performing request %s", session.sockaddr[0], name)
+        self.__deferred_replies.put((reply, code, []))
+
+    async def __atx_watcher(self) -> None:
+        # Состояние ATX кешируется по подписке на вебсокет KVMD,
+        # чтобы запросы статуса отвечались сразу без HTTP-запроса на каждый пакет.
+        logger = get_logger(0)
+        all_credentials = self.__auth_manager.get_all_credentials()
+        if not all_credentials:
+            logger.error("No IPMI users, ATX state will be unavailable")
+            return
+        index = 0
+        while True:
+            credentials = all_credentials[index]
             try:
                 async with self.__kvmd.make_session(credentials.kvmd_user, credentials.kvmd_passwd) as kvmd_session:
-                    method = functools.reduce(getattr, method_path.split("."), kvmd_session)
-                    return (await method(**kwargs))
-            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
-                logger.error("[%s]: Can't perform request %s: %s", session.sockaddr[0], name, err)
+                    async with kvmd_session.ws(stream=False) as kvmd_ws:
+                        logger.info("Subscribed to KVMD ATX state as %r (KVMD)", credentials.kvmd_user)
+                        async for event in kvmd_ws.communicate():
+                            if event["event_type"] == "atx_state":
+                                self.__atx_state = event["event"]
+            except asyncio.CancelledError:
                 raise
-
-        return aiotools.run_sync(runner())
+            except Exception as err:
+                if isinstance(err, aiohttp.ClientResponseError) and err.status in [401, 403]:
+                    # Пробуем учетку следующего юзера
+                    index = (index + 1) % len(all_credentials)
+                logger.error("KVMD ATX state subscription error: %s", tools.efmt(err))
+            self.__atx_state = None
+            await asyncio.sleep(1)
 
     # =====
 
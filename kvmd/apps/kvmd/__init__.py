@@ -83,6 +83,13 @@ def main(argv: Optional[List[str]]=None) -> None:
             external_kwargs=(config.auth.external._unpack(ignore=["type"]) if config.auth.external.type else {}),
             force_internal_users=config.auth.internal.force_users,
             enabled=config.auth.enabled,
+            cache_ttl=config.auth.cache.ttl,
+            cache_fail_limit=config.auth.cache.fail_limit,
+            cache_fail_window=config.auth.cache.fail_window,
+            cache_fail_delay=config.auth.cache.fail_delay,
+            tokens_idle_timeout=config.auth.tokens.idle_timeout,
+            tokens_lifetime=config.auth.tokens.lifetime,
+            tokens_storage_path=config.auth.tokens.storage,
         ),
         info_manager=InfoManager(global_config),
         log_reader=LogReader(),
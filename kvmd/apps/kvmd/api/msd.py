@@ -37,12 +37,15 @@ from ....logging import get_logger
 from .... import htclient
 
 from ....plugins.msd import BaseMsd
+from ....plugins.msd.decompressor import split_image_compression
 
 from ....validators.basic import valid_bool
+from ....validators.basic import valid_number
 from ....validators.basic import valid_int_f0
 from ....validators.basic import valid_float_f01
 from ....validators.net import valid_url
 from ....validators.kvm import valid_msd_image_name
+from ....validators.kvm import valid_msd_image_sha256
 
 from ..http import exposed_http
 from ..http import make_json_response
@@ -87,9 +90,11 @@ class MsdApi:
     async def __write_handler(self, request: Request) -> Response:
         name = valid_msd_image_name(request.query.get("image"))
         size = valid_int_f0(request.content_length)
+        sha256 = self.__get_sha256_param(request)
+        (name, compression) = split_image_compression(name)
 
         written = 0
-        async with self.__msd.write_image(name, size) as chunk_size:
+        async with self.__msd.write_image(name, size, sha256, compression) as chunk_size:
             while True:
                 chunk = await request.content.read(chunk_size)
                 if not chunk:
@@ -103,6 +108,9 @@ class MsdApi:
         url = valid_url(request.query.get("url"))
         insecure = valid_bool(request.query.get("insecure", "0"))
         timeout = valid_float_f01(request.query.get("timeout", 10.0))
+        retries = int(valid_number(request.query.get("retries", 5), min=0, max=1000, name="retries"))
+        streams = int(valid_number(request.query.get("streams", 1), min=1, max=8, name="streams"))
+        sha256 = self.__get_sha256_param(request)
 
         name = ""
         size = written = 0
@@ -118,21 +126,24 @@ class MsdApi:
                 verify=(not insecure),
                 timeout=timeout,
                 read_timeout=(7 * 24 * 3600),
+                retries=retries,
+                streams=streams,
             ) as remote:
 
                 name = str(request.query.get("image", "")).strip()
                 if len(name) == 0:
-                    name = htclient.get_filename(remote)
+                    name = htclient.get_filename(remote.get_response())
                 name = valid_msd_image_name(name)
+                (name, compression) = split_image_compression(name)
 
-                size = valid_int_f0(remote.content_length)
+                size = valid_int_f0(remote.get_response().content_length)
 
                 get_logger(0).info("Downloading image %r as %r to MSD ...", url, name)
-                async with self.__msd.write_image(name, size) as chunk_size:
+                async with self.__msd.write_image(name, size, sha256, compression) as chunk_size:
                     response = await start_streaming(request)
                     await stream_write_info()
                     last_report_ts = 0
-                    async for chunk in remote.content.iter_chunked(chunk_size):
+                    async for chunk in remote.iter_chunked(chunk_size):
                         written = await self.__msd.write_image_chunk(chunk)
                         now = int(time.time())
                         if last_report_ts + 1 < now:
@@ -150,6 +161,11 @@ class MsdApi:
                 return make_json_exception(err, 400)
             raise
 
+    def __get_sha256_param(self, request: Request) -> str:
+        # Если передан ожидаемый хеш, то при несовпадении загруженный образ будет отвергнут
+        sha256 = str(request.query.get("sha256", "")).strip()
+        return (valid_msd_image_sha256(sha256) if sha256 else "")
+
     def __make_write_info(self, name: str, size: int, written: int) -> Dict:
         return {"image": {"name": name, "size": size, "written": written}}
 
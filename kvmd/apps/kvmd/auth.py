@@ -20,10 +20,21 @@
 # ========================================================================== #
 
 
+import os
+import asyncio
 import secrets
+import hashlib
+import dataclasses
+import tempfile
+import contextlib
+import json
+import time
 
 from typing import List
 from typing import Dict
+from typing import Set
+from typing import Tuple
+from typing import AsyncGenerator
 from typing import Optional
 
 from ...logging import get_logger
@@ -35,8 +46,225 @@ from ... import aiotools
 
 
 # =====
+@dataclasses.dataclass(frozen=True)
+class _CachedAuth:
+    ok: bool
+    revision: str
+    expire_ts: float
+
+
+class _AuthCache:
+    # Кеш результатов проверки паролей для X-KVMD-User и Basic auth.
+    # Пароли не хранятся: ключ - соленый дайджест пары user+passwd.
+
+    __MAX_ENTRIES = 1024
+
+    def __init__(self, ttl: float, fail_limit: int, fail_window: float, fail_delay: float) -> None:
+        self.__ttl = ttl
+        self.__fail_limit = fail_limit
+        self.__fail_window = fail_window
+        self.__fail_delay = fail_delay
+
+        self.__salt = secrets.token_bytes(16)
+        self.__entries: Dict[bytes, _CachedAuth] = {}
+        self.__fails: Dict[str, List[float]] = {}  # {user: [ts, ...]}
+
+    def get(self, user: str, passwd: str, revision: str) -> Optional[bool]:
+        if self.__ttl <= 0:
+            return None
+        key = self.__make_key(user, passwd)
+        cached = self.__entries.get(key)
+        if cached is not None:
+            if cached.revision == revision and cached.expire_ts > time.monotonic():
+                return cached.ok
+            self.__entries.pop(key)
+        return None
+
+    def put(self, user: str, passwd: str, revision: str, ok: bool) -> None:
+        if ok:
+            self.__fails.pop(user, None)
+        elif self.__fail_limit > 0:
+            self.__put_fail(user)
+
+        if self.__ttl > 0:
+            now_ts = time.monotonic()
+            if len(self.__entries) >= self.__MAX_ENTRIES:
+                self.__entries = {
+                    key: cached
+                    for (key, cached) in self.__entries.items()
+                    if cached.revision == revision and cached.expire_ts > now_ts
+                }
+                if len(self.__entries) >= self.__MAX_ENTRIES:
+                    self.__entries.clear()
+            self.__entries[self.__make_key(user, passwd)] = _CachedAuth(ok, revision, now_ts + self.__ttl)
+
+    def get_fail_delay(self, user: str) -> float:
+        # Перебор паролей не отклоняется, а только замедляется: иначе любой клиент
+        # мог бы заблокировать вход настоящему владельцу аккаунта.
+        if self.__fail_limit <= 0 or self.__fail_delay <= 0:
+            return 0.0
+        fails = self.__fails.get(user)
+        if not fails:
+            return 0.0
+        min_ts = time.monotonic() - self.__fail_window
+        fails[:] = [ts for ts in fails if ts > min_ts]
+        if not fails:
+            self.__fails.pop(user)
+            return 0.0
+        return (self.__fail_delay if len(fails) >= self.__fail_limit else 0.0)
+
+    def __put_fail(self, user: str) -> None:
+        # Юзернеймы приходят от клиента, поэтому словарь ограничен так же, как и кеш:
+        # сначала выкидываются истекшие окна, затем самые давние из остальных.
+        now_ts = time.monotonic()
+        min_ts = now_ts - self.__fail_window
+        fails = [ts for ts in self.__fails.pop(user, []) if ts > min_ts]
+        fails.append(now_ts)
+        if len(self.__fails) >= self.__MAX_ENTRIES:
+            self.__fails = {
+                other: other_fails
+                for (other, other_fails) in self.__fails.items()
+                if other_fails[-1] > min_ts
+            }
+            while len(self.__fails) >= self.__MAX_ENTRIES:
+                self.__fails.pop(next(iter(self.__fails)))
+        self.__fails[user] = fails[-self.__fail_limit:]  # В конец словаря, как самый свежий
+
+    def __make_key(self, user: str, passwd: str) -> bytes:
+        return hashlib.blake2b(f"{user}\0{passwd}".encode("utf-8"), key=self.__salt).digest()
+
+
+@dataclasses.dataclass
+class _Session:
+    user: str
+    token: str  # Empty for sessions restored from the storage: it keeps only digests
+    create_ts: float
+    access_ts: float
+
+
+class _SessionStore:
+    # Сессии индексируются по дайджесту токена (token -> session) и по юзеру (user -> tokens).
+    # На диск пишутся только дайджесты, так что утечка файла не дает готовых токенов.
+
+    def __init__(self, idle_timeout: float, lifetime: float, storage_path: str) -> None:
+        self.__idle_timeout = idle_timeout
+        self.__lifetime = lifetime
+        self.__storage_path = storage_path
+
+        self.__sessions: Dict[bytes, _Session] = {}
+        self.__user_digests: Dict[str, Set[bytes]] = {}
+        self.__dirty = False
+
+        if storage_path:
+            self.__load()
+
+    def create(self, user: str) -> str:
+        for digest in self.__user_digests.get(user, set()):
+            session = self.__sessions[digest]
+            if session.token and self.__is_alive(session, time.time()):
+                return session.token
+        token = secrets.token_hex(32)
+        now_ts = time.time()
+        self.__add(self.__make_digest(token), _Session(user, token, now_ts, now_ts))
+        return token
+
+    def remove(self, token: str) -> str:
+        session = self.__remove(self.__make_digest(token))
+        return (session.user if session else "")
+
+    def get_user(self, token: str) -> Optional[str]:
+        digest = self.__make_digest(token)
+        session = self.__sessions.get(digest)
+        if session is None:
+            return None
+        now_ts = time.time()
+        if not self.__is_alive(session, now_ts):
+            self.__remove(digest)
+            return None
+        if self.__idle_timeout > 0:
+            session.access_ts = now_ts
+            self.__dirty = True
+        return session.user
+
+    def expire(self) -> None:
+        now_ts = time.time()
+        for (digest, session) in list(self.__sessions.items()):
+            if not self.__is_alive(session, now_ts):
+                get_logger().info("Session of user %r has expired", session.user)
+                self.__remove(digest)
+
+    def save(self) -> None:
+        if self.__storage_path and self.__dirty:
+            self.__dirty = False
+            try:
+                self.__save()
+            except Exception:
+                get_logger().exception("Can't save auth sessions to %s", self.__storage_path)
+
+    # =====
+
+    def __is_alive(self, session: _Session, now_ts: float) -> bool:
+        return (
+            (self.__lifetime <= 0 or session.create_ts + self.__lifetime > now_ts)
+            and (self.__idle_timeout <= 0 or session.access_ts + self.__idle_timeout > now_ts)
+        )
+
+    def __add(self, digest: bytes, session: _Session) -> None:
+        self.__sessions[digest] = session
+        self.__user_digests.setdefault(session.user, set()).add(digest)
+        self.__dirty = True
+
+    def __remove(self, digest: bytes) -> Optional[_Session]:
+        session = self.__sessions.pop(digest, None)
+        if session is not None:
+            digests = self.__user_digests[session.user]
+            digests.discard(digest)
+            if not digests:
+                self.__user_digests.pop(session.user)
+            self.__dirty = True
+        return session
+
+    def __make_digest(self, token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def __load(self) -> None:
+        logger = get_logger()
+        now_ts = time.time()
+        try:
+            with open(self.__storage_path) as storage_file:
+                for (digest_hex, user, create_ts, access_ts) in json.load(storage_file):
+                    session = _Session(user, "", create_ts, access_ts)
+                    if self.__is_alive(session, now_ts):
+                        self.__add(bytes.fromhex(digest_hex), session)
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.exception("Can't load auth sessions from %s", self.__storage_path)
+            return
+        finally:
+            self.__dirty = False
+        logger.info("Restored %d auth sessions from %s", len(self.__sessions), self.__storage_path)
+
+    def __save(self) -> None:
+        records = [
+            [digest.hex(), session.user, round(session.create_ts), round(session.access_ts)]
+            for (digest, session) in self.__sessions.items()
+        ]
+        (tmp_fd, tmp_path) = tempfile.mkstemp(
+            prefix=f".{os.path.basename(self.__storage_path)}.",
+            dir=os.path.dirname(self.__storage_path),
+        )
+        try:
+            with os.fdopen(tmp_fd, "w") as tmp_file:
+                json.dump(records, tmp_file, separators=(",", ":"))
+            os.rename(tmp_path, self.__storage_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
 class AuthManager:
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
 
         internal_type: str,
@@ -47,6 +275,15 @@ class AuthManager:
 
         force_internal_users: List[str],
         enabled: bool,
+
+        cache_ttl: float,
+        cache_fail_limit: int,
+        cache_fail_window: float,
+        cache_fail_delay: float,
+
+        tokens_idle_timeout: float,
+        tokens_lifetime: float,
+        tokens_storage_path: str,
     ) -> None:
 
         self.__enabled = enabled
@@ -65,7 +302,10 @@ class AuthManager:
 
         self.__force_internal_users = force_internal_users
 
-        self.__tokens: Dict[str, str] = {}  # {token: user}
+        self.__cache = _AuthCache(cache_ttl, cache_fail_limit, cache_fail_window, cache_fail_delay)
+        self.__user_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}  # {user: (lock, waiters)}
+
+        self.__sessions = _SessionStore(tokens_idle_timeout, tokens_lifetime, (tokens_storage_path if enabled else ""))
 
     def is_auth_enabled(self) -> bool:
         return self.__enabled
@@ -81,23 +321,46 @@ class AuthManager:
         else:
             service = self.__internal_service
 
-        ok = (await service.authorize(user, passwd))
+        revision = service.get_revision()
+        cached = self.__cache.get(user, passwd, revision)
+        if cached is not None:
+            return cached
+
+        # Непроверенные пароли одного юзера проверяются строго по очереди,
+        # так что параллельные запросы не обходят задержку после неудачных попыток.
+        async with self.__lock_user(user):
+            delay = self.__cache.get_fail_delay(user)
+            if delay > 0:
+                get_logger().error("Too many failed attempts for user %r, delaying the check for %.1f sec", user, delay)
+                await asyncio.sleep(delay)
+            ok = (await service.authorize(user, passwd))
+            self.__cache.put(user, passwd, revision, ok)
         if ok:
             get_logger().info("Authorized user %r via auth service %r", user, service.get_plugin_name())
         else:
             get_logger().error("Got access denied for user %r from auth service %r", user, service.get_plugin_name())
         return ok
 
+    @contextlib.asynccontextmanager
+    async def __lock_user(self, user: str) -> AsyncGenerator[None, None]:
+        (lock, waiters) = self.__user_locks.get(user, (asyncio.Lock(), 0))
+        self.__user_locks[user] = (lock, waiters + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            (lock, waiters) = self.__user_locks[user]
+            if waiters > 1:
+                self.__user_locks[user] = (lock, waiters - 1)
+            else:
+                self.__user_locks.pop(user)
+
     async def login(self, user: str, passwd: str) -> Optional[str]:
         assert user == user.strip()
         assert user
         assert self.__enabled
         if (await self.authorize(user, passwd)):
-            for (token, token_user) in self.__tokens.items():
-                if user == token_user:
-                    return token
-            token = secrets.token_hex(32)
-            self.__tokens[token] = user
+            token = self.__sessions.create(user)
             get_logger().info("Logged in user %r", user)
             return token
         else:
@@ -105,17 +368,25 @@ class AuthManager:
 
     def logout(self, token: str) -> None:
         assert self.__enabled
-        user = self.__tokens.pop(token, "")
+        user = self.__sessions.remove(token)
         if user:
             get_logger().info("Logged out user %r", user)
 
     def check(self, token: str) -> Optional[str]:
         assert self.__enabled
-        return self.__tokens.get(token)
+        return self.__sessions.get_user(token)
+
+    async def systask(self) -> None:
+        if self.__enabled:
+            while True:
+                self.__sessions.expire()
+                self.__sessions.save()
+                await asyncio.sleep(10)
 
     @aiotools.atomic
     async def cleanup(self) -> None:
         if self.__enabled:
+            self.__sessions.save()
             assert self.__internal_service
             await self.__internal_service.cleanup()
             if self.__external_service:
@@ -60,6 +60,7 @@ from ...validators.kvm import valid_stream_resolution
 from ...validators.kvm import valid_stream_h264_bitrate
 from ...validators.kvm import valid_stream_h264_gop
 
+from ... import tools
 from ... import aiotools
 from ... import aioproc
 
@@ -137,9 +138,19 @@ class _Component:  # pylint: disable=too-many-instance-attributes
 class _WsClient:
     ws: aiohttp.web.WebSocketResponse
     stream: bool
+    deltas: bool
+
+    # Event types for which the client has received the last broadcasted full state
+    # and therefore can apply the next merge patch. Used only in the deltas mode.
+    synced: Set[str] = dataclasses.field(default_factory=set, compare=False)
+
+    # Serialized events waiting for the sender, one per event type. A newer event replaces
+    # the pending one, so the queue is bounded and a slow client just skips intermediate states.
+    pending: Dict[str, str] = dataclasses.field(default_factory=dict, compare=False)
+    pending_event: asyncio.Event = dataclasses.field(default_factory=asyncio.Event, compare=False)
 
     def __str__(self) -> str:
-        return f"WsClient(id={id(self)}, stream={self.stream})"
+        return f"WsClient(id={id(self)}, stream={self.stream}, deltas={self.deltas})"
 
 
 class KvmdServer(HttpServer):  # pylint: disable=too-many-arguments,too-many-instance-attributes
@@ -259,22 +270,24 @@ class KvmdServer(HttpServer):  # pylint: disable=too-many-arguments,too-many-ins
         client = _WsClient(
             ws=aiohttp.web.WebSocketResponse(heartbeat=self.__heartbeat),
             stream=valid_bool(request.query.get("stream", "true")),
+            deltas=valid_bool(request.query.get("deltas", "false")),
         )
         await client.ws.prepare(request)
         await self.__register_ws_client(client)
+        sender_task = asyncio.create_task(self.__ws_sender(client))
 
         try:
-            await self.__send_events_aws(client.ws, [
+            await self.__send_events_aws(client, [
                 ("gpio_model_state", self.__user_gpio.get_model()),
                 ("hid_keymaps_state", self.__hid_api.get_keymaps()),
                 ("streamer_ocr_state", self.__streamer_api.get_ocr()),
             ])
-            await self.__send_events_aws(client.ws, [
+            await self.__send_events_aws(client, [
                 (comp.event_type, comp.get_state())
                 for comp in self.__components
                 if comp.get_state
             ])
-            await self.__send_event(client.ws, "loop", {})
+            self.__send_event(client, "loop", {})
 
             async for msg in client.ws:
                 if msg.type == aiohttp.web.WSMsgType.TEXT:
@@ -295,11 +308,32 @@ class KvmdServer(HttpServer):  # pylint: disable=too-many-arguments,too-many-ins
 
             return client.ws
         finally:
+            sender_task.cancel()
+            await asyncio.gather(sender_task, return_exceptions=True)
             await self.__remove_ws_client(client)
 
     @exposed_ws("ping")
     async def __ws_ping_handler(self, ws: aiohttp.web.WebSocketResponse, _: Dict) -> None:
-        await self.__send_event(ws, "pong", {})
+        await ws.send_str(self.__make_event_json("pong", {}))
+
+    async def __ws_sender(self, client: _WsClient) -> None:
+        try:
+            while True:
+                await client.pending_event.wait()
+                client.pending_event.clear()
+                while client.pending:
+                    event_type = next(iter(client.pending))
+                    await client.ws.send_str(client.pending.pop(event_type))
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            get_logger(0).error("Can't send event to %s: %s; closing it ...", client, tools.efmt(err))
+            # Без сендера клиент больше не получит ни одного события, так что закрываем сокет,
+            # чтобы хендлер вышел из цикла чтения и удалил клиента, а тот переподключился.
+            try:
+                await client.ws.close()
+            except Exception:
+                pass
 
     # ===== SYSTEM STUFF
 
@@ -391,32 +425,53 @@ class KvmdServer(HttpServer):  # pylint: disable=too-many-arguments,too-many-ins
                     logger.exception("Cleanup error on %s", comp.name)
         logger.info("On-Cleanup complete")
 
-    async def __send_events_aws(self, ws: aiohttp.web.WebSocketResponse, sources: List[Tuple[str, Awaitable]]) -> None:
-        await asyncio.gather(*[
-            self.__send_event(ws, event_type, state)
-            for (event_type, state) in zip(
-                map(operator.itemgetter(0), sources),
-                await asyncio.gather(*map(operator.itemgetter(1), sources)),
-            )
-        ])
-
-    async def __send_event(self, ws: aiohttp.web.WebSocketResponse, event_type: str, event: Optional[Dict]) -> None:
-        await ws.send_str(json.dumps({
+    async def __send_events_aws(self, client: _WsClient, sources: List[Tuple[str, Awaitable]]) -> None:
+        for (event_type, state) in zip(
+            map(operator.itemgetter(0), sources),
+            await asyncio.gather(*map(operator.itemgetter(1), sources)),
+        ):
+            self.__send_event(client, event_type, state)
+
+    def __send_event(self, client: _WsClient, event_type: str, event: Optional[Dict]) -> None:
+        # Это состояние могло оказаться старше уже разосланного, поэтому
+        # следующий бродкаст для этого клиента должен быть полным.
+        client.synced.discard(event_type)
+        self.__queue_event(client, event_type, self.__make_event_json(event_type, event))
+
+    def __queue_event(self, client: _WsClient, event_type: str, data: str) -> None:
+        client.pending[event_type] = data
+        client.pending_event.set()
+
+    def __make_event_json(self, event_type: str, event: Optional[Dict], delta: bool=False) -> str:
+        return json.dumps({
             "event_type": event_type,
             "event": event,
-        }))
+            **({"delta": True} if delta else {}),
+        })
 
-    async def __broadcast_event(self, event_type: str, event: Optional[Dict]) -> None:
+    def __broadcast_event(self, event_type: str, event: Optional[Dict], patch: Optional[Dict]=None) -> None:
         if self.__ws_clients:
-            await asyncio.gather(*[
-                self.__send_event(client.ws, event_type, event)
-                for client in list(self.__ws_clients)
+            # Сериализуем один раз для всех клиентов. Отправкой занимаются сендеры клиентов,
+            # так что медленный клиент не тормозит остальных.
+            full = self.__make_event_json(event_type, event)
+            delta = (self.__make_event_json(event_type, patch, delta=True) if patch is not None else "")
+            for client in list(self.__ws_clients):
                 if (
                     not client.ws.closed
                     and client.ws._req is not None  # pylint: disable=protected-access
                     and client.ws._req.transport is not None  # pylint: disable=protected-access
-                )
-            ], return_exceptions=True)
+                ):
+                    if (
+                        client.deltas
+                        and delta
+                        and event_type in client.synced
+                        and event_type not in client.pending  # Два патча нельзя схлопнуть в один
+                    ):
+                        self.__queue_event(client, event_type, delta)
+                    else:
+                        if client.deltas:
+                            client.synced.add(event_type)
+                        self.__queue_event(client, event_type, full)
 
     async def __register_ws_client(self, client: _WsClient) -> None:
         async with self.__ws_clients_lock:
@@ -463,8 +518,11 @@ class KvmdServer(HttpServer):  # pylint: disable=too-many-arguments,too-many-ins
             await self.__streamer_notifier.wait()
 
     async def __poll_state(self, event_type: str, poller: AsyncGenerator[Dict, None]) -> None:
+        prev: Optional[Dict] = None
         async for state in poller:
-            await self.__broadcast_event(event_type, state)
+            patch = (tools.make_merge_patch(prev, state) if prev is not None else None)
+            self.__broadcast_event(event_type, state, patch)
+            prev = state
 
     async def __stream_snapshoter(self) -> None:
         await self.__snapshoter.run(
@@ -192,6 +192,7 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
         self.__http_session: Optional[aiohttp.ClientSession] = None
 
         self.__snapshot: Optional[StreamerSnapshot] = None
+        self.__local_version = 0  # Меняется вместе с параметрами и снапшотом, см. poll_state()
 
         self.__notifier = aiotools.AioNotifier()
 
@@ -258,6 +259,7 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
 
     def set_params(self, params: Dict) -> None:
         assert not self.__streamer_task
+        self.__local_version += 1
         return self.__params.set_params(params)
 
     def get_params(self) -> Dict:
@@ -266,31 +268,7 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
     # =====
 
     async def get_state(self) -> Dict:
-        streamer_state = None
-        if self.__streamer_task:
-            session = self.__ensure_http_session()
-            try:
-                async with session.get(self.__make_url("state")) as response:
-                    htclient.raise_not_200(response)
-                    streamer_state = (await response.json())["result"]
-            except (aiohttp.ClientConnectionError, aiohttp.ServerConnectionError):
-                pass
-            except Exception:
-                get_logger().exception("Invalid streamer response from /state")
-
-        snapshot: Optional[Dict] = None
-        if self.__snapshot:
-            snapshot = dataclasses.asdict(self.__snapshot)
-            del snapshot["headers"]
-            del snapshot["data"]
-
-        return {
-            "limits": self.__params.get_limits(),
-            "params": self.__params.get_params(),
-            "snapshot": {"saved": snapshot},
-            "streamer": streamer_state,
-            "features": self.__params.get_features(),
-        }
+        return {**self.__make_local_state(), "streamer": (await self.__get_streamer_state())}
 
     async def poll_state(self) -> AsyncGenerator[Dict, None]:
         def signal_handler(*_: Any) -> None:
@@ -302,8 +280,16 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
 
         waiter_task: Optional[asyncio.Task] = None
         prev_state: Dict = {}
+        prev_version = -1
+        local_state: Dict = {}
         while True:
-            state = await self.get_state()
+            # Локальная часть состояния пересобирается только при смене версии,
+            # а стример по-прежнему опрашивается каждый тик: пушей у него нет.
+            streamer_state = await self.__get_streamer_state()
+            if self.__local_version != prev_version:
+                prev_version = self.__local_version
+                local_state = self.__make_local_state()
+            state = {**local_state, "streamer": streamer_state}
             if state != prev_state:
                 yield state
                 prev_state = state
@@ -346,6 +332,7 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
                         )
                         if save:
                             self.__snapshot = snapshot
+                            self.__local_version += 1
                             await self.__notifier.notify()
                         return snapshot
                     logger.error("Stream is offline, no signal or so")
@@ -357,6 +344,7 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
 
     def remove_snapshot(self) -> None:
         self.__snapshot = None
+        self.__local_version += 1
 
     # =====
 
@@ -384,6 +372,33 @@ class Streamer:  # pylint: disable=too-many-instance-attributes
         assert not handle.startswith("/"), handle
         return f"http://{self.__host}:{self.__port}/{handle}"
 
+    async def __get_streamer_state(self) -> Optional[Dict]:
+        if self.__streamer_task:
+            session = self.__ensure_http_session()
+            try:
+                async with session.get(self.__make_url("state")) as response:
+                    htclient.raise_not_200(response)
+                    return (await response.json())["result"]
+            except (aiohttp.ClientConnectionError, aiohttp.ServerConnectionError):
+                pass
+            except Exception:
+                get_logger().exception("Invalid streamer response from /state")
+        return None
+
+    def __make_local_state(self) -> Dict:
+        snapshot: Optional[Dict] = None
+        if self.__snapshot:
+            snapshot = dataclasses.asdict(self.__snapshot)
+            del snapshot["headers"]
+            del snapshot["data"]
+
+        return {
+            "limits": self.__params.get_limits(),
+            "params": self.__params.get_params(),
+            "snapshot": {"saved": snapshot},
+            "features": self.__params.get_features(),
+        }
+
     # =====
 
     @aiotools.atomic
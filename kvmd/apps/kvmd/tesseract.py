@@ -20,10 +20,13 @@
 # ========================================================================== #
 
 
+import os
 import io
 import ctypes
 import ctypes.util
 import contextlib
+import threading
+import collections
 import warnings
 
 from ctypes import POINTER
@@ -34,6 +37,7 @@ from ctypes import c_char_p
 from ctypes import c_void_p
 from ctypes import c_char
 
+from typing import Tuple
 from typing import List
 from typing import Set
 from typing import Generator
@@ -65,8 +69,12 @@ def _load_libtesseract() -> Optional[ctypes.CDLL]:
         lib = ctypes.CDLL(path)
         for (name, restype, argtypes) in [
             ("TessBaseAPICreate", POINTER(_TessBaseAPI), []),
+            ("TessBaseAPIDelete", None, [POINTER(_TessBaseAPI)]),
             ("TessBaseAPIInit3", c_int, [POINTER(_TessBaseAPI), c_char_p, c_char_p]),
+            ("TessBaseAPIClear", None, [POINTER(_TessBaseAPI)]),
+            ("TessBaseAPIGetDatapath", c_char_p, [POINTER(_TessBaseAPI)]),
             ("TessBaseAPISetImage", None, [POINTER(_TessBaseAPI), c_void_p, c_int, c_int, c_int, c_int]),
+            ("TessBaseAPISetRectangle", None, [POINTER(_TessBaseAPI), c_int, c_int, c_int, c_int]),
             ("TessBaseAPIGetUTF8Text", POINTER(c_char), [POINTER(_TessBaseAPI)]),
             ("TessBaseAPISetVariable", c_bool, [POINTER(_TessBaseAPI), c_char_p, c_char_p]),
             ("TessBaseAPIGetAvailableLanguagesAsVector", POINTER(POINTER(c_char)), [POINTER(_TessBaseAPI)]),
@@ -85,8 +93,7 @@ def _load_libtesseract() -> Optional[ctypes.CDLL]:
 _libtess = _load_libtesseract()
 
 
-@contextlib.contextmanager
-def _tess_api(langs: List[str]) -> Generator[_TessBaseAPI, None, None]:
+def _tess_api_create(langs: Tuple[str, ...]) -> _TessBaseAPI:
     if not _libtess:
         raise OcrError("Tesseract is not available")
     api = _libtess.TessBaseAPICreate()
@@ -95,15 +102,97 @@ def _tess_api(langs: List[str]) -> Generator[_TessBaseAPI, None, None]:
             raise OcrError("Can't initialize Tesseract")
         if not _libtess.TessBaseAPISetVariable(api, b"debug_file", b"/dev/null"):
             raise OcrError("Can't set debug_file=/dev/null")
+    except:  # noqa: E722
+        _libtess.TessBaseAPIDelete(api)
+        raise
+    return api
+
+
+@contextlib.contextmanager
+def _tess_api(langs: Tuple[str, ...]) -> Generator[_TessBaseAPI, None, None]:
+    # Одноразовый движок мимо пула для редких служебных запросов
+    api = _tess_api_create(langs)
+    try:
         yield api
     finally:
+        assert _libtess
         _libtess.TessBaseAPIDelete(api)
 
 
+class _TessApiPool:
+    # Инициализация движка (загрузка моделей языков) занимает сотни миллисекунд,
+    # поэтому держим готовые движки по наборам языков. Один движок не может
+    # использоваться из нескольких потоков одновременно. Размер пула ограничивает
+    # все движки, включая занятые: если места нет, выкидывается самый старый
+    # свободный, а если свободных нет, то запрос ждет, пока какой-нибудь освободится.
+
+    def __init__(self, size: int) -> None:
+        assert size > 0
+        self.__size = size
+        self.__idle: "collections.OrderedDict[Tuple[str, ...], List[_TessBaseAPI]]" = collections.OrderedDict()
+        self.__idle_count = 0
+        self.__busy_count = 0
+        self.__cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def get(self, langs: List[str]) -> Generator[_TessBaseAPI, None, None]:
+        assert _libtess
+        key = tuple(langs)
+        (api, evicted) = self.__acquire(key)
+        if evicted is not None:
+            _libtess.TessBaseAPIDelete(evicted)
+        if api is None:
+            try:
+                api = _tess_api_create(key)
+            except:  # noqa: E722
+                self.__release(None, None)
+                raise
+        try:
+            yield api
+        finally:
+            _libtess.TessBaseAPIClear(api)
+            self.__release(key, api)
+
+    def __acquire(self, key: Tuple[str, ...]) -> Tuple[Optional[_TessBaseAPI], Optional[_TessBaseAPI]]:
+        # Возвращает готовый движок или None, если его нужно создать, и движок для удаления
+        with self.__cond:
+            while True:
+                if key in self.__idle:
+                    return (self.__pop_idle(key, -1), None)
+                if self.__idle_count + self.__busy_count < self.__size:
+                    self.__busy_count += 1
+                    return (None, None)
+                if self.__idle_count > 0:
+                    evicted = self.__pop_idle(next(iter(self.__idle)), 0)
+                    return (None, evicted)  # Слот выкинутого движка переходит новому
+                self.__cond.wait()
+
+    def __pop_idle(self, key: Tuple[str, ...], index: int) -> _TessBaseAPI:
+        apis = self.__idle[key]
+        api = apis.pop(index)
+        if len(apis) == 0:
+            del self.__idle[key]
+        self.__idle_count -= 1
+        self.__busy_count += 1
+        return api
+
+    def __release(self, key: Optional[Tuple[str, ...]], api: Optional[_TessBaseAPI]) -> None:
+        with self.__cond:
+            if key is not None and api is not None:
+                self.__idle.setdefault(key, []).append(api)
+                self.__idle.move_to_end(key)
+                self.__idle_count += 1
+            self.__busy_count -= 1
+            self.__cond.notify_all()
+
+
 # =====
 class TesseractOcr:
-    def __init__(self, default_langs: List[str]) -> None:
+    def __init__(self, default_langs: List[str], pool_size: int) -> None:
         self.__default_langs = default_langs
+        self.__pool = _TessApiPool(pool_size)
+
+        self.__langs_cache: Optional[Tuple[str, float, List[str]]] = None  # (datapath, mtime, langs)
 
     def is_available(self) -> bool:
         return bool(_libtess)
@@ -112,11 +201,22 @@ class TesseractOcr:
         return list(self.__default_langs)
 
     async def get_available_langs(self) -> List[str]:
-        return (await aiotools.run_async(self.__inner_get_available_langs))
+        if self.__langs_cache is not None:
+            (datapath, mtime, langs) = self.__langs_cache
+            try:
+                if os.stat(datapath).st_mtime == mtime:
+                    return list(langs)
+            except Exception:
+                pass
+        self.__langs_cache = await aiotools.run_async(self.__inner_get_available_langs)
+        return list(self.__langs_cache[2])
 
-    def __inner_get_available_langs(self) -> List[str]:
-        with _tess_api(["osd"]) as api:
+    def __inner_get_available_langs(self) -> Tuple[str, float, List[str]]:
+        # Список языков кешируется, так что служебный движок не занимает место в пуле
+        with _tess_api(("osd",)) as api:
             assert _libtess
+            datapath = (_libtess.TessBaseAPIGetDatapath(api) or b"").decode()
+            mtime = (os.stat(datapath).st_mtime if datapath else 0.0)
             langs: Set[str] = set()
             langs_ptr = _libtess.TessBaseAPIGetAvailableLanguagesAsVector(api)
             if langs_ptr is not None:
@@ -128,7 +228,7 @@ class TesseractOcr:
                         libc.free(langs_ptr[index])
                     index += 1
                 libc.free(langs_ptr)
-            return sorted(langs)
+            return (datapath, mtime, sorted(langs))
 
     async def recognize(self, data: bytes, langs: List[str], left: int, top: int, right: int, bottom: int) -> str:
         if not langs:
@@ -136,26 +236,29 @@ class TesseractOcr:
         return (await aiotools.run_async(self.__inner_recognize, data, langs, left, top, right, bottom))
 
     def __inner_recognize(self, data: bytes, langs: List[str], left: int, top: int, right: int, bottom: int) -> str:
-        with _tess_api(langs) as api:
+        with io.BytesIO(data) as bio:
+            with PilImage.open(bio) as image:
+                (width, height) = image.size
+                raw = (image if image.mode == "RGB" else image.convert("RGB")).tobytes("raw", "RGB")
+
+        with self.__pool.get(langs) as api:
             assert _libtess
-            with io.BytesIO(data) as bio:
-                with PilImage.open(bio) as image:
-                    if left >= 0 or top >= 0 or right >= 0 or bottom >= 0:
-                        left = (0 if left < 0 else min(image.width, left))
-                        top = (0 if top < 0 else min(image.height, top))
-                        right = (image.width if right < 0 else min(image.width, right))
-                        bottom = (image.height if bottom < 0 else min(image.height, bottom))
-                        if left < right and top < bottom:
-                            image.crop((left, top, right, bottom))
-
-                    _libtess.TessBaseAPISetImage(api, image.tobytes("raw", "RGB"), image.width, image.height, 3, image.width * 3)
-                    text_ptr = None
-                    try:
-                        text_ptr = _libtess.TessBaseAPIGetUTF8Text(api)
-                        text = ctypes.cast(text_ptr, c_char_p).value
-                        if text is None:
-                            raise OcrError("Can't recognize image")
-                        return text.decode("utf-8")
-                    finally:
-                        if text_ptr is not None:
-                            libc.free(text_ptr)
+            _libtess.TessBaseAPISetImage(api, raw, width, height, 3, width * 3)
+            if left >= 0 or top >= 0 or right >= 0 or bottom >= 0:
+                left = (0 if left < 0 else min(width, left))
+                top = (0 if top < 0 else min(height, top))
+                right = (width if right < 0 else min(width, right))
+                bottom = (height if bottom < 0 else min(height, bottom))
+                if left < right and top < bottom:
+                    _libtess.TessBaseAPISetRectangle(api, left, top, right - left, bottom - top)
+
+            text_ptr = None
+            try:
+                text_ptr = _libtess.TessBaseAPIGetUTF8Text(api)
+                text = ctypes.cast(text_ptr, c_char_p).value
+                if text is None:
+                    raise OcrError("Can't recognize image")
+                return text.decode("utf-8")
+            finally:
+                if text_ptr is not None:
+                    libc.free(text_ptr)
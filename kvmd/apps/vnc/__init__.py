@@ -79,4 +79,7 @@ def main(argv: Optional[List[str]]=None) -> None:
         vnc_auth_manager=VncAuthManager(**config.auth.vncauth._unpack()),
 
         **config.server.keepalive._unpack(),
+        **config.pacing._unpack(),
+        **config.dirty._unpack(),
+        **config.text_cache._unpack(),
     ).run()
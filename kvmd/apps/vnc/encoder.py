@@ -0,0 +1,200 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import io
+import struct
+import zlib
+
+from typing import Tuple
+from typing import List
+from typing import Callable
+from typing import Optional
+
+from PIL import Image as PilImage
+from PIL import ImageChops as PilImageChops
+
+from .rfb.encodings import RfbEncodings
+from .rfb.encodings import RfbPixelFormat
+from .rfb.encodings import rfb_make_tight_length
+
+
+# =====
+FbRect = Tuple[int, int, int, int, int, bytes]  # x, y, width, height, encoding, payload
+
+_ZRLE_TILE_SIZE = 64
+_TIGHT_PNG_STRIP = 256
+
+
+def _make_packer(fmt: RfbPixelFormat, drop_byte: Optional[int]=None) -> Callable[[PilImage.Image], bytes]:
+    # Упаковка RGB-картинки в формат пикселей клиента целиком силами Pillow, без цикла по пикселям.
+    # Для каждого байта пикселя на проводе строится плоскость: сумма LUT-преобразованных каналов,
+    # биты которых попадают в этот байт. Поля каналов не пересекаются, поэтому сумма равна OR.
+    assert fmt.true_color
+    assert fmt.bpp in [8, 16, 32]
+    count = fmt.bpp // 8
+
+    positions = [
+        index for index in range(count)
+        if index != drop_byte
+    ]
+
+    # Для типовых 32-битных форматов у Pillow есть готовые raw-режимы
+    letters = ["X"] * count
+    for (letter, cmax, shift) in [("R", fmt.r_max, fmt.r_shift), ("G", fmt.g_max, fmt.g_shift), ("B", fmt.b_max, fmt.b_shift)]:
+        if cmax == 255 and shift % 8 == 0 and shift < fmt.bpp:
+            letters[(count - 1 - shift // 8) if fmt.big_endian else (shift // 8)] = letter
+    rawmode = "".join(letters[index] for index in positions)
+    if count == 4 and sorted(rawmode.replace("X", "")) == ["B", "G", "R"]:
+        try:
+            # Некоторые режимы (RGBX) заполняют пустой байт не нулями, поэтому результат проверяется
+            probe = bytes({"R": 1, "G": 2, "B": 3, "X": 0}[letter] for letter in rawmode)
+            if PilImage.new("RGB", (1, 1), (1, 2, 3)).tobytes("raw", rawmode) == probe:
+                return (lambda image: image.tobytes("raw", rawmode))
+        except Exception:
+            pass
+
+    luts: List[List[Tuple[int, List[int]]]] = []
+    for index in positions:
+        byte_shift = 8 * ((count - 1 - index) if fmt.big_endian else index)
+        plane: List[Tuple[int, List[int]]] = []
+        for (channel, (cmax, shift)) in enumerate([(fmt.r_max, fmt.r_shift), (fmt.g_max, fmt.g_shift), (fmt.b_max, fmt.b_shift)]):
+            lut = [(((value * cmax + 127) // 255) << shift >> byte_shift) & 0xFF for value in range(256)]
+            if any(lut):
+                plane.append((channel, lut))
+        luts.append(plane)
+    mode = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}[len(positions)]
+
+    def pack(image: PilImage.Image) -> bytes:
+        channels = image.split()
+        planes: List[PilImage.Image] = []
+        for plane in luts:
+            result: Optional[PilImage.Image] = None
+            for (channel, lut) in plane:
+                part = channels[channel].point(lut)
+                result = (part if result is None else PilImageChops.add(result, part))
+            planes.append(result if result is not None else PilImage.new("L", image.size))
+        if len(planes) == 1:
+            return planes[0].tobytes()
+        return PilImage.merge(mode, planes).tobytes()
+
+    return pack
+
+
+def _get_cpixel_drop_byte(fmt: RfbPixelFormat) -> Optional[int]:
+    # CPIXEL в ZRLE: для 32-битного цвета глубиной до 24 бит, который целиком помещается
+    # в младшие или старшие три байта, лишний байт пикселя не передается
+    if fmt.bpp != 32 or fmt.depth > 24:
+        return None
+    mask = 0
+    for (cmax, shift) in [(fmt.r_max, fmt.r_shift), (fmt.g_max, fmt.g_shift), (fmt.b_max, fmt.b_shift)]:
+        mask |= (cmax << shift)
+    if mask & 0xFF000000 == 0:
+        return (0 if fmt.big_endian else 3)
+    if mask & 0xFF == 0:
+        return (3 if fmt.big_endian else 0)
+    return None
+
+
+class FbEncoder:
+    # Серверное кодирование прямоугольников кадра: куски Tight JPEG для грязных тайлов
+    # и кодировки для клиентов без Tight JPEG. Потоки zlib живут все соединение,
+    # как того требуют ZRLE и Zlib, поэтому энкодер у каждого клиента свой.
+
+    def __init__(self, zlib_level: int=1, png_level: int=1) -> None:
+        self.__png_level = png_level
+
+        self.__fmt: Optional[RfbPixelFormat] = None
+        self.__pack: Callable[[PilImage.Image], bytes] = (lambda _: b"")
+        self.__cpack: Callable[[PilImage.Image], bytes] = (lambda _: b"")
+
+        self.__zrle_stream = zlib.compressobj(zlib_level)
+        self.__zlib_stream = zlib.compressobj(zlib_level)
+
+    def encode(
+        self,
+        image: PilImage.Image,
+        encoding: int,
+        fmt: RfbPixelFormat,
+        rects: List[Tuple[int, int, int, int]],
+        quality: int=0,
+    ) -> List[FbRect]:
+
+        if fmt != self.__fmt:
+            self.__pack = _make_packer(fmt)
+            self.__cpack = _make_packer(fmt, _get_cpixel_drop_byte(fmt))
+            self.__fmt = fmt
+
+        encode: Callable[[PilImage.Image], bytes] = {
+            RfbEncodings.TIGHT: (lambda image: self.__encode_tight_jpeg(image, quality)),
+            RfbEncodings.RAW: self.__encode_raw,
+            RfbEncodings.ZLIB: self.__encode_zlib,
+            RfbEncodings.ZRLE: self.__encode_zrle,
+            RfbEncodings.TIGHT_PNG: self.__encode_tight_png,
+        }[encoding]
+
+        if encoding == RfbEncodings.TIGHT_PNG:
+            # Compact length в Tight ограничена 4 мегабайтами, режем большие прямоугольники на полосы
+            rects = [
+                (x, strip_y, width, min(_TIGHT_PNG_STRIP, y + height - strip_y))
+                for (x, y, width, height) in rects
+                for strip_y in range(y, y + height, _TIGHT_PNG_STRIP)
+            ]
+
+        return [
+            (x, y, width, height, encoding, encode(image.crop((x, y, x + width, y + height))))
+            for (x, y, width, height) in rects
+        ]
+
+    def __encode_tight_jpeg(self, image: PilImage.Image, quality: int) -> bytes:
+        assert quality > 0
+        with io.BytesIO() as bio:
+            image.save(bio, format="jpeg", quality=quality)
+            data = bio.getvalue()
+        return bytes([0b10011111]) + rfb_make_tight_length(len(data)) + data
+
+    def __encode_raw(self, image: PilImage.Image) -> bytes:
+        return self.__pack(image)
+
+    def __encode_zlib(self, image: PilImage.Image) -> bytes:
+        data = self.__zlib_stream.compress(self.__pack(image)) + self.__zlib_stream.flush(zlib.Z_SYNC_FLUSH)
+        return struct.pack(">L", len(data)) + data
+
+    def __encode_zrle(self, image: PilImage.Image) -> bytes:
+        (width, height) = image.size
+        chunks: List[bytes] = []
+        for y in range(0, height, _ZRLE_TILE_SIZE):
+            for x in range(0, width, _ZRLE_TILE_SIZE):
+                tile = image.crop((x, y, min(x + _ZRLE_TILE_SIZE, width), min(y + _ZRLE_TILE_SIZE, height)))
+                if tile.getcolors(1) is not None:
+                    chunks.append(b"\x01")  # Solid tile
+                    chunks.append(self.__cpack(tile.crop((0, 0, 1, 1))))
+                else:
+                    chunks.append(b"\x00")  # Raw CPIXELs
+                    chunks.append(self.__cpack(tile))
+        data = self.__zrle_stream.compress(b"".join(chunks)) + self.__zrle_stream.flush(zlib.Z_SYNC_FLUSH)
+        return struct.pack(">L", len(data)) + data
+
+    def __encode_tight_png(self, image: PilImage.Image) -> bytes:
+        with io.BytesIO() as bio:
+            image.save(bio, format="png", compress_level=self.__png_level)
+            data = bio.getvalue()
+        return bytes([0b10100000]) + rfb_make_tight_length(len(data)) + data
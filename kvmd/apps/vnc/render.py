@@ -23,22 +23,75 @@
 import sys
 import os
 import io
+import asyncio
+import collections
 import functools
 
+from typing import Tuple
+from typing import List
+from typing import Dict
+
 from PIL import Image as PilImage
 from PIL import ImageDraw as PilImageDraw
 from PIL import ImageFont as PilImageFont
 
+from ...logging import get_logger
+
 from ... import aiotools
 
 
 # =====
-async def make_text_jpeg(width: int, height: int, quality: int, text: str) -> bytes:
-    return (await aiotools.run_async(_inner_make_text_jpeg, width, height, quality, text))
+_TextKey = Tuple[int, int, int, str]  # width, height, quality, text
+
+
+class TextJpegCache:
+    # Общий на все клиенты кеш кадров-заглушек ("No signal" и т.п.). Пока хост перезагружается,
+    # такие кадры нужны каждому клиенту на каждый кадр стримера, поэтому повторно они не рисуются,
+    # а одинаковые запросы от разных клиентов ждут одну и ту же отрисовку.
+    # Размер ограничен в байтах, вытесняются давно не использованные кадры.
+
+    def __init__(self, max_size: int) -> None:
+        self.__max_size = max_size
+
+        self.__frames: "collections.OrderedDict[_TextKey, bytes]" = collections.OrderedDict()
+        self.__size = 0
+        self.__renders: Dict[_TextKey, asyncio.Task] = {}
+
+    async def warm(self, resolutions: List[str], qualities: List[int], texts: List[str]) -> None:
+        for resolution in resolutions:
+            (width, height) = map(int, resolution.split("x"))
+            for quality in qualities:
+                for text in texts:
+                    await self.get(width, height, quality, text)
+        get_logger(0).info("Prerendered %d text frames, %d bytes", len(self.__frames), self.__size)
+
+    async def get(self, width: int, height: int, quality: int, text: str) -> bytes:
+        key = (width, height, quality, text)
+        data = self.__frames.get(key)
+        if data is not None:
+            self.__frames.move_to_end(key)
+            return data
+        render = self.__renders.get(key)
+        if render is None:
+            render = asyncio.create_task(self.__render(key))
+            self.__renders[key] = render
+        # Отмена одного из ждущих клиентов не должна прерывать отрисовку для остальных
+        return (await asyncio.shield(render))
+
+    async def __render(self, key: _TextKey) -> bytes:
+        try:
+            data = await aiotools.run_async(_render_text_jpeg, *key)
+        finally:
+            self.__renders.pop(key)
+        if len(data) <= self.__max_size:
+            self.__frames[key] = data
+            self.__size += len(data)
+            while self.__size > self.__max_size:
+                self.__size -= len(self.__frames.popitem(last=False)[1])
+        return data
 
 
-@functools.lru_cache(maxsize=10)
-def _inner_make_text_jpeg(width: int, height: int, quality: int, text: str) -> bytes:
+def _render_text_jpeg(width: int, height: int, quality: int, text: str) -> bytes:
     image = PilImage.new("RGB", (width, height), color=(0, 0, 0))
     draw = PilImageDraw.Draw(image)
     draw.multiline_text((20, 20), text, font=_get_font(), fill=(255, 255, 255))
@@ -27,6 +27,8 @@ import dataclasses
 from typing import Tuple
 from typing import List
 from typing import Dict
+from typing import Union
+from typing import Sequence
 from typing import Callable
 from typing import Coroutine
 
@@ -42,6 +44,8 @@ from .errors import RfbConnectionError
 
 from .encodings import RfbEncodings
 from .encodings import RfbClientEncodings
+from .encodings import RfbPixelFormat
+from .encodings import rfb_make_tight_length
 
 from .crypto import rfb_make_challenge
 from .crypto import rfb_encrypt_challenge
@@ -86,6 +90,8 @@ class RfbClient(RfbClientStream):  # pylint: disable=too-many-instance-attribute
 
         self.__rfb_version = 0
         self._encodings = RfbClientEncodings(frozenset())
+        self._pixel_format = RfbPixelFormat()
+        self._fb_tight_jpeg = False
 
         self.__reset_h264 = False
 
@@ -156,31 +162,37 @@ class RfbClient(RfbClientStream):  # pylint: disable=too-many-instance-attribute
     async def _on_set_encodings(self) -> None:
         raise NotImplementedError
 
-    async def _on_fb_update_request(self) -> None:
+    async def _on_fb_update_request(self, incremental: bool) -> None:
         raise NotImplementedError
 
     # =====
 
-    async def _send_fb_jpeg(self, data: bytes) -> None:
+    async def _send_fb_jpeg(self, data: Union[bytes, memoryview]) -> None:
         assert self._encodings.has_tight
         assert self._encodings.tight_jpeg_quality > 0
-        assert len(data) <= 4194303, len(data)
         await self._write_fb_update(self._width, self._height, RfbEncodings.TIGHT, drain=False)
-        length = len(data)
-        if length <= 127:
-            await self._write_struct("", bytes([0b10011111, length & 0x7F]), data)
-        elif length <= 16383:
-            await self._write_struct("", bytes([0b10011111, length & 0x7F | 0x80, length >> 7 & 0x7F]), data)
-        else:
-            await self._write_struct("", bytes([0b10011111, length & 0x7F | 0x80, length >> 7 & 0x7F | 0x80, length >> 14 & 0xFF]), data)
+        await self.__write_tight_jpeg(data, drain=True)
         self.__reset_h264 = True
 
-    async def _send_fb_h264(self, data: bytes) -> None:
+    async def __write_tight_jpeg(self, data: Union[bytes, memoryview], drain: bool) -> None:
+        await self._write_struct("", bytes([0b10011111]) + rfb_make_tight_length(len(data)), data, drain=drain)
+
+    async def _send_fb_rects(self, rects: Sequence[Tuple[int, int, int, int, int, Union[bytes, memoryview]]]) -> None:
+        # Прямоугольники (x, y, width, height, encoding, payload) с уже готовыми данными кодировки
+        assert 0 < len(rects) <= 0xFFFF, len(rects)
+        await self._write_fb_update_rects(len(rects))
+        for (index, (x, y, width, height, encoding, data)) in enumerate(rects):
+            await self._write_fb_rect(x, y, width, height, encoding)
+            await self._write_struct("", data, drain=(index == len(rects) - 1))
+        self.__reset_h264 = True
+
+    async def _send_fb_h264(self, data: List[Union[bytes, memoryview]], length: int) -> None:
+        # Access unit передается списком буферов, чтобы не склеивать фреймы в памяти
         assert self._encodings.has_h264
-        assert len(data) <= 0xFFFFFFFF, len(data)
+        assert length <= 0xFFFFFFFF, length
         await self._write_fb_update(self._width, self._height, RfbEncodings.H264, drain=False)
-        await self._write_struct("LL", len(data), int(self.__reset_h264), drain=False)
-        await self._write_struct("", data)
+        await self._write_struct("LL", length, int(self.__reset_h264), drain=False)
+        await self._write_struct("", *data)
         self.__reset_h264 = False
 
     async def _send_resize(self, width: int, height: int) -> None:
@@ -368,16 +380,16 @@ class RfbClient(RfbClientStream):  # pylint: disable=too-many-instance-attribute
         await self._write_struct("HH", self._width, self._height, drain=False)
         await self._write_struct(
             "BB?? HHH BBB xxx",
-            32,     # Bits per pixel
-            24,     # Depth
-            False,  # Big endian
-            True,   # True color
-            255,    # Red max
-            255,    # Green max
-            255,    # Blue max
-            16,     # Red shift
-            8,      # Green shift
-            0,      # Blue shift
+            self._pixel_format.bpp,
+            self._pixel_format.depth,
+            self._pixel_format.big_endian,
+            self._pixel_format.true_color,
+            self._pixel_format.r_max,
+            self._pixel_format.g_max,
+            self._pixel_format.b_max,
+            self._pixel_format.r_shift,
+            self._pixel_format.g_shift,
+            self._pixel_format.b_shift,
             drain=False,
         )
         await self._write_reason(self.__name)
@@ -403,10 +415,10 @@ class RfbClient(RfbClientStream):  # pylint: disable=too-many-instance-attribute
                 raise RfbError(f"Unknown message type: {msg_type}")
 
     async def __handle_set_pixel_format(self) -> None:
-        # JpegCompression may only be used when bits-per-pixel is either 16 or 32
-        bits_per_pixel = (await self._read_struct("xxx BB?? HHH BBB xxx"))[0]
-        if bits_per_pixel not in [16, 32]:
-            raise RfbError(f"Requested unsupported bits_per_pixel={bits_per_pixel} for Tight JPEG; required 16 or 32")
+        self._pixel_format = RfbPixelFormat(*(await self._read_struct("xxx BB?? HHH BBB xxx")))  # type: ignore
+        get_logger(0).info("[main] %s: Client pixel format: %s", self._remote, self._pixel_format)
+        if self._encodings.encodings:
+            self.__check_encodings()
 
     async def __handle_set_encodings(self) -> None:
         logger = get_logger(0)
@@ -419,16 +431,18 @@ class RfbClient(RfbClientStream):  # pylint: disable=too-many-instance-attribute
         logger.info("[main] %s: Client features (SetEncodings): ...", self._remote)
         for (key, value) in dataclasses.asdict(self._encodings).items():
             logger.info("[main] %s: ... %s=%s", self._remote, key, value)
-        self.__check_tight_jpeg()
+        self.__check_encodings()
 
         if self._encodings.has_ext_keys:  # Preferred method
             await self._write_fb_update(0, 0, RfbEncodings.EXT_KEYS, drain=True)
         await self._on_set_encodings()
 
     async def __handle_fb_update_request(self) -> None:
-        self.__check_tight_jpeg()  # If we don't receive SetEncodings from client
-        await self._read_struct("? HH HH")  # Ignore any arguments, just perform the full update
-        await self._on_fb_update_request()
+        self.__check_encodings()  # If we don't receive SetEncodings from client
+        # Регион игнорируем и всегда шлем изменения всего экрана, а неинкрементальный
+        # запрос означает, что клиенту нужен полный кадр
+        incremental = (await self._read_struct("? HH HH"))[0]
+        await self._on_fb_update_request(bool(incremental))
 
     async def __handle_key_event(self) -> None:
         (state, code) = await self._read_struct("? xx L")
@@ -468,8 +482,16 @@ class RfbClient(RfbClientStream):  # pylint: disable=too-many-instance-attribute
             code = (0xE0 << 8) | (code & ~0x80)
         await self._on_ext_key_event(code, bool(state))
 
-    def __check_tight_jpeg(self) -> None:
+    def __check_encodings(self) -> None:
         # JpegCompression may only be used when the client has advertized
         # a quality level using the JPEG Quality Level Pseudo-encoding
-        if not self._encodings.has_tight or self._encodings.tight_jpeg_quality == 0:
-            raise RfbError(f"Tight JPEG encoding is not supported by client: {self._encodings}")
+        # and when bits-per-pixel is either 16 or 32
+        self._fb_tight_jpeg = (
+            self._encodings.has_tight
+            and self._encodings.tight_jpeg_quality > 0
+            and self._pixel_format.bpp in [16, 32]
+        )
+        if not self._fb_tight_jpeg:
+            # Остальным шлем кадры, перекодированные на сервере в формат пикселей клиента
+            if not self._pixel_format.true_color or self._pixel_format.bpp not in [8, 16, 32]:
+                raise RfbError(f"Unsupported pixel format for non-JPEG encodings: {self._pixel_format}")
@@ -33,6 +33,11 @@ class RfbEncodings:
     LEDS_STATE = -261  # QEMU LED State Pseudo-encoding
     EXT_KEYS = -258  # QEMU Extended Key Events Pseudo-encoding
 
+    RAW = 0
+    ZLIB = 6
+    ZRLE = 16
+    TIGHT_PNG = -260
+
     TIGHT = 7
     TIGHT_JPEG_QUALITIES = dict(zip(  # JPEG Quality Level Pseudo-encoding
         [-32, -31, -30, -29, -28, -27, -26, -25, -24, -23],
@@ -56,6 +61,10 @@ class RfbClientEncodings:  # pylint: disable=too-many-instance-attributes
 
     has_h264: bool = dataclasses.field(default=False)
 
+    has_zrle: bool = dataclasses.field(default=False)
+    has_zlib: bool = dataclasses.field(default=False)
+    has_tight_png: bool = dataclasses.field(default=False)
+
     def __post_init__(self) -> None:
         self.__set("has_resize", (RfbEncodings.RESIZE in self.encodings))
         self.__set("has_rename", (RfbEncodings.RENAME in self.encodings))
@@ -67,6 +76,21 @@ class RfbClientEncodings:  # pylint: disable=too-many-instance-attributes
 
         self.__set("has_h264", (RfbEncodings.H264 in self.encodings))
 
+        self.__set("has_zrle", (RfbEncodings.ZRLE in self.encodings))
+        self.__set("has_zlib", (RfbEncodings.ZLIB in self.encodings))
+        self.__set("has_tight_png", (RfbEncodings.TIGHT_PNG in self.encodings))
+
+    def get_fallback(self) -> int:
+        # Кодировка для клиентов без Tight JPEG, Raw поддерживают все
+        for (encoding, has) in [
+            (RfbEncodings.ZRLE, self.has_zrle),
+            (RfbEncodings.TIGHT_PNG, self.has_tight_png),
+            (RfbEncodings.ZLIB, self.has_zlib),
+        ]:
+            if has:
+                return encoding
+        return RfbEncodings.RAW
+
     def __set(self, key: str, value: Any) -> None:
         object.__setattr__(self, key, value)
 
@@ -76,3 +100,27 @@ class RfbClientEncodings:  # pylint: disable=too-many-instance-attributes
             if qualities:
                 return RfbEncodings.TIGHT_JPEG_QUALITIES[max(qualities)]
         return 0
+
+
+@dataclasses.dataclass(frozen=True)
+class RfbPixelFormat:  # pylint: disable=too-many-instance-attributes
+    bpp: int = 32
+    depth: int = 24
+    big_endian: bool = False
+    true_color: bool = True
+    r_max: int = 255
+    g_max: int = 255
+    b_max: int = 255
+    r_shift: int = 16
+    g_shift: int = 8
+    b_shift: int = 0
+
+
+def rfb_make_tight_length(length: int) -> bytes:
+    # Compact length из Tight: 7 бит на байт, максимум три байта
+    assert length <= 4194303, length
+    if length <= 127:
+        return bytes([length & 0x7F])
+    elif length <= 16383:
+        return bytes([length & 0x7F | 0x80, length >> 7 & 0x7F])
+    return bytes([length & 0x7F | 0x80, length >> 7 & 0x7F | 0x80, length >> 14 & 0xFF])
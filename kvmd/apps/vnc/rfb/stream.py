@@ -23,6 +23,7 @@
 import asyncio
 import ssl
 import struct
+import fcntl
 
 from typing import Tuple
 from typing import Any
@@ -33,6 +34,9 @@ from .errors import RfbConnectionError
 
 
 # =====
+_SIOCOUTQNSD = 0x894B  # linux/sockios.h: unsent bytes in the socket send queue
+
+
 def rfb_format_remote(writer: asyncio.StreamWriter) -> str:
     return "[%s]:%d" % (writer.transport.get_extra_info("peername")[:2])
 
@@ -76,6 +80,9 @@ class RfbClientStream:
     async def _write_struct(self, fmt: str, *values: Any, drain: bool=True) -> None:
         try:
             if not fmt:
+                # Настоящего scatter/gather (sendmsg) в asyncio до Python 3.12 нет, а writelines()
+                # просто склеивает буферы. Поэтому каждый буфер отдается в write() как есть:
+                # транспорт пытается отправить его сразу и копирует только неотправленный хвост.
                 for value in values:
                     self.__writer.write(value)
             elif fmt == "B":
@@ -107,6 +114,23 @@ class RfbClientStream:
             drain=drain,
         )
 
+    async def _write_fb_update_rects(self, count: int) -> None:
+        await self._write_struct("BxH", 0, count, drain=False)  # FB update, number of rects
+
+    async def _write_fb_rect(self, x: int, y: int, width: int, height: int, encoding: int) -> None:
+        await self._write_struct("HH HH l", x, y, width, height, encoding, drain=False)
+
+    def _get_write_pending(self) -> int:
+        # Сколько байт еще не ушло в сеть: буфер транспорта плюс неотправленное в очереди сокета
+        pending = self.__writer.transport.get_write_buffer_size()
+        sock = self.__writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                pending += struct.unpack("i", fcntl.ioctl(sock.fileno(), _SIOCOUTQNSD, b"\x00" * 4))[0]
+            except Exception:
+                pass
+        return pending
+
     # =====
 
     async def _start_tls(self, ssl_context: ssl.SSLContext, ssl_timeout: float) -> None:
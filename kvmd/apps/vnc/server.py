@@ -26,10 +26,15 @@ import asyncio
 import socket
 import dataclasses
 import contextlib
+import collections
+import time
 
+from typing import Tuple
 from typing import List
 from typing import Dict
+from typing import Deque
 from typing import Union
+from typing import Coroutine
 from typing import Optional
 
 import aiohttp
@@ -56,15 +61,28 @@ from ... import aiotools
 
 from .rfb import RfbClient
 from .rfb.stream import rfb_format_remote
+from .rfb.encodings import RfbEncodings
 from .rfb.errors import RfbError
 
 from .vncauth import VncAuthKvmdCredentials
 from .vncauth import VncAuthManager
 
-from .render import make_text_jpeg
+from .render import TextJpegCache
+
+from .tiles import decode_jpeg
+from .tiles import TilesDiffer
+
+from .encoder import FbRect
+from .encoder import FbEncoder
 
 
 # =====
+_TEXT_NO_SIGNAL = "No signal"
+_TEXT_WAITING = "Waiting for stream ..."
+
+_H264_MAX_UPDATE_LENGTH = 4194304
+
+
 @dataclasses.dataclass()
 class _SharedParams:
     width: int = dataclasses.field(default=800)
@@ -72,6 +90,160 @@ class _SharedParams:
     name: str = dataclasses.field(default="PiKVM")
 
 
+class _FbQueue:
+    # Кадры под медленного клиента выкидываются только здесь: эта очередь копится, пока
+    # клиент не запросит обновление, и о выкинутом узнает пейсер. Кольцо подписчика
+    # в клиенте стримера лишь передает кадры в эту очередь и переполняется только при
+    # зависании лупа.
+    # JPEG-кадры независимы, так что их хранится не больше size, а старые выкидываются.
+    # Кадры H264 выкидывать нельзя, клиент должен получить их все, поэтому они копятся
+    # до его следующего запроса, пока их суммарный размер не превысит max_h264_length.
+    # Только тогда очередь сбрасывается, и клиент ждет следующий ключевой кадр.
+
+    def __init__(self, size: int, max_h264_length: int) -> None:
+        assert size > 0
+        self.__size = size
+        self.__max_h264_length = max_h264_length
+
+        self.__queue: Deque[Dict] = collections.deque()
+        self.__h264_length = 0
+        self.__need_key = False
+        self.__dropped = 0
+        self.__event = asyncio.Event()
+
+    def put(self, frame: Dict) -> None:
+        if frame["format"] == StreamFormats.H264:
+            if self.__h264_length + len(frame["data"]) > self.__max_h264_length:
+                # Без выкинутых P-фреймов декодер клиента сломается, ждем ключевой
+                self.__dropped += len(self.__queue)
+                self.__queue.clear()
+                self.__h264_length = 0
+                self.__need_key = True
+            if self.__need_key:
+                if not frame["key"]:
+                    self.__dropped += 1
+                    return
+                self.__need_key = False
+            self.__h264_length += len(frame["data"])
+        elif len(self.__queue) >= self.__size:
+            self.__dropped += 1
+            old = self.__queue.popleft()
+            if old["format"] == StreamFormats.H264:
+                self.__h264_length -= len(old["data"])
+        self.__queue.append(frame)
+        self.__event.set()
+
+    async def get_all(self) -> List[Dict]:
+        while len(self.__queue) == 0:
+            self.__event.clear()
+            await self.__event.wait()
+        frames = list(self.__queue)
+        self.__queue.clear()
+        self.__h264_length = 0
+        return frames
+
+    def pop_dropped(self) -> int:
+        dropped = self.__dropped
+        self.__dropped = 0
+        return dropped
+
+
+class _FbPacer:  # pylint: disable=too-many-instance-attributes
+    # Подстраивает частоту кадров и качество JPEG под канал клиента: если отправка кадра
+    # не укладывается в интервал между кадрами или в сокете копится очередь, то параметры
+    # понижаются, а при свободном канале постепенно возвращаются к исходным.
+    # Стример общий для всех клиентов, поэтому параметры применяются только к этому клиенту:
+    # кадры отправляются реже, а при включенном requality JPEG еще и перекодируется
+    # с пониженным качеством. Перекодирование - это полное декодирование и сжатие каждого
+    # кадра на каждого медленного клиента, так что по умолчанию оно выключено.
+
+    __WINDOW = 2.0
+    __UP_WINDOWS = 3
+
+    def __init__(self, enabled: bool, desired_fps: int, min_fps: int, min_quality: int, requality: bool) -> None:
+        self.__enabled = enabled
+        self.__requality = requality
+        self.__desired_fps = desired_fps
+        self.__base_fps = (desired_fps or 30)  # Ноль - это максимум стримера, считаем его за 30
+        self.__min_fps = min(min_fps, self.__base_fps)
+        self.__min_quality = min_quality
+
+        self.__max_quality = 0
+        self.__fps = self.__base_fps
+        self.__quality = 0
+
+        self.__load = 0.0
+        self.__congested = False
+        self.__window_ts = 0.0
+        self.__good_windows = 0
+        self.__last_ts = 0.0
+
+    def reset(self, quality: int) -> None:
+        self.__max_quality = quality
+        self.__fps = self.__base_fps
+        self.__quality = quality
+        self.__load = 0.0
+        self.__congested = False
+        self.__window_ts = time.monotonic()
+        self.__good_windows = 0
+
+    def get_params(self) -> Tuple[int, int]:
+        return (self.__quality, (self.__fps if self.__is_degraded() else self.__desired_fps))
+
+    def is_quality_reduced(self) -> bool:
+        return (self.__quality < self.__max_quality)
+
+    def get_delay(self) -> float:
+        if not self.__is_degraded():
+            return 0.0
+        return max(self.__last_ts + 1 / self.__fps - time.monotonic(), 0.0)
+
+    def on_sent(self, start_ts: float, length: int, pending: int, dropped: int) -> bool:
+        now = time.monotonic()
+        self.__last_ts = start_ts
+        if not self.__enabled:
+            return False
+
+        self.__load = self.__load * 0.75 + (now - start_ts) * self.__fps * 0.25
+        if dropped or pending > length:
+            self.__congested = True
+
+        if now - self.__window_ts < self.__WINDOW:
+            return False
+        self.__window_ts = now
+        congested = (self.__congested or self.__load > 1.0)
+        self.__congested = False
+
+        if congested:
+            self.__good_windows = 0
+            return self.__step(-1)
+        elif self.__load < 0.5:
+            self.__good_windows += 1
+            if self.__good_windows >= self.__UP_WINDOWS:
+                self.__good_windows = 0
+                return self.__step(1)
+        else:
+            self.__good_windows = 0
+        return False
+
+    def __step(self, direction: int) -> bool:
+        if direction < 0:
+            fps = max(self.__fps * 2 // 3, self.__min_fps)
+            quality = max(self.__quality - 10, min(self.__min_quality, self.__max_quality))
+            if not self.__requality:
+                quality = self.__quality
+        else:
+            fps = min(self.__fps + max(self.__fps // 2, 1), self.__base_fps)
+            quality = min(self.__quality + 10, self.__max_quality)
+        if (fps, quality) == (self.__fps, self.__quality):
+            return False
+        (self.__fps, self.__quality) = (fps, quality)
+        return True
+
+    def __is_degraded(self) -> bool:
+        return (self.__fps < self.__base_fps or self.__quality < self.__max_quality)
+
+
 class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
     def __init__(  # pylint: disable=too-many-arguments
         self,
@@ -83,6 +255,14 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
         x509_key_path: str,
 
         desired_fps: int,
+        pacing_enabled: bool,
+        pacing_min_fps: int,
+        pacing_min_quality: int,
+        pacing_requality: bool,
+        fb_queue_size: int,
+        dirty_enabled: bool,
+        dirty_tile_size: int,
+        dirty_threshold: int,
         keymap_name: str,
         symmap: Dict[int, Dict[int, str]],
 
@@ -92,6 +272,7 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
         vnc_credentials: Dict[str, VncAuthKvmdCredentials],
         none_auth_only: bool,
         shared_params: _SharedParams,
+        text_cache: TextJpegCache,
     ) -> None:
 
         self.__vnc_credentials = vnc_credentials
@@ -116,6 +297,7 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
         self.__streamers = streamers
 
         self.__shared_params = shared_params
+        self.__text_cache = text_cache
 
         self.__stage1_authorized = aiotools.AioStage()
         self.__stage2_encodings_accepted = aiotools.AioStage()
@@ -125,7 +307,11 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
         self.__kvmd_ws: Optional[KvmdClientWs] = None
 
         self.__fb_notifier = aiotools.AioNotifier()
-        self.__fb_queue: "asyncio.Queue[Dict]" = asyncio.Queue()
+        self.__fb_queue = _FbQueue(fb_queue_size, _H264_MAX_UPDATE_LENGTH)
+        self.__fb_pacer = _FbPacer(pacing_enabled, desired_fps, pacing_min_fps, pacing_min_quality, pacing_requality)
+        self.__fb_differ = (TilesDiffer(dirty_tile_size, dirty_threshold) if dirty_enabled else None)
+        self.__fb_encoder = FbEncoder()
+        self.__fb_full = True
 
         # Эти состояния шарить не обязательно - бекенд исключает дублирующиеся события.
         # Все это нужно только чтобы не посылать лишние жсоны в сокет KVMD
@@ -206,24 +392,24 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
                     if frame["online"]:
                         await self.__queue_frame(frame)
                     else:
-                        await self.__queue_frame("No signal")
+                        await self.__queue_frame(_TEXT_NO_SIGNAL)
             except StreamerError as err:
                 if isinstance(err, StreamerPermError):
                     streamer = self.__get_default_streamer()
                     logger.info("[streamer] %s: Permanent error: %s; switching to %s ...", self._remote, err, streamer)
                 else:
                     logger.info("[streamer] %s: Waiting for stream: %s", self._remote, err)
-                await self.__queue_frame("Waiting for stream ...")
+                await self.__queue_frame(_TEXT_WAITING)
                 await asyncio.sleep(1)
 
     def __get_preferred_streamer(self) -> BaseStreamerClient:
         formats = {
-            StreamFormats.JPEG: "has_tight",
-            StreamFormats.H264: "has_h264",
+            StreamFormats.JPEG: True,  # Без Tight JPEG кадр перекодируется на сервере
+            StreamFormats.H264: self._encodings.has_h264,
         }
         streamer: Optional[BaseStreamerClient] = None
         for streamer in self.__streamers:
-            if getattr(self._encodings, formats[streamer.get_format()]):
+            if formats[streamer.get_format()]:
                 get_logger(0).info("[streamer] %s: Using preferred %s", self._remote, streamer)
                 return streamer
         raise RuntimeError("No streamers found")
@@ -236,11 +422,11 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
     async def __queue_frame(self, frame: Union[Dict, str]) -> None:
         if isinstance(frame, str):
             frame = await self.__make_text_frame(frame)
-        self.__fb_queue.put_nowait(frame)
+        self.__fb_queue.put(frame)
 
     async def __make_text_frame(self, text: str) -> Dict:
         return {
-            "data": (await make_text_jpeg(self._width, self._height, self._encodings.tight_jpeg_quality, text)),
+            "data": (await self.__text_cache.get(self._width, self._height, (self._encodings.tight_jpeg_quality or 80), text)),
             "width": self._width,
             "height": self._height,
             "format": StreamFormats.JPEG,
@@ -252,8 +438,13 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
         while True:
             await self.__fb_notifier.wait()
 
-            while True:
-                frame = await self.__fb_queue.get()
+            # Не отправляем кадры чаще, чем позволяет канал клиента, а пока ждем,
+            # в очереди остается только самое свежее
+            delay = self.__fb_pacer.get_delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            for frame in (await self.__fb_queue.get_all()):
                 if (
                     last is None  # pylint: disable=too-many-boolean-expressions
                     or frame["format"] == StreamFormats.JPEG
@@ -262,19 +453,20 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
                         frame["key"]
                         or last["width"] != frame["width"]
                         or last["height"] != frame["height"]
-                        or len(last["data"]) + len(frame["data"]) > 4194304
+                        or last["length"] + len(frame["data"]) > _H264_MAX_UPDATE_LENGTH
                     ))
                 ):
                     has_h264_key = (frame["format"] == StreamFormats.H264 and frame["key"])
-                    last = frame
-                    if self.__fb_queue.qsize() == 0:
-                        break
+                    # Фреймы стримера общие для всех клиентов, поэтому не склеиваем их,
+                    # а копим список буферов и отправляем его в сокет как есть.
+                    last = {**frame, "data": [frame["data"]], "length": len(frame["data"])}
                     continue
                 assert frame["format"] == StreamFormats.H264
-                last["data"] += frame["data"]
-                if self.__fb_queue.qsize() == 0:
-                    break
+                last["data"].append(frame["data"])
+                last["length"] += len(frame["data"])
+            assert last is not None
 
+            paced = False
             async with self.__lock:
                 if self._width != last["width"] or self._height != last["height"]:
                     self.__shared_params.width = last["width"]
@@ -284,27 +476,69 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
                             f"Resoultion changed: {self._width}x{self._height}"
                             f" -> {last['width']}x{last['height']}\nPlease reconnect"
                         )
-                        await self._send_fb_jpeg((await self.__make_text_frame(msg))["data"])
+                        data = (await self.__make_text_frame(msg))["data"]
+                        self.__fb_full = True
+                        await self.__send_fb_jpeg(data, len(data))
                         continue
                     await self._send_resize(last["width"], last["height"])
 
-                if len(last["data"]) == 0:
+                if last["length"] == 0:
                     # Вдруг какой-то баг
                     await self.__fb_notifier.notify()
                     continue
 
                 if last["format"] == StreamFormats.JPEG:
-                    await self._send_fb_jpeg(last["data"])
+                    paced = await self.__send_fb_jpeg(last["data"][0], last["length"])
                 elif last["format"] == StreamFormats.H264:
                     if not self._encodings.has_h264:
                         raise RfbError("The client doesn't want to accept H264 anymore")
                     if has_h264_key:
-                        await self._send_fb_h264(last["data"])
+                        paced = await self.__send_fb_paced(self._send_fb_h264(last["data"], last["length"]), last["length"])
+                        self.__fb_full = True  # Следующий JPEG не с чем сравнивать
                     else:
                         await self.__fb_notifier.notify()
                 else:
                     raise RuntimeError(f"Unknown format: {last['format']}")
-                last["data"] = b""
+                last["data"] = []
+                last["length"] = 0
+
+            if paced:
+                (quality, fps) = self.__fb_pacer.get_params()
+                get_logger(0).info("[main] %s: Pacing the framebuffer: quality=%d; fps=%d", self._remote, quality, fps)
+
+    async def __send_fb_jpeg(self, data: Union[bytes, memoryview], length: int) -> bool:
+        full = self.__fb_full
+        self.__fb_full = False
+        requality = self.__fb_pacer.is_quality_reduced()
+        if not self._fb_tight_jpeg or self.__fb_differ is not None or requality:
+            rects = await aiotools.run_async(self.__encode_fb_rects, data, full, requality)
+            if rects is not None:
+                if len(rects) == 0:
+                    # На экране ничего не поменялось, отвечаем клиенту следующим фреймом
+                    await self.__fb_notifier.notify()
+                    return False
+                length = sum(len(rect[5]) for rect in rects)
+                return (await self.__send_fb_paced(self._send_fb_rects(rects), length))
+        return (await self.__send_fb_paced(self._send_fb_jpeg(data), length))
+
+    def __encode_fb_rects(self, data: Union[bytes, memoryview], full: bool, requality: bool) -> Optional[List[FbRect]]:
+        # Выполняется в экзекуторе. None - отправить исходный JPEG как есть.
+        image = decode_jpeg(data)
+        rects = (self.__fb_differ.diff(image, full) if self.__fb_differ is not None else None)
+        if self._fb_tight_jpeg:
+            if rects is None:
+                if not requality:
+                    return None
+                rects = [(0, 0, image.width, image.height)]
+            return self.__fb_encoder.encode(image, RfbEncodings.TIGHT, self._pixel_format, rects, self.__fb_pacer.get_params()[0])
+        if rects is None:
+            rects = [(0, 0, image.width, image.height)]
+        return self.__fb_encoder.encode(image, self._encodings.get_fallback(), self._pixel_format, rects)
+
+    async def __send_fb_paced(self, send: Coroutine, length: int) -> bool:
+        start_ts = time.monotonic()
+        await send
+        return self.__fb_pacer.on_sent(start_ts, length, self._get_write_pending(), self.__fb_queue.pop_dropped())
 
     # =====
 
@@ -395,13 +629,20 @@ class _Client(RfbClient):  # pylint: disable=too-many-instance-attributes
         assert self.__kvmd_session
         self.__stage2_encodings_accepted.set_passed(multi=True)
 
-        has_quality = (await self.__kvmd_session.streamer.get_state())["features"]["quality"]
+        # Качеством стримера управляем только для клиентов, получающих JPEG как есть
+        has_quality = (
+            self._fb_tight_jpeg
+            and (await self.__kvmd_session.streamer.get_state())["features"]["quality"]
+        )
         quality = (self._encodings.tight_jpeg_quality if has_quality else None)
+        self.__fb_pacer.reset(self._encodings.tight_jpeg_quality)
         get_logger(0).info("[main] %s: Applying streamer params: jpeg_quality=%s; desired_fps=%d ...",
                            self._remote, quality, self.__desired_fps)
         await self.__kvmd_session.streamer.set_params(quality, self.__desired_fps)
 
-    async def _on_fb_update_request(self) -> None:
+    async def _on_fb_update_request(self, incremental: bool) -> None:
+        if not incremental:
+            self.__fb_full = True
         await self.__fb_notifier.notify()
 
 
@@ -425,6 +666,17 @@ class VncServer:  # pylint: disable=too-many-instance-attributes
         x509_key_path: str,
 
         desired_fps: int,
+        pacing_enabled: bool,
+        pacing_min_fps: int,
+        pacing_min_quality: int,
+        pacing_requality: bool,
+        fb_queue_size: int,
+        dirty_enabled: bool,
+        dirty_tile_size: int,
+        dirty_threshold: int,
+        text_cache_max_size: int,
+        text_cache_resolutions: List[str],
+        text_cache_qualities: List[int],
         keymap_path: str,
 
         kvmd: KvmdClient,
@@ -439,9 +691,13 @@ class VncServer:  # pylint: disable=too-many-instance-attributes
         keymap_name = os.path.basename(keymap_path)
         symmap = build_symmap(keymap_path)
 
+        self.__kvmd = kvmd
         self.__vnc_auth_manager = vnc_auth_manager
 
         shared_params = _SharedParams()
+        self.__text_cache = TextJpegCache(text_cache_max_size)
+        self.__text_cache_resolutions = text_cache_resolutions
+        self.__text_cache_qualities = text_cache_qualities
 
         async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
             logger = get_logger(0)
@@ -476,6 +732,14 @@ class VncServer:  # pylint: disable=too-many-instance-attributes
                     x509_cert_path=x509_cert_path,
                     x509_key_path=x509_key_path,
                     desired_fps=desired_fps,
+                    pacing_enabled=pacing_enabled,
+                    pacing_min_fps=pacing_min_fps,
+                    pacing_min_quality=pacing_min_quality,
+                    pacing_requality=pacing_requality,
+                    fb_queue_size=fb_queue_size,
+                    dirty_enabled=dirty_enabled,
+                    dirty_tile_size=dirty_tile_size,
+                    dirty_threshold=dirty_threshold,
                     keymap_name=keymap_name,
                     symmap=symmap,
                     kvmd=kvmd,
@@ -483,6 +747,7 @@ class VncServer:  # pylint: disable=too-many-instance-attributes
                     vnc_credentials=(await self.__vnc_auth_manager.read_credentials())[0],
                     none_auth_only=none_auth_only,
                     shared_params=shared_params,
+                    text_cache=self.__text_cache,
                 ).run()
             except Exception:
                 logger.exception("[entry] %s: Unhandled exception in client task", remote)
@@ -499,6 +764,12 @@ class VncServer:  # pylint: disable=too-many-instance-attributes
             if not loop.run_until_complete(self.__vnc_auth_manager.read_credentials())[1]:
                 raise SystemExit(1)
 
+            loop.run_until_complete(self.__text_cache.warm(
+                resolutions=self.__text_cache_resolutions,
+                qualities=self.__text_cache_qualities,
+                texts=[_TEXT_NO_SIGNAL, _TEXT_WAITING],
+            ))
+
             logger.info("Listening VNC on TCP [%s]:%d ...", self.__host, self.__port)
 
             (family, _, _, _, addr) = socket.getaddrinfo(self.__host, self.__port, type=socket.SOCK_STREAM)[0]
@@ -528,5 +799,6 @@ class VncServer:  # pylint: disable=too-many-instance-attributes
             for task in tasks:
                 task.cancel()
             loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(self.__kvmd.close())
             loop.close()
             logger.info("Bye-bye")
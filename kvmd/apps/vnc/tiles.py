@@ -0,0 +1,92 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import io
+
+from typing import Tuple
+from typing import List
+from typing import Union
+from typing import Optional
+
+from PIL import Image as PilImage
+from PIL import ImageChops as PilImageChops
+
+
+# =====
+def decode_jpeg(data: Union[bytes, memoryview]) -> PilImage.Image:
+    image: PilImage.Image = PilImage.open(io.BytesIO(data))
+    image.load()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+class TilesDiffer:
+    # Сравнивает кадр по тайлам с тем, что сейчас на экране у клиента, и отдает изменившиеся
+    # горизонтальные полосы тайлов, чтобы перекодировать и отправить только их.
+    # Эталон обновляется только отправленными областями: если сравнивать с предыдущим кадром,
+    # то мелкие изменения ниже порога копятся от кадра к кадру и никогда не доходят до клиента.
+
+    def __init__(self, tile_size: int, threshold: int, max_area: float=0.5) -> None:
+        self.__tile_size = tile_size
+        self.__lut = [(0 if value <= threshold else 255) for value in range(256)]
+        self.__max_area = max_area
+
+        self.__ref: Optional[PilImage.Image] = None
+
+    def diff(self, image: PilImage.Image, full: bool) -> Optional[List[Tuple[int, int, int, int]]]:
+        # None означает, что дешевле отправить кадр целиком,
+        # пустой список - что на экране ничего не поменялось.
+        ref = self.__ref
+        if full or ref is None or ref.size != image.size:
+            self.__ref = image
+            return None
+
+        mask = PilImageChops.difference(ref, image).convert("L").point(self.__lut)
+        bbox = mask.getbbox()
+        if bbox is None:
+            return []
+
+        (width, height) = image.size
+        size = self.__tile_size
+        rects: List[List[int]] = []
+        area = 0
+        # Проверяем только тайлы, попадающие в общую рамку изменений
+        for y in range(bbox[1] // size * size, bbox[3], size):
+            tile_height = min(size, height - y)
+            run: Optional[List[int]] = None
+            for x in range(bbox[0] // size * size, bbox[2], size):
+                tile_width = min(size, width - x)
+                if mask.crop((x, y, x + tile_width, y + tile_height)).getbbox() is not None:
+                    if run is not None and run[0] + run[2] == x:
+                        run[2] += tile_width  # Склеиваем соседние тайлы в полосу
+                    else:
+                        run = [x, y, tile_width, tile_height]
+                        rects.append(run)
+                    area += tile_width * tile_height
+            if area > width * height * self.__max_area:
+                self.__ref = image
+                return None
+        for (x, y, rect_width, rect_height) in rects:
+            box = (x, y, x + rect_width, y + rect_height)
+            ref.paste(image.crop(box), box)
+        return [(x, y, rect_width, rect_height) for (x, y, rect_width, rect_height) in rects]
@@ -214,9 +214,9 @@ class KvmdClientSession:
         self.atx = _AtxApiPart(*args)
 
     @contextlib.asynccontextmanager
-    async def ws(self) -> AsyncGenerator[KvmdClientWs, None]:
+    async def ws(self, stream: bool=True) -> AsyncGenerator[KvmdClientWs, None]:
         session = self.__ensure_http_session()
-        async with session.ws_connect(self.__make_url("ws")) as ws:
+        async with session.ws_connect(self.__make_url("ws"), params={"stream": int(stream)}) as ws:
             yield KvmdClientWs(ws)
 
     def __ensure_http_session(self) -> aiohttp.ClientSession:
@@ -258,24 +258,40 @@ class KvmdClient:
         self.__timeout = timeout
         self.__user_agent = user_agent
 
+        self.__connector: Optional[aiohttp.BaseConnector] = None
+
     def make_session(self, user: str, passwd: str) -> KvmdClientSession:
         return KvmdClientSession(
             make_http_session=(lambda: self.__make_http_session(user, passwd)),
             make_url=self.__make_url,
         )
 
+    async def close(self) -> None:
+        if self.__connector:
+            await self.__connector.close()
+            self.__connector = None
+
     def __make_http_session(self, user: str, passwd: str) -> aiohttp.ClientSession:
-        kwargs: Dict = {
-            "headers": {
+        # Сессии легкие и несут только заголовки юзера, а keep-alive соединения
+        # с KVMD живут в общем на весь процесс пуле
+        return aiohttp.ClientSession(
+            headers={
                 "X-KVMD-User": user,
                 "X-KVMD-Passwd": passwd,
                 "User-Agent": self.__user_agent,
             },
-            "timeout": aiohttp.ClientTimeout(total=self.__timeout),
-        }
-        if self.__unix_path:
-            kwargs["connector"] = aiohttp.UnixConnector(path=self.__unix_path)
-        return aiohttp.ClientSession(**kwargs)
+            timeout=aiohttp.ClientTimeout(total=self.__timeout),
+            connector=self.__ensure_connector(),
+            connector_owner=False,
+        )
+
+    def __ensure_connector(self) -> aiohttp.BaseConnector:
+        if self.__connector is None or self.__connector.closed:
+            if self.__unix_path:
+                self.__connector = aiohttp.UnixConnector(path=self.__unix_path)
+            else:
+                self.__connector = aiohttp.TCPConnector()
+        return self.__connector
 
     def __make_url(self, handle: str) -> str:
         assert not handle.startswith("/"), handle
@@ -20,10 +20,15 @@
 # ========================================================================== #
 
 
+import asyncio
+import collections
 import types
 
 from typing import Dict
+from typing import Set
+from typing import Deque
 from typing import AsyncGenerator
+from typing import Optional
 
 import aiohttp
 
@@ -57,11 +62,94 @@ class StreamFormats:
     _MJPEG = 1196444237  # V4L2_PIX_FMT_MJPEG
 
 
+class _StreamerSubscriber:
+    def __init__(self, fmt: int, ring_size: int) -> None:
+        self.__h264 = (fmt == StreamFormats.H264)
+        self.__ring_size = ring_size
+
+        self.__ring: Deque[Dict] = collections.deque()
+        self.__need_key = self.__h264
+        self.__err: Optional[StreamerError] = None
+        self.__event = asyncio.Event()
+
+    def push(self, frame: Dict) -> None:
+        # Подписчик сразу перекладывает фреймы в свою очередь, так что кольцо переполняется
+        # только если он завис. Кадры для медленного клиента выкидывает его собственная очередь.
+        if len(self.__ring) >= self.__ring_size:
+            if self.__h264:
+                # Выкинутый P-фрейм сломает декодер клиента, поэтому сбрасываем
+                # всю очередь и ждем следующий ключевой фрейм.
+                self.__ring.clear()
+                self.__need_key = True
+            else:
+                self.__ring.popleft()
+        if self.__need_key:
+            if not frame["key"]:
+                return
+            self.__need_key = False
+        self.__ring.append(frame)
+        self.__event.set()
+
+    def fail(self, err: StreamerError) -> None:
+        self.__err = err
+        self.__event.set()
+
+    async def get(self) -> Dict:
+        while len(self.__ring) == 0:
+            if self.__err is not None:
+                raise self.__err
+            self.__event.clear()
+            await self.__event.wait()
+        return self.__ring.popleft()
+
+
 class BaseStreamerClient:
+    def __init__(self, ring_size: int=4) -> None:
+        assert ring_size > 0
+        self.__ring_size = ring_size
+
+        self.__subs: Set[_StreamerSubscriber] = set()
+        self.__reader_task: Optional[asyncio.Task] = None
+        self.__subs_lock = asyncio.Lock()
+
     def get_format(self) -> int:
         raise NotImplementedError()
 
     async def read_stream(self) -> AsyncGenerator[Dict, None]:
+        # Все подписчики получают одни и те же неизменяемые фреймы из единственного
+        # читателя источника. Фреймы общие, поэтому модифицировать их нельзя.
+        sub = _StreamerSubscriber(self.get_format(), self.__ring_size)
+        async with self.__subs_lock:
+            self.__subs.add(sub)
+            if self.__reader_task is None or self.__reader_task.done():
+                # Прежний читатель уже остановлен под локом, так что источник
+                # никогда не читают два читателя одновременно.
+                self.__reader_task = asyncio.create_task(self.__reader_task_loop())
+        try:
+            while True:
+                yield (await sub.get())
+        finally:
+            async with self.__subs_lock:
+                self.__subs.discard(sub)
+                if len(self.__subs) == 0 and self.__reader_task is not None:
+                    self.__reader_task.cancel()
+                    await asyncio.gather(self.__reader_task, return_exceptions=True)
+                    self.__reader_task = None
+
+    async def __reader_task_loop(self) -> None:
+        try:
+            async for frame in self._read_stream():
+                for sub in self.__subs:
+                    sub.push(frame)
+            raise StreamerTempError("Reached EOF")
+        except StreamerError as err:
+            for sub in self.__subs:
+                sub.fail(err)
+        except Exception as err:
+            for sub in self.__subs:
+                sub.fail(StreamerTempError(tools.efmt(err)))
+
+    async def _read_stream(self) -> AsyncGenerator[Dict, None]:
         if self is not None:  # XXX: Vulture and pylint hack
             raise NotImplementedError()
         yield
@@ -78,6 +166,8 @@ class HttpStreamerClient(BaseStreamerClient):
         user_agent: str,
     ) -> None:
 
+        super().__init__()
+
         assert port or unix_path
         self.__name = name
         self.__host = host
@@ -89,7 +179,7 @@ class HttpStreamerClient(BaseStreamerClient):
     def get_format(self) -> int:
         return StreamFormats.JPEG
 
-    async def read_stream(self) -> AsyncGenerator[Dict, None]:
+    async def _read_stream(self) -> AsyncGenerator[Dict, None]:
         try:
             async with self.__make_http_session() as session:
                 async with session.get(
@@ -105,7 +195,7 @@ class HttpStreamerClient(BaseStreamerClient):
                         if not isinstance(frame, aiohttp.BodyPartReader):
                             raise StreamerTempError("Expected body part")
 
-                        data = bytes(await frame.read())
+                        data = await frame.read()
                         if not data:
                             break
 
@@ -113,7 +203,7 @@ class HttpStreamerClient(BaseStreamerClient):
                             "online": (frame.headers["X-UStreamer-Online"] == "true"),
                             "width": int(frame.headers["X-UStreamer-Width"]),
                             "height": int(frame.headers["X-UStreamer-Height"]),
-                            "data": data,
+                            "data": memoryview(data).toreadonly(),  # Без копирования bytearray
                             "format": StreamFormats.JPEG,
                         }
         except Exception as err:  # Тут бывают и ассерты, и KeyError, и прочая херня
@@ -166,6 +256,8 @@ class MemsinkStreamerClient(BaseStreamerClient):
         drop_same_frames: float,
     ) -> None:
 
+        super().__init__()
+
         self.__name = name
         self.__fmt = fmt
         self.__kwargs: Dict = {
@@ -178,7 +270,7 @@ class MemsinkStreamerClient(BaseStreamerClient):
     def get_format(self) -> int:
         return self.__fmt
 
-    async def read_stream(self) -> AsyncGenerator[Dict, None]:
+    async def _read_stream(self) -> AsyncGenerator[Dict, None]:
         if ustreamer is None:
             raise StreamerPermError("Missing ustreamer library")
         try:
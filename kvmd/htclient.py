@@ -21,8 +21,10 @@
 
 
 import os
+import asyncio
 import contextlib
 
+from typing import List
 from typing import Dict
 from typing import AsyncGenerator
 from typing import Optional
@@ -33,6 +35,14 @@ import aiohttp.multipart
 from . import __version__
 
 
+# =====
+class _TempResponseError(aiohttp.ClientResponseError):
+    pass
+
+
+_RETRY_ERRORS = (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError, _TempResponseError)
+
+
 # =====
 def make_user_agent(app: str) -> str:
     return f"{app}/{__version__}"
@@ -63,14 +73,158 @@ def get_filename(response: aiohttp.ClientResponse) -> str:
             raise aiohttp.ClientError("Can't determine filename")
 
 
+class Download:
+    # Скачивание с докачкой: если соединение рвется, а сервер поддерживает Range,
+    # запрос повторяется с того места, на котором остановились. Кроме того, большой файл
+    # можно качать в несколько соединений: куски запрашиваются параллельно в пределах окна
+    # и отдаются строго по порядку, так что потребитель по-прежнему пишет файл последовательно.
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        verify: bool,
+        response: aiohttp.ClientResponse,
+        retries: int,
+        streams: int,
+        segment_size: int,
+    ) -> None:
+
+        self.__session = session
+        self.__url = url
+        self.__verify = verify
+        self.__response = response
+        self.__retries = retries
+        self.__streams = streams
+        self.__segment_size = segment_size
+
+        self.__size = (response.content_length or 0)
+        self.__ranges = bool(response.headers.get("Accept-Ranges", "").lower() == "bytes" and self.__size)
+
+        # Докачивать можно, только если файл на сервере не поменялся между запросами,
+        # поэтому при наличии валидатора сервер сам отдаст 200 вместо 206 в случае изменений
+        etag = response.headers.get("ETag", "")
+        self.__if_range = (etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified", ""))
+
+    def get_response(self) -> aiohttp.ClientResponse:
+        return self.__response
+
+    async def iter_chunked(self, chunk_size: int) -> AsyncGenerator[bytes, None]:
+        if self.__ranges and self.__streams > 1 and self.__size > self.__segment_size:
+            self.__response.close()
+            async for chunk in self.__iter_segments():
+                yield chunk
+        else:
+            async for chunk in self.__iter_single(chunk_size):
+                yield chunk
+
+    async def __iter_single(self, chunk_size: int) -> AsyncGenerator[bytes, None]:
+        response: Optional[aiohttp.ClientResponse] = self.__response
+        offset = 0
+        failures = 0
+        while True:
+            try:
+                if response is None:
+                    response = await self.__request_range(offset, self.__size - 1, failures)
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    offset += len(chunk)
+                    failures = 0
+                    yield chunk
+                if not self.__size or offset >= self.__size:
+                    return
+                raise aiohttp.ClientPayloadError(f"Response payload is not completed: {offset} of {self.__size} bytes")
+            except _RETRY_ERRORS:
+                failures += 1
+                if not self.__ranges or failures > self.__retries:
+                    raise
+            finally:
+                if response is not None:
+                    response.close()
+            response = None
+
+    async def __iter_segments(self) -> AsyncGenerator[bytes, None]:
+        segments = [
+            (offset, min(offset + self.__segment_size, self.__size) - 1)
+            for offset in range(0, self.__size, self.__segment_size)
+        ]
+        tasks: List[asyncio.Task] = []
+        try:
+            for index in range(len(segments)):
+                while len(tasks) < self.__streams and index + len(tasks) < len(segments):
+                    tasks.append(asyncio.create_task(self.__fetch_segment(*segments[index + len(tasks)])))
+                yield (await tasks.pop(0))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __fetch_segment(self, first: int, last: int) -> bytes:
+        data = bytearray()
+        failures = 0
+        while True:
+            try:
+                response = await self.__request_range(first + len(data), last, failures)
+                try:
+                    async for chunk in response.content.iter_any():
+                        data += chunk
+                        failures = 0
+                finally:
+                    response.close()
+                if len(data) == last - first + 1:
+                    return bytes(data)
+                raise aiohttp.ClientPayloadError(f"Range payload is not completed: {len(data)} of {last - first + 1} bytes")
+            except _RETRY_ERRORS:
+                failures += 1
+                if failures > self.__retries:
+                    raise
+
+    async def __request_range(self, first: int, last: int, failures: int) -> aiohttp.ClientResponse:
+        if failures:
+            await asyncio.sleep(min(failures, 10))
+        headers = {"Range": f"bytes={first}-{last}"}
+        if self.__if_range:
+            headers["If-Range"] = self.__if_range
+        response = await self.__session.get(self.__url, verify_ssl=self.__verify, headers=headers)
+        try:
+            if response.status == 429 or response.status >= 500:
+                # Перегруженное или временно сломанное зеркало, пробуем еще раз
+                raise _TempResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message=(response.reason or ""),
+                    headers=response.headers,
+                )
+            if response.status != 206:
+                # Сервер отдал файл целиком, значит он поменялся и докачивать нечего
+                raise_not_200(response)
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message="The remote file has been changed or the server ignored the range request",
+                    headers=response.headers,
+                )
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {first}-{last}/"):
+                raise aiohttp.ClientPayloadError(f"Unexpected Content-Range: {content_range!r}")
+        except Exception:
+            response.close()
+            raise
+        return response
+
+
 @contextlib.asynccontextmanager
-async def download(
+async def download(  # pylint: disable=too-many-arguments
     url: str,
     verify: bool=True,
     timeout: float=10.0,
     read_timeout: Optional[float]=None,
     app: str="KVMD",
-) -> AsyncGenerator[aiohttp.ClientResponse, None]:
+    retries: int=0,
+    streams: int=1,
+    segment_size: int=(8 * 1024 * 1024),
+) -> AsyncGenerator[Download, None]:
 
     kwargs: Dict = {
         "headers": {"User-Agent": make_user_agent(app)},
@@ -83,4 +237,4 @@ async def download(
     async with aiohttp.ClientSession(**kwargs) as session:
         async with session.get(url, verify_ssl=verify) as response:
             raise_not_200(response)
-            yield response
+            yield Download(session, url, verify, response, retries, streams, segment_size)
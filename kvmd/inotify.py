@@ -63,7 +63,7 @@ def _inotify_parsed_buffer(data: bytes) -> Generator[Tuple[int, int, int, bytes]
             offset + _EVENT_HEAD_SIZE + length
         ].rstrip(b"\0")
         offset += _EVENT_HEAD_SIZE + length
-        if wd >= 0:
+        if wd >= 0 or mask & InotifyMask.Q_OVERFLOW:  # Переполнение очереди приходит с wd=-1
             yield (wd, mask, cookie, name)
 
 
@@ -261,6 +261,9 @@ class Inotify:
 
     def __read_parsed_events(self) -> Generator[InotifyEvent, None, None]:
         for (wd, mask, cookie, name_bytes) in _inotify_parsed_buffer(self.__read_buffer()):
+            if mask & InotifyMask.Q_OVERFLOW:
+                yield InotifyEvent(wd, mask, cookie, "", "")
+                continue
             wd_path = self.__path_by_wd.get(wd, None)
             if wd_path is not None:
                 name = _fs_decode(name_bytes)
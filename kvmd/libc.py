@@ -26,7 +26,9 @@ import ctypes
 import ctypes.util
 
 from ctypes import c_int
+from ctypes import c_uint
 from ctypes import c_uint32
+from ctypes import c_int64
 from ctypes import c_char_p
 from ctypes import c_void_p
 
@@ -37,12 +39,13 @@ def _load_libc() -> ctypes.CDLL:
     if not path:
         raise RuntimeError("Where is libc?")
     assert path
-    lib = ctypes.CDLL(path)
+    lib = ctypes.CDLL(path, use_errno=True)
     for (name, restype, argtypes) in [
         ("inotify_init", c_int, []),
         ("inotify_add_watch", c_int, [c_int, c_char_p, c_uint32]),
         ("inotify_rm_watch", c_int, [c_int, c_uint32]),
         ("free", c_int, [c_void_p]),
+        ("sync_file_range", c_int, [c_int, c_int64, c_int64, c_uint]),
     ]:
         func = getattr(lib, name)
         if not func:
@@ -60,3 +63,8 @@ inotify_init = _libc.inotify_init
 inotify_add_watch = _libc.inotify_add_watch
 inotify_rm_watch = _libc.inotify_rm_watch
 free = _libc.free
+sync_file_range = _libc.sync_file_range
+
+SYNC_FILE_RANGE_WAIT_BEFORE = 1
+SYNC_FILE_RANGE_WRITE = 2
+SYNC_FILE_RANGE_WAIT_AFTER = 4
@@ -31,6 +31,10 @@ class BaseAuthService(BasePlugin):
     async def authorize(self, user: str, passwd: str) -> bool:
         raise NotImplementedError  # pragma: nocover
 
+    def get_revision(self) -> str:
+        # Ревизия базы пользователей: при ее смене кеш проверок сбрасывается
+        return ""
+
     async def cleanup(self) -> None:
         pass
 
@@ -20,14 +20,22 @@
 # ========================================================================== #
 
 
+import os
+import asyncio
+
 from typing import Dict
+from typing import Optional
 
 import passlib.apache
 
+from ...logging import get_logger
+
 from ...yamlconf import Option
 
 from ...validators.os import valid_abs_file
 
+from ... import aiotools
+
 from . import BaseAuthService
 
 
@@ -36,6 +44,10 @@ class Plugin(BaseAuthService):
     def __init__(self, path: str) -> None:  # pylint: disable=super-init-not-called
         self.__path = path
 
+        self.__htpasswd: Optional[passlib.apache.HtpasswdFile] = None
+        self.__revision = ""
+        self.__lock = asyncio.Lock()
+
     @classmethod
     def get_plugin_options(cls) -> Dict:
         return {
@@ -45,5 +57,28 @@ class Plugin(BaseAuthService):
     async def authorize(self, user: str, passwd: str) -> bool:
         assert user == user.strip()
         assert user
-        htpasswd = passlib.apache.HtpasswdFile(self.__path)
-        return htpasswd.check_password(user, passwd)
+        htpasswd = await self.__get_htpasswd()
+        passwd_hash = htpasswd.get_hash(user)
+        if passwd_hash is None:
+            return False
+        # Проверка хеша (bcrypt и прочие) может занимать десятки миллисекунд, не блокируем луп
+        return (await aiotools.run_async(htpasswd.context.verify, passwd, passwd_hash))
+
+    def get_revision(self) -> str:
+        # Один stat() на запрос дешевле любого парсинга. Инод меняется при замене файла через rename().
+        try:
+            st = os.stat(self.__path)
+            return f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+        except Exception:
+            return ""
+
+    # =====
+
+    async def __get_htpasswd(self) -> passlib.apache.HtpasswdFile:
+        async with self.__lock:
+            revision = self.get_revision()
+            if self.__htpasswd is None or self.__revision != revision:
+                self.__htpasswd = await aiotools.run_async(passlib.apache.HtpasswdFile, self.__path)
+                self.__revision = revision
+                get_logger(0).info("Loaded htpasswd file %s", self.__path)
+            return self.__htpasswd
@@ -0,0 +1,52 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+from typing import List
+from typing import Type
+from typing import TypeVar
+from typing import Any
+from typing import cast
+
+
+# =====
+_EventT = TypeVar("_EventT")
+
+
+def coalesce_events(events: List[_EventT], move_cls: Type[Any], relative_cls: Type[Any]) -> List[_EventT]:
+    # У OTG и MCU свои классы событий, но поля перемещений у них одинаковые.
+    # Подряд идущие абсолютные перемещения схлопываются в последнее,
+    # относительные суммируются в пределах ±127. Остальные события не трогаем.
+    result: List[Any] = []
+    for event in cast(List[Any], events):
+        prev = (result[-1] if result else None)
+        if isinstance(event, move_cls) and isinstance(prev, move_cls):
+            result[-1] = event
+        elif isinstance(event, relative_cls) and isinstance(prev, relative_cls):
+            delta_x = prev.delta_x + event.delta_x
+            delta_y = prev.delta_y + event.delta_y
+            if -127 <= delta_x <= 127 and -127 <= delta_y <= 127:
+                result[-1] = relative_cls(delta_x, delta_y)
+            else:
+                result.append(event)
+        else:
+            result.append(event)
+    return result
@@ -22,7 +22,6 @@
 
 import multiprocessing
 import contextlib
-import queue
 import time
 
 from typing import Tuple
@@ -35,7 +34,6 @@ from typing import Optional
 
 from ....logging import get_logger
 
-from .... import tools
 from .... import aiotools
 from .... import aiomulti
 from .... import aioproc
@@ -50,6 +48,7 @@ from ....validators.os import valid_abs_path
 from ....validators.hw import valid_gpio_pin_optional
 
 from .. import BaseHid
+from .._events import coalesce_events
 
 from .gpio import Gpio
 
@@ -57,6 +56,13 @@ from .proto import REQUEST_PING
 from .proto import REQUEST_REPEAT
 from .proto import RESPONSE_LEGACY_OK
 
+from .proto import EVENT_RECORD_FMT
+from .proto import pack_event
+from .proto import unpack_event
+from .proto import group_events
+from .proto import make_batch_request
+from .proto import is_batch_supported
+
 from .proto import BaseEvent
 from .proto import SetKeyboardOutputEvent
 from .proto import SetMouseOutputEvent
@@ -117,6 +123,7 @@ class BaseMcuHid(BaseHid, multiprocessing.Process):  # pylint: disable=too-many-
         common_retries: int,
         retries_delay: float,
         errors_threshold: int,
+        queue_size: int,
         noop: bool,
     ) -> None:
 
@@ -132,7 +139,8 @@ class BaseMcuHid(BaseHid, multiprocessing.Process):  # pylint: disable=too-many-
         self.__gpio = Gpio(gpio_device_path, reset_pin, reset_inverted, reset_delay)
 
         self.__reset_required_event = multiprocessing.Event()
-        self.__events_queue: "multiprocessing.Queue[BaseEvent]" = multiprocessing.Queue()
+        self.__events_ring = aiomulti.SharedRing(EVENT_RECORD_FMT, queue_size)
+        self.__batch_supported = False
 
         self.__notifier = aiomulti.AioProcessNotifier()
         self.__state_flags = aiomulti.AioSharedFlags({
@@ -155,6 +163,7 @@ class BaseMcuHid(BaseHid, multiprocessing.Process):  # pylint: disable=too-many-
             "common_retries":   Option(5,     type=valid_int_f1),
             "retries_delay":    Option(0.5,   type=valid_float_f01),
             "errors_threshold": Option(5,     type=valid_int_f0),
+            "queue_size":       Option(1024,  type=valid_int_f1),
             "noop":             Option(False, type=valid_bool),
         }
 
@@ -277,12 +286,10 @@ class BaseMcuHid(BaseHid, multiprocessing.Process):  # pylint: disable=too-many-
 
     def __queue_event(self, event: BaseEvent, clear: bool=False) -> None:
         if not self.__stop_event.is_set():
-            if clear:
-                # FIXME: Если очистка производится со стороны процесса хида, то возможна гонка между
-                # очисткой и добавлением нового события. Неприятно, но не смертельно.
-                # Починить блокировкой после перехода на асинхронные очереди.
-                tools.clear_queue(self.__events_queue)
-            self.__events_queue.put_nowait(event)
+            if not self.__events_ring.put(*pack_event(event), clear=clear):
+                get_logger().error("HID events queue is overflowed, dropping %d events and releasing keys ...",
+                                   self.__events_ring.qsize() + 1)
+                self.__events_ring.put(*pack_event(ClearEvent()), clear=True)
 
     def run(self) -> None:  # pylint: disable=too-many-branches
         logger = aioproc.settle("HID", "hid")
@@ -307,22 +314,26 @@ class BaseMcuHid(BaseHid, multiprocessing.Process):  # pylint: disable=too-many-
                 if not self.__hid_loop_wait_device():
                     continue
                 with self.__phy.connected() as conn:
-                    while not (self.__stop_event.is_set() and self.__events_queue.qsize() == 0):
+                    self.__batch_supported = False  # Until the first pong
+                    while not (self.__stop_event.is_set() and self.__events_ring.qsize() == 0):
                         if self.__reset_required_event.is_set():
                             try:
                                 self.__set_state_busy(True)
                                 self.__gpio.reset()
                             finally:
                                 self.__reset_required_event.clear()
-                        try:
-                            event = self.__events_queue.get(timeout=0.1)
-                        except queue.Empty:
+                        records = self.__events_ring.get_all()
+                        if not records and self.__events_ring.wait(0.1):
+                            records = self.__events_ring.get_all()
+                        if not records:
                             self.__process_request(conn, REQUEST_PING)
-                        else:
-                            if isinstance(event, (SetKeyboardOutputEvent, SetMouseOutputEvent)):
+                        events = coalesce_events(list(map(unpack_event, records)), MouseMoveEvent, MouseRelativeEvent)
+                        for group in group_events(events, self.__batch_supported):
+                            if isinstance(group[0], (SetKeyboardOutputEvent, SetMouseOutputEvent)):
                                 self.__set_state_busy(True)
-                            if not self.__process_request(conn, event.make_request()):
+                            if not self.__process_request(conn, make_batch_request(group)):
                                 self.clear_events()
+                                break
             except Exception:
                 self.clear_events()
                 get_logger(0).exception("Unexpected error in the HID loop")
@@ -419,6 +430,7 @@ class BaseMcuHid(BaseHid, multiprocessing.Process):  # pylint: disable=too-many-
         status = response[1] << 16
         if len(response) > 4:
             status |= (response[2] << 8) | response[3]
+        self.__batch_supported = is_batch_supported(response)
         reset_required = (1 if response[1] & 0b01000000 else 0)
         self.__state_flags.update(online=1, busy=reset_required, status=status)
         if reset_required:
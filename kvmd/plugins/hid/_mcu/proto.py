@@ -21,8 +21,13 @@
 
 
 import dataclasses
+import functools
 import struct
 
+from typing import Tuple
+from typing import List
+from typing import Generator
+
 from ....keyboard.mappings import KEYMAP
 
 from ....mouse import MouseRange
@@ -33,6 +38,9 @@ from .... import tools
 # =====
 class BaseEvent:
     def make_request(self) -> bytes:
+        return _make_request(self.make_command())
+
+    def make_command(self) -> bytes:
         raise NotImplementedError
 
 
@@ -56,9 +64,9 @@ class SetKeyboardOutputEvent(BaseEvent):
     def __post_init__(self) -> None:
         assert not self.keyboard or self.keyboard in _KEYBOARD_NAMES_TO_CODES
 
-    def make_request(self) -> bytes:
+    def make_command(self) -> bytes:
         code = _KEYBOARD_NAMES_TO_CODES.get(self.keyboard, 0)
-        return _make_request(struct.pack(">BBxxx", 0x03, code))
+        return struct.pack(">BBxxx", 0x03, code)
 
 
 # =====
@@ -83,8 +91,8 @@ class SetMouseOutputEvent(BaseEvent):
     def __post_init__(self) -> None:
         assert not self.mouse or self.mouse in _MOUSE_NAMES_TO_CODES
 
-    def make_request(self) -> bytes:
-        return _make_request(struct.pack(">BBxxx", 0x04, _MOUSE_NAMES_TO_CODES.get(self.mouse, 0)))
+    def make_command(self) -> bytes:
+        return struct.pack(">BBxxx", 0x04, _MOUSE_NAMES_TO_CODES.get(self.mouse, 0))
 
 
 # =====
@@ -92,14 +100,14 @@ class SetMouseOutputEvent(BaseEvent):
 class SetConnectedEvent(BaseEvent):
     connected: bool
 
-    def make_request(self) -> bytes:
-        return _make_request(struct.pack(">BBxxx", 0x05, int(self.connected)))
+    def make_command(self) -> bytes:
+        return struct.pack(">BBxxx", 0x05, int(self.connected))
 
 
 # =====
 class ClearEvent(BaseEvent):
-    def make_request(self) -> bytes:
-        return _make_request(b"\x10\x00\x00\x00\x00")
+    def make_command(self) -> bytes:
+        return b"\x10\x00\x00\x00\x00"
 
 
 @dataclasses.dataclass(frozen=True)
@@ -110,9 +118,12 @@ class KeyEvent(BaseEvent):
     def __post_init__(self) -> None:
         assert self.name in KEYMAP
 
-    def make_request(self) -> bytes:
+    def make_command(self) -> bytes:
         code = KEYMAP[self.name].mcu.code
-        return _make_request(struct.pack(">BBBxx", 0x11, code, int(self.state)))
+        return struct.pack(">BBBxx", 0x11, code, int(self.state))
+
+    def make_request(self) -> bytes:
+        return _KEY_REQUESTS[(self.name, self.state)]
 
 
 @dataclasses.dataclass(frozen=True)
@@ -123,7 +134,7 @@ class MouseButtonEvent(BaseEvent):
     def __post_init__(self) -> None:
         assert self.name in ["left", "right", "middle", "up", "down"]
 
-    def make_request(self) -> bytes:
+    def make_command(self) -> bytes:
         (code, state_pressed, is_main) = {
             "left":   (0b10000000, 0b00001000, True),
             "right":  (0b01000000, 0b00000100, True),
@@ -139,7 +150,10 @@ class MouseButtonEvent(BaseEvent):
         else:
             main_code = 0
             extra_code = code
-        return _make_request(struct.pack(">BBBxx", 0x13, main_code, extra_code))
+        return struct.pack(">BBBxx", 0x13, main_code, extra_code)
+
+    def make_request(self) -> bytes:
+        return _MOUSE_BUTTON_REQUESTS[(self.name, self.state)]
 
 
 @dataclasses.dataclass(frozen=True)
@@ -151,8 +165,8 @@ class MouseMoveEvent(BaseEvent):
         assert MouseRange.MIN <= self.to_x <= MouseRange.MAX
         assert MouseRange.MIN <= self.to_y <= MouseRange.MAX
 
-    def make_request(self) -> bytes:
-        return _make_request(struct.pack(">Bhh", 0x12, self.to_x, self.to_y))
+    def make_command(self) -> bytes:
+        return struct.pack(">Bhh", 0x12, self.to_x, self.to_y)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -164,8 +178,8 @@ class MouseRelativeEvent(BaseEvent):
         assert -127 <= self.delta_x <= 127
         assert -127 <= self.delta_y <= 127
 
-    def make_request(self) -> bytes:
-        return _make_request(struct.pack(">Bbbxx", 0x15, self.delta_x, self.delta_y))
+    def make_command(self) -> bytes:
+        return struct.pack(">Bbbxx", 0x15, self.delta_x, self.delta_y)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -177,13 +191,119 @@ class MouseWheelEvent(BaseEvent):
         assert -127 <= self.delta_x <= 127
         assert -127 <= self.delta_y <= 127
 
-    def make_request(self) -> bytes:
+    def make_command(self) -> bytes:
         # Горизонтальная прокрутка пока не поддерживается
-        return _make_request(struct.pack(">Bxbxx", 0x14, self.delta_y))
+        return struct.pack(">Bxbxx", 0x14, self.delta_y)
+
+
+# =====
+EVENT_RECORD_FMT = "<BBhh"  # Kind, flag, first arg, second arg
+
+_KIND_SET_KEYBOARD_OUTPUT = 0
+_KIND_SET_MOUSE_OUTPUT = 1
+_KIND_SET_CONNECTED = 2
+_KIND_CLEAR = 3
+_KIND_KEY = 4
+_KIND_MOUSE_BUTTON = 5
+_KIND_MOUSE_MOVE = 6
+_KIND_MOUSE_RELATIVE = 7
+_KIND_MOUSE_WHEEL = 8
+
+_KEY_NAMES = tuple(KEYMAP)
+_KEY_NAMES_TO_INDEXES = {name: index for (index, name) in enumerate(_KEY_NAMES)}
+_MOUSE_BUTTONS = ("left", "right", "middle", "up", "down")
+
+
+def pack_event(event: BaseEvent) -> Tuple[int, int, int, int]:  # pylint: disable=too-many-return-statements
+    # Событие в компактную запись для aiomulti.SharedRing
+    if isinstance(event, SetKeyboardOutputEvent):
+        return (_KIND_SET_KEYBOARD_OUTPUT, 0, _KEYBOARD_NAMES_TO_CODES.get(event.keyboard, 0), 0)
+    elif isinstance(event, SetMouseOutputEvent):
+        return (_KIND_SET_MOUSE_OUTPUT, 0, _MOUSE_NAMES_TO_CODES.get(event.mouse, 0), 0)
+    elif isinstance(event, SetConnectedEvent):
+        return (_KIND_SET_CONNECTED, int(event.connected), 0, 0)
+    elif isinstance(event, ClearEvent):
+        return (_KIND_CLEAR, 0, 0, 0)
+    elif isinstance(event, KeyEvent):
+        return (_KIND_KEY, int(event.state), _KEY_NAMES_TO_INDEXES[event.name], 0)
+    elif isinstance(event, MouseButtonEvent):
+        return (_KIND_MOUSE_BUTTON, int(event.state), _MOUSE_BUTTONS.index(event.name), 0)
+    elif isinstance(event, MouseMoveEvent):
+        return (_KIND_MOUSE_MOVE, 0, event.to_x, event.to_y)
+    elif isinstance(event, MouseRelativeEvent):
+        return (_KIND_MOUSE_RELATIVE, 0, event.delta_x, event.delta_y)
+    elif isinstance(event, MouseWheelEvent):
+        return (_KIND_MOUSE_WHEEL, 0, event.delta_x, event.delta_y)
+    raise RuntimeError(f"Not implemented event: {event}")
+
+
+def unpack_event(record: Tuple[int, ...]) -> BaseEvent:  # pylint: disable=too-many-return-statements
+    (kind, flag, first, second) = record
+    if kind == _KIND_SET_KEYBOARD_OUTPUT:
+        return SetKeyboardOutputEvent(_KEYBOARD_CODES_TO_NAMES.get(first, ""))
+    elif kind == _KIND_SET_MOUSE_OUTPUT:
+        return SetMouseOutputEvent(_MOUSE_CODES_TO_NAMES.get(first, ""))
+    elif kind == _KIND_SET_CONNECTED:
+        return SetConnectedEvent(bool(flag))
+    elif kind == _KIND_CLEAR:
+        return ClearEvent()
+    elif kind == _KIND_KEY:
+        return KeyEvent(_KEY_NAMES[first], bool(flag))
+    elif kind == _KIND_MOUSE_BUTTON:
+        return MouseButtonEvent(_MOUSE_BUTTONS[first], bool(flag))
+    elif kind == _KIND_MOUSE_MOVE:
+        return MouseMoveEvent(first, second)
+    elif kind == _KIND_MOUSE_RELATIVE:
+        return MouseRelativeEvent(first, second)
+    elif kind == _KIND_MOUSE_WHEEL:
+        return MouseWheelEvent(first, second)
+    raise RuntimeError(f"Unknown event record: {record}")
+
+
+# =====
+BATCH_MAX_EVENTS = 8
+
+
+def is_batch_supported(response: bytes) -> bool:
+    # Прошивки с поддержкой пачек выставляют флаг в пятом байте понга
+    return (len(response) == 8 and bool(response[4] & 0b00000001))
+
+
+def group_events(events: List[BaseEvent], batch: bool) -> Generator[List[BaseEvent], None, None]:
+    # Подряд идущие события ввода объединяются в пачки, остальные идут по одному.
+    # При ошибке пачка переотправляется целиком, а прошивка могла уже применить ее начало,
+    # поэтому в пачки попадают только идемпотентные события: состояния клавиш и кнопок
+    # и абсолютные перемещения. Относительные перемещения и колесо при повторе удвоились бы.
+    group: List[BaseEvent] = []
+    for event in events:
+        if batch and isinstance(event, (KeyEvent, MouseButtonEvent, MouseMoveEvent)):
+            group.append(event)
+            if len(group) == BATCH_MAX_EVENTS:
+                yield group
+                group = []
+        else:
+            if group:
+                yield group
+                group = []
+            yield [event]
+    if group:
+        yield group
+
+
+def make_batch_request(events: List[BaseEvent]) -> bytes:
+    if len(events) == 1:
+        return events[0].make_request()
+    assert 1 < len(events) <= BATCH_MAX_EVENTS, events
+    request = struct.pack(">BBB", 0x33, 0x20, len(events))
+    request += b"".join(event.make_command() for event in events)
+    request += struct.pack(">H", _make_crc16(request))
+    return request
 
 
 # =====
+@functools.lru_cache(maxsize=256)
 def check_response(response: bytes) -> bool:
+    # Ответы почти всегда одни и те же понги, поэтому проверенные кешируются
     assert len(response) in (4, 8), response
     return (_make_crc16(response[:-2]) == struct.unpack(">H", response[-2:])[0])
 
@@ -196,19 +316,44 @@ def _make_request(command: bytes) -> bytes:
     return request
 
 
-def _make_crc16(data: bytes) -> int:
-    crc = 0xFFFF
-    for byte in data:
-        crc = crc ^ byte
+def _make_crc16_table() -> Tuple[int, ...]:
+    table: List[int] = []
+    for byte in range(256):
+        crc = byte
         for _ in range(8):
             if crc & 0x0001 == 0:
                 crc = crc >> 1
             else:
                 crc = crc >> 1
                 crc = crc ^ 0xA001
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC16_TABLE = _make_crc16_table()
+
+
+def _make_crc16(data: bytes) -> int:
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC16_TABLE[(crc ^ byte) & 0xFF]
     return crc
 
 
+# =====
+_KEY_REQUESTS = {
+    (name, state): _make_request(KeyEvent(name, state).make_command())
+    for name in KEYMAP
+    for state in [False, True]
+}
+
+_MOUSE_BUTTON_REQUESTS = {
+    (name, state): _make_request(MouseButtonEvent(name, state).make_command())
+    for name in ["left", "right", "middle", "up", "down"]
+    for state in [False, True]
+}
+
+
 # =====
 REQUEST_PING = _make_request(b"\x01\x00\x00\x00\x00")
 REQUEST_REPEAT = _make_request(b"\x02\x00\x00\x00\x00")
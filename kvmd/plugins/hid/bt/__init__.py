@@ -79,6 +79,7 @@ class Plugin(BaseHid):  # pylint: disable=too-many-instance-attributes
         max_clients: int,
         socket_timeout: float,
         select_timeout: float,
+        queue_size: int,
     ) -> None:
 
         self.__proc: Optional[multiprocessing.Process] = None
@@ -99,6 +100,7 @@ class Plugin(BaseHid):  # pylint: disable=too-many-instance-attributes
             max_clients=max_clients,
             socket_timeout=socket_timeout,
             select_timeout=select_timeout,
+            queue_size=queue_size,
             notifier=self.__notifier,
             stop_event=self.__stop_event,
         )
@@ -118,9 +120,10 @@ class Plugin(BaseHid):  # pylint: disable=too-many-instance-attributes
             "control_public":   Option(True,  type=valid_bool),
             "unpair_on_close":  Option(True,  type=valid_bool),
 
-            "max_clients":    Option(1,   type=valid_int_f1),
-            "socket_timeout": Option(5.0, type=valid_float_f01),
-            "select_timeout": Option(1.0, type=valid_float_f01),
+            "max_clients":    Option(1,    type=valid_int_f1),
+            "socket_timeout": Option(5.0,  type=valid_float_f01),
+            "select_timeout": Option(1.0,  type=valid_float_f01),
+            "queue_size":     Option(1024, type=valid_int_f1),
         }
 
     def sysprep(self) -> None:
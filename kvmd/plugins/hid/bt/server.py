@@ -26,7 +26,6 @@ import multiprocessing
 import multiprocessing.synchronize
 import dataclasses
 import contextlib
-import queue
 
 from typing import Literal
 from typing import List
@@ -34,6 +33,7 @@ from typing import Dict
 from typing import Set
 from typing import Generator
 from typing import Optional
+from typing import Union
 
 from ....logging import get_logger
 
@@ -42,7 +42,13 @@ from .... import aiomulti
 
 from ....keyboard.mappings import OtgKey
 
+from .._events import coalesce_events
+
 from ..otg.events import BaseEvent
+from ..otg.events import EVENT_RECORD_FMT
+from ..otg.events import pack_event
+from ..otg.events import unpack_event
+from ..otg.events import MouseMoveEvent
 from ..otg.events import ClearEvent
 from ..otg.events import ResetEvent
 
@@ -88,6 +94,7 @@ class BtServer:  # pylint: disable=too-many-instance-attributes
         max_clients: int,
         socket_timeout: float,
         select_timeout: float,
+        queue_size: int,
 
         notifier: aiomulti.AioProcessNotifier,
         stop_event: multiprocessing.synchronize.Event,
@@ -105,9 +112,9 @@ class BtServer:  # pylint: disable=too-many-instance-attributes
         self.__stop_event = stop_event
 
         self.__clients: Dict[str, _BtClient] = {}
-        self.__to_read: Set[socket.socket] = set()
+        self.__to_read: Set[Union[socket.socket, aiomulti.SharedRing]] = set()
 
-        self.__events_queue: "multiprocessing.Queue[BaseEvent]" = multiprocessing.Queue()
+        self.__events_ring = aiomulti.SharedRing(EVENT_RECORD_FMT, queue_size)
 
         self.__state_flags = aiomulti.AioSharedFlags({
             "online": False,
@@ -135,16 +142,15 @@ class BtServer:  # pylint: disable=too-many-instance-attributes
     async def get_state(self) -> Dict:
         return (await self.__state_flags.get())
 
-    def queue_event(self, event: BaseEvent) -> None:
+    def queue_event(self, event: BaseEvent, clear: bool=False) -> None:
         if not self.__stop_event.is_set():
-            self.__events_queue.put_nowait(event)
+            if not self.__events_ring.put(*pack_event(event), clear=clear):
+                get_logger(0).error("HID events queue is overflowed, dropping %d events and releasing keys ...",
+                                    self.__events_ring.qsize() + 1)
+                self.__events_ring.put(*pack_event(ClearEvent()), clear=True)
 
     def clear_events(self) -> None:
-        # FIXME: Если очистка производится со стороны процесса хида, то возможна гонка между
-        # очисткой и добавлением события ClearEvent. Неприятно, но не смертельно.
-        # Починить блокировкой после перехода на асинхронные очереди.
-        tools.clear_queue(self.__events_queue)
-        self.queue_event(ClearEvent())
+        self.queue_event(ClearEvent(), clear=True)
 
     # =====
 
@@ -164,8 +170,7 @@ class BtServer:  # pylint: disable=too-many-instance-attributes
         server_int_sock: socket.socket,
     ) -> None:
 
-        qr = self.__events_queue._reader  # type: ignore  # pylint: disable=protected-access
-        self.__to_read = set([qr, server_ctl_sock, server_int_sock])
+        self.__to_read = set([self.__events_ring, server_ctl_sock, server_int_sock])
         self.__clients = {}
 
         while not self.__stop_event.is_set():
@@ -204,7 +209,7 @@ class BtServer:  # pylint: disable=too-many-instance-attributes
                         get_logger(0).exception("INT socket error on %s: %s", client.addr, tools.efmt(err))
                         self.__close_client("INT", client, "ctl_sock")
 
-            if qr in ready_read:
+            if self.__events_ring in ready_read:
                 self.__process_events()
 
     # =====
@@ -217,55 +222,50 @@ class BtServer:  # pylint: disable=too-many-instance-attributes
         )
 
     def __process_events(self) -> None:  # pylint: disable=too-many-branches
-        for _ in range(self.__events_queue.qsize()):
-            try:
-                event = self.__events_queue.get_nowait()
-            except queue.Empty:
-                break
-            else:
-                if isinstance(event, ResetEvent):
-                    self.__close_all_clients()
-                    return
+        for event in coalesce_events(list(map(unpack_event, self.__events_ring.get_all())), MouseMoveEvent, MouseRelativeEvent):
+            if isinstance(event, ResetEvent):
+                self.__close_all_clients()
+                return
+
+            elif isinstance(event, ClearEvent):
+                self.__clear_modifiers()
+                self.__clear_keys()
+                self.__mouse_buttons = 0
+                self.__send_keyboard_state()
+                self.__send_mouse_state(0, 0, 0)
+
+            elif isinstance(event, ModifierEvent):
+                if event.modifier in self.__modifiers:  # Ранее нажатый модификатор отжимаем
+                    self.__modifiers.remove(event.modifier)
+                    self.__send_keyboard_state()
+                if event.state:  # Нажимаем если нужно
+                    self.__modifiers.add(event.modifier)
+                    self.__send_keyboard_state()
 
-                elif isinstance(event, ClearEvent):
-                    self.__clear_modifiers()
+            elif isinstance(event, KeyEvent):
+                if event.key in self.__keys:  # Ранее нажатую клавишу отжимаем
+                    self.__keys[self.__keys.index(event.key)] = None
+                    self.__send_keyboard_state()
+                elif event.state and None not in self.__keys:  # Если слоты полны - отжимаем всё
                     self.__clear_keys()
-                    self.__mouse_buttons = 0
                     self.__send_keyboard_state()
+                if event.state:  # Нажимаем если нужно
+                    self.__keys[self.__keys.index(None)] = event.key
+                    self.__send_keyboard_state()
+
+            elif isinstance(event, MouseButtonEvent):
+                if event.code & self.__mouse_buttons:  # Ранее нажатую кнопку отжимаем
+                    self.__mouse_buttons &= ~event.code
                     self.__send_mouse_state(0, 0, 0)
+                if event.state:  # Нажимаем если нужно
+                    self.__mouse_buttons |= event.code
+                    self.__send_mouse_state(0, 0, 0)
+
+            elif isinstance(event, MouseRelativeEvent):
+                self.__send_mouse_state(event.delta_x, event.delta_y, 0)
 
-                elif isinstance(event, ModifierEvent):
-                    if event.modifier in self.__modifiers:  # Ранее нажатый модификатор отжимаем
-                        self.__modifiers.remove(event.modifier)
-                        self.__send_keyboard_state()
-                    if event.state:  # Нажимаем если нужно
-                        self.__modifiers.add(event.modifier)
-                        self.__send_keyboard_state()
-
-                elif isinstance(event, KeyEvent):
-                    if event.key in self.__keys:  # Ранее нажатую клавишу отжимаем
-                        self.__keys[self.__keys.index(event.key)] = None
-                        self.__send_keyboard_state()
-                    elif event.state and None not in self.__keys:  # Если слоты полны - отжимаем всё
-                        self.__clear_keys()
-                        self.__send_keyboard_state()
-                    if event.state:  # Нажимаем если нужно
-                        self.__keys[self.__keys.index(None)] = event.key
-                        self.__send_keyboard_state()
-
-                elif isinstance(event, MouseButtonEvent):
-                    if event.code & self.__mouse_buttons:  # Ранее нажатую кнопку отжимаем
-                        self.__mouse_buttons &= ~event.code
-                        self.__send_mouse_state(0, 0, 0)
-                    if event.state:  # Нажимаем если нужно
-                        self.__mouse_buttons |= event.code
-                        self.__send_mouse_state(0, 0, 0)
-
-                elif isinstance(event, MouseRelativeEvent):
-                    self.__send_mouse_state(event.delta_x, event.delta_y, 0)
-
-                elif isinstance(event, MouseWheelEvent):
-                    self.__send_mouse_state(0, 0, event.delta_y)
+            elif isinstance(event, MouseWheelEvent):
+                self.__send_mouse_state(0, 0, event.delta_y)
 
     def __send_keyboard_state(self) -> None:
         for client in list(self.__clients.values()):
@@ -91,12 +91,14 @@ class Plugin(BaseHid):  # pylint: disable=too-many-instance-attributes
                 "device":         Option("",  type=valid_abs_path, unpack_as="device_path"),
                 "select_timeout": Option(0.1, type=valid_float_f01),
                 "queue_timeout":  Option(0.1, type=valid_float_f01),
+                "queue_size":     Option(1024, type=valid_int_f1),
                 "write_retries":  Option(150, type=valid_int_f1),
             },
             "mouse": {
                 "device":             Option("",    type=valid_abs_path, unpack_as="device_path"),
                 "select_timeout":     Option(0.1,   type=valid_float_f01),
                 "queue_timeout":      Option(0.1,   type=valid_float_f01),
+                "queue_size":         Option(1024,  type=valid_int_f1),
                 "write_retries":      Option(150,   type=valid_int_f1),
                 "absolute":           Option(True,  type=valid_bool),
                 "absolute_win98_fix": Option(False, type=valid_bool),
@@ -106,6 +108,7 @@ class Plugin(BaseHid):  # pylint: disable=too-many-instance-attributes
                 "device":           Option("",   type=valid_abs_path, if_empty="", unpack_as="device_path"),
                 "select_timeout":   Option(0.1,  type=valid_float_f01),
                 "queue_timeout":    Option(0.1,  type=valid_float_f01),
+                "queue_size":       Option(1024, type=valid_int_f1),
                 "write_retries":    Option(150,  type=valid_int_f1),
                 # No absolute option here, initialized by (not mouse.absolute)
                 # Also no absolute_win98_fix
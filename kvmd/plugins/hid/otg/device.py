@@ -23,7 +23,6 @@
 import os
 import select
 import multiprocessing
-import queue
 import errno
 import time
 
@@ -37,7 +36,15 @@ from .... import aiomulti
 from .... import aioproc
 from .... import usb
 
+from .._events import coalesce_events
+
 from .events import BaseEvent
+from .events import ClearEvent
+from .events import EVENT_RECORD_FMT
+from .events import pack_event
+from .events import unpack_event
+from .events import MouseMoveEvent
+from .events import MouseRelativeEvent
 
 
 # =====
@@ -54,6 +61,7 @@ class BaseDeviceProcess(multiprocessing.Process):  # pylint: disable=too-many-in
         device_path: str,
         select_timeout: float,
         queue_timeout: float,
+        queue_size: int,
         write_retries: int,
         noop: bool,
     ) -> None:
@@ -72,7 +80,7 @@ class BaseDeviceProcess(multiprocessing.Process):  # pylint: disable=too-many-in
         self.__noop = noop
 
         self.__fd = -1
-        self.__events_queue: "multiprocessing.Queue[BaseEvent]" = multiprocessing.Queue()
+        self.__events_ring = aiomulti.SharedRing(EVENT_RECORD_FMT, queue_size)
         self.__state_flags = aiomulti.AioSharedFlags({"online": True, **initial_state}, notifier)
         self.__stop_event = multiprocessing.Event()
 
@@ -86,9 +94,11 @@ class BaseDeviceProcess(multiprocessing.Process):  # pylint: disable=too-many-in
                     if self.__ensure_device():
                         self.__read_all_reports()
 
-                    try:
-                        event = self.__events_queue.get(timeout=self.__queue_timeout)
-                    except queue.Empty:
+                    records = self.__events_ring.get_all()
+                    if not records and self.__events_ring.wait(self.__queue_timeout):
+                        records = self.__events_ring.get_all()
+
+                    if not records:
                         # Проблема в том, что устройство может отвечать EAGAIN или ESHUTDOWN,
                         # если оно было отключено физически. См:
                         #    - https://github.com/raspberrypi/linux/issues/3870
@@ -99,11 +109,12 @@ class BaseDeviceProcess(multiprocessing.Process):  # pylint: disable=too-many-in
                             self.__state_flags.update(online=False)
                     else:
                         # Посылка свежих репортов важнее старого
-                        for report in self._process_event(event):
-                            retries = self.__write_retries
-                            if self.__ensure_device():
-                                if self.__write_report(report):
-                                    retries = 0
+                        for event in coalesce_events(list(map(unpack_event, records)), MouseMoveEvent, MouseRelativeEvent):
+                            for report in self._process_event(event):
+                                retries = self.__write_retries
+                                if self.__ensure_device():
+                                    if self.__write_report(report):
+                                        retries = 0
                         continue
 
                     # Повторение последнего репорта до победного или пока не кончатся попытки
@@ -145,11 +156,12 @@ class BaseDeviceProcess(multiprocessing.Process):  # pylint: disable=too-many-in
         if self.is_alive() or self.exitcode is not None:
             self.join()
 
-    def _queue_event(self, event: BaseEvent) -> None:
-        self.__events_queue.put_nowait(event)
-
-    def _clear_queue(self) -> None:
-        tools.clear_queue(self.__events_queue)
+    def _queue_event(self, event: BaseEvent, clear: bool=False) -> None:
+        if not self.__events_ring.put(*pack_event(event), clear=clear):
+            # Процесс не успевает за клиентом: выбрасываем всё и отпускаем клавиши
+            get_logger().error("HID-%s events queue is overflowed, dropping %d events and releasing keys ...",
+                               self.__name, self.__events_ring.qsize() + 1)
+            self.__events_ring.put(*pack_event(ClearEvent()), clear=True)
 
     def _cleanup_write(self, report: bytes) -> None:
         assert not self.is_alive()
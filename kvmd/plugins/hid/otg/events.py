@@ -23,6 +23,7 @@
 import struct
 import dataclasses
 
+from typing import Tuple
 from typing import List
 from typing import Set
 from typing import Optional
@@ -33,6 +34,8 @@ from ....keyboard.mappings import KEYMAP
 
 from ....mouse import MouseRange
 
+from .... import tools
+
 
 # =====
 class BaseEvent:
@@ -104,6 +107,16 @@ def make_keyboard_report(
 
 
 # =====
+_MOUSE_BUTTONS_TO_CODES = {
+    "left":   0x1,
+    "right":  0x2,
+    "middle": 0x4,
+    "up":     0x8,  # Back
+    "down":   0x10,  # Forward
+}
+_MOUSE_CODES_TO_BUTTONS = tools.swapped_kvs(_MOUSE_BUTTONS_TO_CODES)
+
+
 @dataclasses.dataclass(frozen=True)
 class MouseButtonEvent(BaseEvent):
     button: str
@@ -111,13 +124,7 @@ class MouseButtonEvent(BaseEvent):
     code: int = 0
 
     def __post_init__(self) -> None:
-        object.__setattr__(self, "code", {
-            "left":   0x1,
-            "right":  0x2,
-            "middle": 0x4,
-            "up":     0x8,  # Back
-            "down":   0x10,  # Forward
-        }[self.button])
+        object.__setattr__(self, "code", _MOUSE_BUTTONS_TO_CODES[self.button])
 
 
 @dataclasses.dataclass(frozen=True)
@@ -179,3 +186,58 @@ def make_mouse_report(
         return struct.pack(("<BHHbb" if absolute else "<Bbbbb"), buttons, move_x, move_y, wheel_y, wheel_x)
     else:
         return struct.pack(("<BHHb" if absolute else "<Bbbb"), buttons, move_x, move_y, wheel_y)
+
+
+# =====
+EVENT_RECORD_FMT = "<BBhh"  # Kind, flag, first arg, second arg
+
+_KIND_CLEAR = 0
+_KIND_RESET = 1
+_KIND_KEY = 2
+_KIND_MODIFIER = 3
+_KIND_MOUSE_BUTTON = 4
+_KIND_MOUSE_MOVE = 5
+_KIND_MOUSE_RELATIVE = 6
+_KIND_MOUSE_WHEEL = 7
+
+
+def pack_event(event: BaseEvent) -> Tuple[int, int, int, int]:  # pylint: disable=too-many-return-statements
+    # Событие в компактную запись для aiomulti.SharedRing
+    if isinstance(event, ClearEvent):
+        return (_KIND_CLEAR, 0, 0, 0)
+    elif isinstance(event, ResetEvent):
+        return (_KIND_RESET, 0, 0, 0)
+    elif isinstance(event, KeyEvent):
+        return (_KIND_KEY, int(event.state), event.key.code, 0)
+    elif isinstance(event, ModifierEvent):
+        return (_KIND_MODIFIER, int(event.state), event.modifier.code, 0)
+    elif isinstance(event, MouseButtonEvent):
+        return (_KIND_MOUSE_BUTTON, int(event.state), event.code, 0)
+    elif isinstance(event, MouseMoveEvent):
+        return (_KIND_MOUSE_MOVE, int(event.win98_fix), event.to_x, event.to_y)
+    elif isinstance(event, MouseRelativeEvent):
+        return (_KIND_MOUSE_RELATIVE, 0, event.delta_x, event.delta_y)
+    elif isinstance(event, MouseWheelEvent):
+        return (_KIND_MOUSE_WHEEL, 0, event.delta_x, event.delta_y)
+    raise RuntimeError(f"Not implemented event: {event}")
+
+
+def unpack_event(record: Tuple[int, ...]) -> BaseEvent:  # pylint: disable=too-many-return-statements
+    (kind, flag, first, second) = record
+    if kind == _KIND_CLEAR:
+        return ClearEvent()
+    elif kind == _KIND_RESET:
+        return ResetEvent()
+    elif kind == _KIND_KEY:
+        return KeyEvent(OtgKey(first, False), bool(flag))
+    elif kind == _KIND_MODIFIER:
+        return ModifierEvent(OtgKey(first, True), bool(flag))
+    elif kind == _KIND_MOUSE_BUTTON:
+        return MouseButtonEvent(_MOUSE_CODES_TO_BUTTONS[first], bool(flag))
+    elif kind == _KIND_MOUSE_MOVE:
+        return MouseMoveEvent(first, second, bool(flag))
+    elif kind == _KIND_MOUSE_RELATIVE:
+        return MouseRelativeEvent(first, second)
+    elif kind == _KIND_MOUSE_WHEEL:
+        return MouseWheelEvent(first, second)
+    raise RuntimeError(f"Unknown event record: {record}")
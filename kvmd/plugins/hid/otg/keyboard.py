@@ -65,12 +65,10 @@ class KeyboardProcess(BaseDeviceProcess):
         self._cleanup_write(b"\x00" * 8)  # Release all keys and modifiers
 
     def send_clear_event(self) -> None:
-        self._clear_queue()
-        self._queue_event(ClearEvent())
+        self._queue_event(ClearEvent(), clear=True)
 
     def send_reset_event(self) -> None:
-        self._clear_queue()
-        self._queue_event(ResetEvent())
+        self._queue_event(ResetEvent(), clear=True)
 
     def send_key_events(self, keys: Iterable[Tuple[str, bool]]) -> None:
         for (key, state) in keys:
@@ -79,12 +79,10 @@ class MouseProcess(BaseDeviceProcess):
         self._cleanup_write(report)  # Release all buttons
 
     def send_clear_event(self) -> None:
-        self._clear_queue()
-        self._queue_event(ClearEvent())
+        self._queue_event(ClearEvent(), clear=True)
 
     def send_reset_event(self) -> None:
-        self._clear_queue()
-        self._queue_event(ResetEvent())
+        self._queue_event(ResetEvent(), clear=True)
 
     def send_button_event(self, button: str, state: bool) -> None:
         self._queue_event(MouseButtonEvent(button, state))
@@ -46,11 +46,11 @@ class _SerialPhyConnection(BasePhyConnection):
         self.__tty = tty
 
     def send(self, request: bytes) -> bytes:
-        assert len(request) == 8
+        assert len(request) >= 8
         assert request[0] == 0x33
         if self.__tty.in_waiting:
             self.__tty.read_all()
-        assert self.__tty.write(request) == 8
+        assert self.__tty.write(request) == len(request)
         data = self.__tty.read(4)
         if len(data) == 4:
             if data[0] == 0x34:  # New response protocol
@@ -61,7 +61,7 @@ class _SpiPhyConnection(BasePhyConnection):
         self.__read_timeout = read_timeout
 
     def send(self, request: bytes) -> bytes:
-        assert len(request) == 8
+        assert len(request) >= 8
         assert request[0] == 0x33
 
         deadline_ts = time.monotonic() + self.__read_timeout
@@ -21,19 +21,30 @@
 
 
 import os
+import asyncio
+import concurrent.futures
 import contextlib
+import stat
+import ctypes
+import hashlib
+import time
 
+from typing import Tuple
 from typing import Dict
 from typing import Type
+from typing import Callable
 from typing import AsyncGenerator
+from typing import TypeVar
 from typing import Optional
-
-import aiofiles
-import aiofiles.base
+from typing import Union
+from typing import Any
 
 from ...logging import get_logger
 
-from ... import aiofs
+from ... import libc
+
+from .decompressor import BaseDecompressor
+from .decompressor import make_decompressor
 
 from ...errors import OperationError
 from ...errors import IsBusyError
@@ -42,6 +53,13 @@ from .. import BasePlugin
 from .. import get_plugin_class
 
 
+# =====
+_RetvalT = TypeVar("_RetvalT")
+
+_SPARSE_BLOCK_SIZE = 64 * 1024
+_ZERO_BLOCK = bytes(_SPARSE_BLOCK_SIZE)
+
+
 # =====
 class MsdError(Exception):
     pass
@@ -86,6 +104,15 @@ class MsdImageExistsError(MsdOperationError):
         super().__init__("This image is already exists")
 
 
+class MsdImageCompressionError(MsdOperationError):
+    pass
+
+
+class MsdImageDigestError(MsdOperationError):
+    def __init__(self) -> None:
+        super().__init__("The SHA-256 of the written image doesn't match the expected one")
+
+
 class MsdMultiNotSupported(MsdOperationError):
     def __init__(self) -> None:
         super().__init__("This MSD does not support storing multiple images")
@@ -121,7 +148,7 @@ class BaseMsd(BasePlugin):
         raise NotImplementedError()
 
     @contextlib.asynccontextmanager
-    async def write_image(self, name: str, size: int) -> AsyncGenerator[int, None]:  # pylint: disable=unused-argument
+    async def write_image(self, name: str, size: int, sha256: str="", compression: str="") -> AsyncGenerator[int, None]:  # pylint: disable=unused-argument
         if self is not None:  # XXX: Vulture and pylint hack
             raise NotImplementedError()
         yield 1
@@ -133,20 +160,40 @@ class BaseMsd(BasePlugin):
         raise NotImplementedError()
 
 
-class MsdImageWriter:
-    def __init__(self, path: str, size: int, sync: int) -> None:
+class MsdImageWriter:  # pylint: disable=too-many-instance-attributes
+    # Пишет образ из отдельного потока большими буферами по sync байт. Пока один буфер
+    # уходит на диск, следующий наполняется из сети. Запись каждого буфера сразу
+    # отправляется в writeback, а предыдущий дожидается и выкидывается из page cache,
+    # чтобы многогигабайтная загрузка не вытесняла рабочие данные остальных сервисов.
+    # Сжатый образ распаковывается в том же потоке, а нулевые блоки в обычный файл
+    # не пишутся вовсе и остаются дырами.
+
+    def __init__(self, path: str, size: int, sync: int, compression: str="") -> None:
         self.__name = os.path.basename(path)
         self.__path = path
         self.__size = size
         self.__sync = sync
-
-        self.__file: Optional[aiofiles.base.AiofilesContextManager] = None
+        self.__compression = compression
+
+        self.__fd = -1
+        self.__sparse = False
+        self.__decompressor: Optional[BaseDecompressor] = None
+        self.__image_size = 0
+        self.__finished = False
+        self.__executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.__buf = bytearray()
+        self.__flushing: Optional[asyncio.Future] = None
+        self.__flushed = 0
         self.__written = 0
-        self.__unsynced = 0
+        self.__sha256 = hashlib.sha256()  # Считается по ходу записи, перечитывать образ не нужно
+        self.__upload_sha256 = (hashlib.sha256() if compression else None)
 
-    def get_file(self) -> aiofiles.base.AiofilesContextManager:
-        assert self.__file is not None
-        return self.__file
+        self.__prev_range: Optional[Tuple[int, int]] = None
+        self.__has_sync_range = True
+
+        self.__open_ts = 0.0
+        self.__io_time = 0.0
+        self.__stall_time = 0.0
 
     def get_state(self) -> Dict:
         return {
@@ -156,35 +203,206 @@ class MsdImageWriter:
         }
 
     async def open(self) -> "MsdImageWriter":
-        assert self.__file is None
-        get_logger(1).info("Writing %r image (%d bytes) to MSD ...", self.__name, self.__size)
-        self.__file = await aiofiles.open(self.__path, mode="w+b", buffering=0)  # type: ignore
+        assert self.__executor is None
+        if self.__compression:
+            self.__decompressor = make_decompressor(self.__compression)
+            get_logger(1).info("Writing %r image (%d bytes, %s) to MSD ...", self.__name, self.__size, self.__compression)
+        else:
+            get_logger(1).info("Writing %r image (%d bytes) to MSD ...", self.__name, self.__size)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="kvmd-msd-writer")
+        try:
+            await self.__run(self.__inner_open)
+        except Exception:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+            raise
+        self.__open_ts = time.monotonic()
         return self
 
     async def write(self, chunk: bytes) -> int:
-        assert self.__file is not None
-
-        await self.__file.write(chunk)  # type: ignore
+        assert self.__fd >= 0
+        self.__buf += chunk
         self.__written += len(chunk)
-
-        self.__unsynced += len(chunk)
-        if self.__unsynced >= self.__sync:
-            await aiofs.afile_sync(self.__file)
-            self.__unsynced = 0
-
+        if len(self.__buf) >= self.__sync:
+            await self.__flush(wait=False)
         return self.__written
 
+    async def finish(self) -> None:
+        # Дописывает все данные и проверяет целостность сжатого потока,
+        # после чего можно получить хеш и итоговый размер образа.
+        assert self.__fd >= 0
+        await self.__flush(wait=True)
+        if not self.__finished:
+            await self.__run(self.__inner_finish)
+            self.__finished = True
+
+    def get_sha256(self) -> str:
+        # Хеш записанного образа, для сжатого - уже распакованного
+        assert self.__finished
+        return self.__sha256.hexdigest()
+
+    def get_upload_sha256(self) -> str:
+        # Хеш принятых данных для сверки с ожидаемым клиентом, для сжатого образа - хеш архива
+        assert self.__finished
+        if self.__upload_sha256 is not None:
+            return self.__upload_sha256.hexdigest()
+        return self.__sha256.hexdigest()
+
+    def get_image_size(self) -> int:
+        return self.__image_size
+
+    async def write_at(self, offset: int, data: bytes) -> None:
+        # Запись служебных данных вне основного потока, например метаданных в конец устройства
+        assert self.__fd >= 0
+        await self.__flush(wait=True)
+        await self.__run(self.__inner_write_at, offset, data)
+
     async def close(self) -> None:
-        assert self.__file is not None
-        if self.__written == self.__size:
-            (log, result) = (get_logger().info, "OK")
-        elif self.__written < self.__size:
-            (log, result) = (get_logger().error, "INCOMPLETE")
-        else:  # written > size
-            (log, result) = (get_logger().warning, "OVERFLOW")
-        log("Written %d of %d bytes to MSD image %r: %s", self.__written, self.__size, self.__name, result)
-        await aiofs.afile_sync(self.__file)
-        await self.__file.close()  # type: ignore
+        assert self.__executor is not None
+        try:
+            if self.__written == self.__size:
+                (log, result) = (get_logger().info, "OK")
+            elif self.__written < self.__size:
+                (log, result) = (get_logger().error, "INCOMPLETE")
+            else:  # written > size
+                (log, result) = (get_logger().warning, "OVERFLOW")
+            log("Written %d of %d bytes to MSD image %r: %s", self.__written, self.__size, self.__name, result)
+            if self.__fd >= 0:
+                try:
+                    await self.__flush(wait=True)
+                finally:
+                    await self.__run(self.__inner_close)
+                self.__log_stats()
+        finally:
+            self.__executor.shutdown(wait=False)
+
+    # =====
+
+    async def __flush(self, wait: bool) -> None:
+        if self.__flushing is not None:
+            # Предыдущий буфер еще пишется - сеть ждет диск
+            if not self.__flushing.done():
+                start_ts = time.monotonic()
+                await asyncio.wait([self.__flushing])
+                self.__stall_time += time.monotonic() - start_ts
+            (flushing, self.__flushing) = (self.__flushing, None)
+            flushing.result()
+        if self.__buf:
+            (buf, self.__buf) = (self.__buf, bytearray())
+            self.__flushed += len(buf)
+            self.__flushing = self.__run(self.__inner_write, buf)
+            if wait:
+                await self.__flush(wait=False)
+
+    def __run(self, func: Callable[..., _RetvalT], *args: Any) -> "asyncio.Future[_RetvalT]":
+        return asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+    def __log_stats(self) -> None:
+        elapsed = max(time.monotonic() - self.__open_ts, 0.001)
+        get_logger().info(
+            "MSD image %r write stats: %.2f MiB/s average, %.2f sec in disk I/O, %.2f sec waiting for disk;"
+            " %d bytes received, %d bytes of image",
+            self.__name, self.__flushed / elapsed / 1048576, self.__io_time, self.__stall_time,
+            self.__flushed, self.__image_size,
+        )
+
+    # ===== Writer thread
+
+    def __inner_open(self) -> None:
+        self.__fd = os.open(self.__path, (os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC), 0o666)
+        # Дыры допустимы только в свежем обычном файле. На блочном устройстве
+        # пропущенные блоки сохранили бы старые данные.
+        self.__sparse = stat.S_ISREG(os.fstat(self.__fd).st_mode)
+
+    def __inner_write(self, buf: bytearray) -> None:
+        start_ts = time.monotonic()
+        offset = self.__image_size
+        if self.__decompressor is not None:
+            assert self.__upload_sha256 is not None
+            self.__upload_sha256.update(buf)
+            self.__decompressor.decompress(bytes(buf), self.__inner_write_image)
+        else:
+            self.__inner_write_image(buf)
+        self.__sync_written(offset, self.__image_size - offset)
+        self.__io_time += time.monotonic() - start_ts
+
+    def __inner_finish(self) -> None:
+        if self.__decompressor is not None:
+            offset = self.__image_size
+            if not self.__decompressor.finish(self.__inner_write_image):
+                raise MsdImageCompressionError("The compressed image is truncated")
+            self.__sync_written(offset, self.__image_size - offset)
+
+    def __inner_write_image(self, data: Union[bytes, bytearray]) -> None:
+        offset = self.__image_size
+        self.__image_size += len(data)
+        self.__sha256.update(data)
+        if not self.__sparse:
+            self.__inner_pwrite(offset, data)
+            return
+        view = memoryview(data)
+        begin = pos = 0
+        while pos < len(data):
+            # Блоки выровнены по смещению в файле, чтобы пропуск превращался в дыру в ФС
+            end = min(len(data), pos + _SPARSE_BLOCK_SIZE - (offset + pos) % _SPARSE_BLOCK_SIZE)
+            if data[pos:end] == (_ZERO_BLOCK if end - pos == _SPARSE_BLOCK_SIZE else bytes(end - pos)):
+                if begin < pos:
+                    self.__inner_pwrite(offset + begin, view[begin:pos])
+                begin = end
+            pos = end
+        if begin < len(data):
+            self.__inner_pwrite(offset + begin, view[begin:])
+
+    def __sync_written(self, offset: int, length: int) -> None:
+        if length <= 0:
+            return
+        if self.__sync_range(offset, length, libc.SYNC_FILE_RANGE_WRITE):
+            if self.__prev_range is not None:
+                (prev_offset, prev_length) = self.__prev_range
+                if self.__sync_range(prev_offset, prev_length, (
+                    libc.SYNC_FILE_RANGE_WAIT_BEFORE
+                    | libc.SYNC_FILE_RANGE_WRITE
+                    | libc.SYNC_FILE_RANGE_WAIT_AFTER
+                )):
+                    os.posix_fadvise(self.__fd, prev_offset, prev_length, os.POSIX_FADV_DONTNEED)
+            self.__prev_range = (offset, length)
+        else:
+            os.fdatasync(self.__fd)
+
+    def __inner_write_at(self, offset: int, data: bytes) -> None:
+        self.__inner_pwrite(offset, data)
+        os.fsync(self.__fd)
+
+    def __inner_close(self) -> None:
+        try:
+            start_ts = time.monotonic()
+            if self.__sparse:
+                os.ftruncate(self.__fd, self.__image_size)  # Нулевой хвост образа тоже остается дырой
+            os.fsync(self.__fd)
+            os.posix_fadvise(self.__fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            self.__io_time += time.monotonic() - start_ts
+        finally:
+            os.close(self.__fd)
+            self.__fd = -1
+
+    def __inner_pwrite(self, offset: int, data: Union[bytes, bytearray, memoryview]) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.__fd, view, offset)
+            offset += written
+            view = view[written:]
+
+    def __sync_range(self, offset: int, length: int, flags: int) -> bool:
+        # Некоторые ФС и устройства не умеют sync_file_range(), тогда откатываемся на fdatasync()
+        if self.__has_sync_range:
+            if libc.sync_file_range(self.__fd, offset, length, flags) == 0:
+                return True
+            get_logger().warning(
+                "Can't use sync_file_range() for MSD image %r: %s; falling back to fdatasync()",
+                self.__name, os.strerror(ctypes.get_errno()),
+            )
+            self.__has_sync_range = False
+        return False
 
 
 # =====
@@ -0,0 +1,139 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import zlib
+import lzma
+
+from typing import Tuple
+from typing import Callable
+from typing import Any
+
+import zstandard
+
+
+# =====
+_OUT_CHUNK_SIZE = 1024 * 1024
+
+_XZ_MEMLIMIT = 256 * 1024 * 1024  # xz -9 требует 65 MiB, с запасом на --lzma2=dict=...
+_ZSTD_MAX_WINDOW_SIZE = 128 * 1024 * 1024  # Значение по умолчанию zstd --long=27
+_ZSTD_IN_CHUNK_SIZE = 1024
+
+_SUFFIXES = {
+    ".gz": "gzip",
+    ".xz": "xz",
+    ".zst": "zstd",
+}
+
+
+def split_image_compression(name: str) -> Tuple[str, str]:
+    for (suffix, compression) in _SUFFIXES.items():
+        if name.lower().endswith(suffix) and len(name) > len(suffix):
+            return (name[:-len(suffix)], compression)
+    return (name, "")
+
+
+# =====
+class BaseDecompressor:
+    def decompress(self, data: bytes, sink: Callable[[bytes], None]) -> None:
+        raise NotImplementedError()
+
+    def finish(self, sink: Callable[[bytes], None]) -> bool:
+        # Возвращает False, если сжатый поток оборван
+        raise NotImplementedError()
+
+
+class _StdlibDecompressor(BaseDecompressor):
+    # Общая обвязка для zlib и lzma: выход режется на куски по _OUT_CHUNK_SIZE,
+    # чтобы сжатый гигабайт нулей не превращался в гигабайт памяти,
+    # а склеенные потоки (pigz, pxz) разбираются один за другим.
+
+    def __init__(self, make: Callable[[], Any]) -> None:
+        self.__make = make
+        self.__obj = make()
+
+    def decompress(self, data: bytes, sink: Callable[[bytes], None]) -> None:
+        while True:
+            if self.__obj.eof:
+                if not data.strip(b"\0"):
+                    return  # Выравнивание нулями после потока, как его понимает gzip
+                self.__obj = self.__make()
+            out = self.__obj.decompress(data, _OUT_CHUNK_SIZE)
+            if out:
+                sink(out)
+            if self.__obj.eof:
+                data = self.__obj.unused_data
+            elif self.__is_drained(out):
+                return
+            else:
+                data = getattr(self.__obj, "unconsumed_tail", b"")  # Lzma хранит недоеденный вход у себя
+
+    def finish(self, sink: Callable[[bytes], None]) -> bool:
+        _ = sink
+        return self.__obj.eof
+
+    def __is_drained(self, out: bytes) -> bool:
+        if isinstance(self.__obj, lzma.LZMADecompressor):
+            return self.__obj.needs_input
+        return (not self.__obj.unconsumed_tail and len(out) < _OUT_CHUNK_SIZE)
+
+
+class _ZstdDecompressor(BaseDecompressor):
+    # Каждый кадр разбирается своим decompressobj(), чтобы по его eof было видно,
+    # дописан ли кадр до конца. Выход decompressobj() ничем не ограничен,
+    # поэтому вход скармливается мелкими порциями: даже RLE-блок из нулей
+    # дает с _ZSTD_IN_CHUNK_SIZE не больше нескольких десятков мегабайт.
+
+    def __init__(self) -> None:
+        self.__ctx = zstandard.ZstdDecompressor(max_window_size=_ZSTD_MAX_WINDOW_SIZE)
+        self.__obj = self.__make()
+
+    def decompress(self, data: bytes, sink: Callable[[bytes], None]) -> None:
+        view = memoryview(data)
+        while view:
+            if self.__obj.eof:
+                if not bytes(view).strip(b"\0"):
+                    return
+                self.__obj = self.__make()
+            part = view[:_ZSTD_IN_CHUNK_SIZE]
+            view = view[_ZSTD_IN_CHUNK_SIZE:]
+            out = self.__obj.decompress(part)
+            if out:
+                sink(out)
+            if self.__obj.eof and self.__obj.unused_data:
+                view = memoryview(self.__obj.unused_data + bytes(view))
+
+    def finish(self, sink: Callable[[bytes], None]) -> bool:
+        _ = sink
+        return self.__obj.eof
+
+    def __make(self) -> Any:
+        return self.__ctx.decompressobj(write_size=_OUT_CHUNK_SIZE, read_across_frames=False)
+
+
+def make_decompressor(compression: str) -> BaseDecompressor:
+    if compression == "gzip":
+        return _StdlibDecompressor(lambda: zlib.decompressobj(zlib.MAX_WBITS | 16))
+    elif compression == "xz":
+        return _StdlibDecompressor(lambda: lzma.LZMADecompressor(lzma.FORMAT_AUTO, memlimit=_XZ_MEMLIMIT))
+    elif compression == "zstd":
+        return _ZstdDecompressor()
+    raise RuntimeError(f"Unknown compression: {compression}")
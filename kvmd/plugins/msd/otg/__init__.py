@@ -29,12 +29,14 @@ import time
 
 from typing import List
 from typing import Dict
+from typing import Set
 from typing import AsyncGenerator
 from typing import Optional
 
 from ....logging import get_logger
 
 from ....inotify import InotifyMask
+from ....inotify import InotifyEvent
 from ....inotify import Inotify
 
 from ....yamlconf import Option
@@ -55,6 +57,7 @@ from .. import MsdDisconnectedError
 from .. import MsdImageNotSelected
 from .. import MsdUnknownImageError
 from .. import MsdImageExistsError
+from .. import MsdImageDigestError
 from .. import BaseMsd
 from .. import MsdImageWriter
 
@@ -71,6 +74,7 @@ class _DriveImage:
     path: str
     size: int
     complete: bool
+    sha256: str
     in_storage: bool
 
 
@@ -306,7 +310,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
             self.__state.vd.connected = connected
 
     @contextlib.asynccontextmanager
-    async def write_image(self, name: str, size: int) -> AsyncGenerator[int, None]:
+    async def write_image(self, name: str, size: int, sha256: str="", compression: str="") -> AsyncGenerator[int, None]:
         try:
             async with self.__state._region:  # pylint: disable=protected-access
                 try:
@@ -324,11 +328,22 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
 
                         await self.__remount_storage(rw=True)
                         self.__set_image_complete(name, False)
+                        self.__set_image_sha256(name, "")
 
-                        self.__new_writer = await MsdImageWriter(path, size, self.__sync_chunk_size).open()
+                        self.__new_writer = await MsdImageWriter(path, size, self.__sync_chunk_size, compression).open()
 
                     await self.__notifier.notify()
                     yield self.__upload_chunk_size
+
+                    assert self.__new_writer
+                    await self.__new_writer.finish()
+                    digest = self.__new_writer.get_upload_sha256()
+                    if sha256 and digest != sha256:
+                        get_logger(0).error("SHA-256 mismatch for MSD image %r: expected %s, got %s", name, sha256, digest)
+                        await self.__close_new_writer()
+                        os.remove(path)
+                        raise MsdImageDigestError()
+                    self.__set_image_sha256(name, self.__new_writer.get_sha256())
                     self.__set_image_complete(name, True)
 
                 finally:
@@ -340,7 +355,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
         finally:
             # Между закрытием файла и эвентом айнотифи состояние может быть не обновлено,
             # так что форсим обновление вручную, чтобы получить актуальное состояние.
-            await self.__reload_state()
+            await self.__reload_state({name})
             await self.__notifier.notify()
 
     async def write_image_chunk(self, chunk: bytes) -> int:
@@ -374,6 +389,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
             await self.__remount_storage(rw=True)
             os.remove(image.path)
             self.__set_image_complete(name, False)
+            self.__set_image_sha256(name, "")
             await self.__remount_storage(rw=False)
 
     # =====
@@ -414,6 +430,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
                     while self.__state.vd:  # Если живы после предыдущей проверки
                         need_restart = False
                         need_reload_state = False
+                        changed: Optional[Set[str]] = set()
                         for event in (await inotify.get_series(timeout=1)):
                             need_reload_state = True
                             if event.mask & (InotifyMask.DELETE_SELF | InotifyMask.MOVE_SELF | InotifyMask.UNMOUNT):
@@ -421,15 +438,37 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
                                 logger.warning("Got fatal inotify event: %s; reinitializing MSD ...", event)
                                 need_restart = True
                                 break
+                            if event.mask & InotifyMask.Q_OVERFLOW:
+                                logger.warning("Got inotify queue overflow; rescanning MSD storage ...")
+                                changed = None
+                            elif changed is not None:
+                                changed = self.__get_changed_images(event, changed)
                         if need_restart:
                             break
                         if need_reload_state:
-                            await self.__reload_state()
+                            await self.__reload_state(changed)
                             await self.__notifier.notify()
             except Exception:
                 logger.exception("Unexpected MSD watcher error")
 
-    async def __reload_state(self) -> None:
+    def __get_changed_images(self, event: InotifyEvent, changed: Set[str]) -> Optional[Set[str]]:
+        # Превращаем эвент в имя образа, который нужно перечитать. Изменения в sysfs
+        # касаются только привода, который перечитывается всегда, а непонятные эвенты
+        # на самих каталогах хранилища (None) приводят к полному пересканированию.
+        parent = os.path.dirname(event.path)
+        if parent == self.__images_path and event.name:
+            changed.add(event.name)
+        elif parent == self.__meta_path and event.name:
+            for suffix in [".complete", ".sha256"]:
+                if event.name.endswith(suffix):
+                    changed.add(event.name[:-len(suffix)])
+        elif event.path in [self.__images_path, self.__meta_path]:
+            return None
+        return changed
+
+    async def __reload_state(self, changed: Optional[Set[str]]=None) -> None:
+        # Если переданы имена образов, то перечитываются только они,
+        # иначе хранилище сканируется полностью.
         logger = get_logger(0)
         async with self.__state._lock:  # pylint: disable=protected-access
             try:
@@ -446,7 +485,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
                     await self.__remount_storage(rw=False)
                     await self.__setup_initial()
 
-                storage_state = self.__get_storage_state()
+                storage_state = self.__get_storage_state(changed)
             except Exception:
                 logger.exception("Error while reloading MSD state; switching to offline")
                 self.__state.storage = None
@@ -487,20 +526,21 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
 
     # =====
 
-    def __get_storage_state(self) -> _StorageState:
-        images: Dict[str, _DriveImage] = {}
-        for name in os.listdir(self.__images_path):
-            path = os.path.join(self.__images_path, name)
-            if os.path.exists(path):
-                size = fs.get_file_size(path)
-                if size >= 0:
-                    images[name] = _DriveImage(
-                        name=name,
-                        path=path,
-                        size=size,
-                        complete=self.__is_image_complete(name),
-                        in_storage=True,
-                    )
+    def __get_storage_state(self, changed: Optional[Set[str]]) -> _StorageState:
+        images: Dict[str, _DriveImage]
+        names: Set[str]
+        if changed is None or self.__state.storage is None:
+            images = {}
+            names = set(os.listdir(self.__images_path))
+        else:
+            images = dict(self.__state.storage.images)
+            names = changed
+        for name in names:
+            image = self.__get_storage_image(name)
+            if image is None:
+                images.pop(name, None)
+            else:
+                images[name] = image
         space = fs.get_fs_space(self.__storage_path, fatal=True)
         assert space
         return _StorageState(
@@ -509,6 +549,21 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
             images=images,
         )
 
+    def __get_storage_image(self, name: str) -> Optional[_DriveImage]:
+        path = os.path.join(self.__images_path, name)
+        if os.path.exists(path):
+            size = fs.get_file_size(path)
+            if size >= 0:
+                return _DriveImage(
+                    name=name,
+                    path=path,
+                    size=size,
+                    complete=self.__is_image_complete(name),
+                    sha256=self.__get_image_sha256(name),
+                    in_storage=True,
+                )
+        return None
+
     def __get_drive_state(self) -> _DriveState:
         image: Optional[_DriveImage] = None
         path = self.__drive.get_image_path()
@@ -520,6 +575,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
                 path=path,
                 size=max(fs.get_file_size(path), 0),
                 complete=(self.__is_image_complete(name) if in_storage else True),
+                sha256=(self.__get_image_sha256(name) if in_storage else ""),
                 in_storage=in_storage,
             )
         return _DriveState(
@@ -541,6 +597,22 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
             if os.path.exists(path):
                 os.remove(path)
 
+    def __get_image_sha256(self, name: str) -> str:
+        try:
+            with open(os.path.join(self.__meta_path, name + ".sha256")) as sha256_file:
+                return sha256_file.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def __set_image_sha256(self, name: str, sha256: str) -> None:
+        path = os.path.join(self.__meta_path, name + ".sha256")
+        if sha256:
+            with open(path, "w") as sha256_file:
+                sha256_file.write(sha256 + "\n")
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+
     # =====
 
     async def __remount_storage(self, rw: bool) -> None:
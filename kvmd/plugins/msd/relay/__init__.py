@@ -49,6 +49,7 @@ from .. import MsdConnectedError
 from .. import MsdDisconnectedError
 from .. import MsdMultiNotSupported
 from .. import MsdCdromNotSupported
+from .. import MsdImageDigestError
 from .. import BaseMsd
 from .. import MsdImageWriter
 
@@ -208,7 +209,7 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
                 self.__connected = connected
 
     @contextlib.asynccontextmanager
-    async def write_image(self, name: str, size: int) -> AsyncGenerator[int, None]:
+    async def write_image(self, name: str, size: int, sha256: str="", compression: str="") -> AsyncGenerator[int, None]:
         async with self.__working():
             async with self.__region:
                 try:
@@ -216,11 +217,19 @@ class Plugin(BaseMsd):  # pylint: disable=too-many-instance-attributes
                     if self.__connected:
                         raise MsdConnectedError()
 
-                    self.__device_writer = await MsdImageWriter(self.__device_info.path, size, self.__sync_chunk_size).open()
+                    self.__device_writer = await MsdImageWriter(self.__device_info.path, size, self.__sync_chunk_size, compression).open()
 
                     await self.__write_image_info(False)
                     await self.__notifier.notify()
                     yield self.__upload_chunk_size
+
+                    assert self.__device_writer
+                    await self.__device_writer.finish()
+                    digest = self.__device_writer.get_upload_sha256()
+                    if sha256 and digest != sha256:
+                        # На устройстве остается образ, помеченный как незавершенный
+                        get_logger(0).error("SHA-256 mismatch for MSD image %r: expected %s, got %s", name, sha256, digest)
+                        raise MsdImageDigestError()
                     await self.__write_image_info(True)
                 finally:
                     await self.__close_device_writer()
@@ -30,7 +30,6 @@ from typing import IO
 from typing import Optional
 
 from .... import aiotools
-from .... import aiofs
 
 from .. import MsdImageWriter
 
@@ -122,15 +121,11 @@ class DeviceInfo:
         )
 
     async def write_image_info(self, device_writer: MsdImageWriter, complete: bool) -> bool:
-        device_file = device_writer.get_file()
         state = device_writer.get_state()
-        image_info = ImageInfo(state["name"], state["written"], complete)
+        image_info = ImageInfo(state["name"], device_writer.get_image_size(), complete)
 
         if self.size - image_info.size > _IMAGE_INFO_SIZE:
-            await device_file.seek(self.size - _IMAGE_INFO_SIZE)  # type: ignore
-            await device_file.write(image_info.to_bytes())  # type: ignore
-            await aiofs.afile_sync(device_file)
-            await device_file.seek(0)  # type: ignore
+            await device_writer.write_at(self.size - _IMAGE_INFO_SIZE, image_info.to_bytes())
             return True
         return False  # Device is full
 
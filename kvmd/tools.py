@@ -30,6 +30,8 @@ from typing import List
 from typing import Dict
 from typing import Hashable
 from typing import TypeVar
+from typing import Optional
+from typing import Any
 
 
 # =====
@@ -52,6 +54,40 @@ def merge(dest: Dict, src: Dict) -> None:
         dest[key] = src[key]
 
 
+def make_merge_patch(src: Dict, dest: Dict) -> Optional[Dict]:
+    # RFC 7386: JSON merge patch which turns src into dest.
+    # The null value means removal of the key, so there is no way to set a value to null.
+    # In this case None is returned and the caller should use dest as is.
+    patch: Dict = {}
+    for key in src:
+        if key not in dest:
+            patch[key] = None
+    for (key, value) in dest.items():
+        if key in src:
+            old = src[key]
+            if isinstance(old, dict) and isinstance(value, dict):
+                sub = make_merge_patch(old, value)
+                if sub is None:
+                    return None
+                if sub:
+                    patch[key] = sub
+                continue
+            if type(old) is type(value) and old == value:
+                continue
+        if not _is_merge_patchable(value):
+            return None
+        patch[key] = value
+    return patch
+
+
+def _is_merge_patchable(value: Any) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, dict):
+        return all(map(_is_merge_patchable, value.values()))
+    return True
+
+
 def rget(dct: Dict, *keys: Hashable) -> Dict:
     result = functools.reduce((lambda nxt, key: nxt.get(key, {})), keys, dct)
     if not isinstance(result, dict):
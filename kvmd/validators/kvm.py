@@ -25,6 +25,7 @@ from typing import Any
 
 from . import raise_error
 from . import check_string_in_list
+from . import check_re_match
 
 from .basic import valid_stripped_string_not_empty
 from .basic import valid_number
@@ -45,6 +46,10 @@ def valid_msd_image_name(arg: Any) -> str:
     return valid_printable_filename(arg, name="MSD image name")  # pragma: nocover
 
 
+def valid_msd_image_sha256(arg: Any) -> str:
+    return check_re_match(arg, "MSD image SHA-256", r"^[0-9a-fA-F]{64}$").lower()
+
+
 def valid_info_fields(arg: Any, variants: Set[str]) -> Set[str]:
     return set(valid_string_list(
         arg=str(arg).strip(),
@@ -0,0 +1,90 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+# Requests per second of the MCU HID protocol encoder/checker:
+# the old bit-by-bit CRC16 against the table-driven one with cached requests.
+#
+#     python -m testenv.benchmarks.hid_mcu_proto
+
+
+import struct
+import timeit
+
+from typing import Callable
+
+from kvmd.keyboard.mappings import KEYMAP
+
+from kvmd.plugins.hid._mcu import proto
+
+
+# =====
+def _make_crc16_bitwise(data: bytes) -> int:
+    crc = 0xFFFF
+    for byte in data:
+        crc = crc ^ byte
+        for _ in range(8):
+            if crc & 0x0001 == 0:
+                crc = crc >> 1
+            else:
+                crc = crc >> 1
+                crc = crc ^ 0xA001
+    return crc
+
+
+def _make_request_bitwise(command: bytes) -> bytes:
+    request = b"\x33" + command
+    return request + struct.pack(">H", _make_crc16_bitwise(request))
+
+
+def _check_response_bitwise(response: bytes) -> bool:
+    return (_make_crc16_bitwise(response[:-2]) == struct.unpack(">H", response[-2:])[0])
+
+
+def _bench(name: str, func: Callable[[], None], number: int, requests: int) -> float:
+    rps = number * requests / min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{name:<24} {rps:>12.0f} req/s")
+    return rps
+
+
+def main() -> None:
+    events = [proto.KeyEvent(name, state) for name in KEYMAP for state in [False, True]]
+    response = proto.RESPONSE_LEGACY_OK[:2] + b"\x00\x00\x00\x00"
+    response += struct.pack(">H", _make_crc16_bitwise(response))
+    number = 10
+
+    def old_cycle() -> None:
+        for event in events:
+            _make_request_bitwise(event.make_command())
+            _check_response_bitwise(response)
+
+    def new_cycle() -> None:
+        for event in events:
+            event.make_request()
+            proto.check_response(response)
+
+    old = _bench("bitwise", old_cycle, number, len(events))
+    new = _bench("table + cache", new_cycle, number, len(events))
+    print(f"speedup: x{new / old:.1f}")
+
+
+if __name__ == "__main__":
+    main()
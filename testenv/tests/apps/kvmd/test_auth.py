@@ -21,7 +21,9 @@
 
 
 import os
+import asyncio
 import contextlib
+import time
 
 from typing import List
 from typing import Dict
@@ -51,6 +53,11 @@ async def _get_configured_manager(
     internal_path: str,
     external_path: str="",
     force_internal_users: Optional[List[str]]=None,
+    cache_ttl: float=0.0,
+    cache_fail_limit: int=0,
+    cache_fail_delay: float=0.0,
+    tokens_lifetime: float=0.0,
+    tokens_storage_path: str="",
 ) -> AsyncGenerator[AuthManager, None]:
 
     manager = AuthManager(
@@ -60,6 +67,13 @@ async def _get_configured_manager(
         external_kwargs=(_make_service_kwargs(external_path) if external_path else {}),
         force_internal_users=(force_internal_users or []),
         enabled=True,
+        cache_ttl=cache_ttl,
+        cache_fail_limit=cache_fail_limit,
+        cache_fail_window=60.0,
+        cache_fail_delay=cache_fail_delay,
+        tokens_idle_timeout=0.0,
+        tokens_lifetime=tokens_lifetime,
+        tokens_storage_path=tokens_storage_path,
     )
 
     try:
@@ -138,6 +152,97 @@ async def test_ok__external(tmpdir) -> None:  # type: ignore
         assert manager.check(token) is None
 
 
+@pytest.mark.asyncio
+async def test_ok__cache(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("htpasswd")))
+
+    htpasswd = passlib.apache.HtpasswdFile(path, new=True)
+    htpasswd.set_password("admin", "pass")
+    htpasswd.save()
+
+    async with _get_configured_manager(path, cache_ttl=60.0, cache_fail_limit=3, cache_fail_delay=0.5) as manager:
+        assert (await manager.authorize("admin", "pass"))
+        assert (await manager.authorize("admin", "pass"))
+
+        htpasswd.set_password("admin", "newpass")
+        htpasswd.save()
+        os.utime(path, ns=(0, 0))  # Make sure that the revision has been changed
+        assert not (await manager.authorize("admin", "pass"))
+        assert (await manager.authorize("admin", "newpass"))
+
+        for passwd in ["foo", "bar", "baz"]:
+            assert not (await manager.authorize("admin", passwd))
+        assert (await manager.authorize("admin", "newpass"))  # Cached
+        assert (await manager.login("admin", "newpass")) is not None
+
+        htpasswd.save()
+        os.utime(path, ns=(1, 1))
+        start_ts = time.monotonic()
+        assert (await manager.authorize("admin", "newpass"))  # Delayed but not rejected
+        assert time.monotonic() - start_ts >= 0.5
+
+        start_ts = time.monotonic()
+        assert not (await manager.authorize("admin", "foo"))  # The success has reset the counter
+        assert time.monotonic() - start_ts < 0.5
+
+
+@pytest.mark.asyncio
+async def test_ok__cache_parallel_fails(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("htpasswd")))
+
+    htpasswd = passlib.apache.HtpasswdFile(path, new=True)
+    htpasswd.set_password("admin", "pass")
+    htpasswd.save()
+
+    async with _get_configured_manager(path, cache_fail_limit=1, cache_fail_delay=0.3) as manager:
+        assert not (await manager.authorize("admin", "foo"))
+
+        start_ts = time.monotonic()
+        oks = await asyncio.gather(*[
+            manager.authorize("admin", passwd)
+            for passwd in ["bar", "baz", "qux"]
+        ])
+        assert oks == [False, False, False]
+        assert time.monotonic() - start_ts >= 0.9  # One by one, each is delayed
+
+        start_ts = time.monotonic()
+        assert not (await manager.authorize("user", "foo"))  # Other users are not affected
+        assert time.monotonic() - start_ts < 0.3
+
+
+@pytest.mark.asyncio
+async def test_ok__tokens(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("htpasswd")))
+    storage_path = os.path.abspath(str(tmpdir.join("sessions")))
+
+    htpasswd = passlib.apache.HtpasswdFile(path, new=True)
+    htpasswd.set_password("admin", "pass")
+    htpasswd.set_password("user", "pass")
+    htpasswd.save()
+
+    async with _get_configured_manager(path, tokens_storage_path=storage_path) as manager:
+        token1 = await manager.login("admin", "pass")
+        token2 = await manager.login("user", "pass")
+        assert token1 and token2
+        assert (await manager.login("user", "pass")) == token2
+        manager.logout(token2)
+
+    async with _get_configured_manager(path, tokens_storage_path=storage_path) as manager:
+        assert manager.check(token1) == "admin"
+        assert manager.check(token2) is None
+        assert (await manager.login("admin", "pass")) not in [None, token1]  # Only digests are saved
+        assert manager.check(token1) == "admin"
+    assert token1 not in open(storage_path).read()
+
+    async with _get_configured_manager(path, tokens_lifetime=0.1) as manager:
+        token = await manager.login("admin", "pass")
+        assert token
+        assert manager.check(token) == "admin"
+        await asyncio.sleep(0.2)
+        assert manager.check(token) is None
+        assert (await manager.login("admin", "pass")) != token
+
+
 @pytest.mark.asyncio
 async def test_ok__disabled() -> None:
     try:
@@ -148,6 +253,13 @@ async def test_ok__disabled() -> None:
             external_kwargs={},
             force_internal_users=[],
             enabled=False,
+            cache_ttl=0.0,
+            cache_fail_limit=0,
+            cache_fail_window=0.0,
+            cache_fail_delay=0.0,
+            tokens_idle_timeout=0.0,
+            tokens_lifetime=0.0,
+            tokens_storage_path="",
         )
 
         assert not manager.is_auth_enabled()
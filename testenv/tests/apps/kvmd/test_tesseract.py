@@ -0,0 +1,130 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import threading
+import time
+
+from typing import List
+from typing import Tuple
+from typing import Any
+
+import pytest
+
+from kvmd.apps.kvmd import tesseract
+
+
+# =====
+class _FakeLib:
+    def __init__(self) -> None:
+        self.created: List[Tuple[str, ...]] = []
+        self.deleted: List[Any] = []
+        self.lock = threading.Lock()
+
+    def create(self, langs: Tuple[str, ...]) -> Any:
+        with self.lock:
+            self.created.append(langs)
+            return ("api", langs, len(self.created))
+
+    def TessBaseAPIClear(self, api: Any) -> None:  # pylint: disable=invalid-name
+        pass
+
+    def TessBaseAPIDelete(self, api: Any) -> None:  # pylint: disable=invalid-name
+        with self.lock:
+            self.deleted.append(api)
+
+    def get_alive(self) -> int:
+        with self.lock:
+            return (len(self.created) - len(self.deleted))
+
+
+@pytest.fixture
+def fake_lib(monkeypatch) -> _FakeLib:  # type: ignore
+    lib = _FakeLib()
+    monkeypatch.setattr(tesseract, "_libtess", lib)
+    monkeypatch.setattr(tesseract, "_tess_api_create", lib.create)
+    return lib
+
+
+# =====
+def test_ok__pool_reuse(fake_lib: _FakeLib) -> None:
+    pool = tesseract._TessApiPool(2)  # pylint: disable=protected-access
+    for _ in range(3):
+        with pool.get(["eng"]):
+            pass
+    with pool.get(["rus"]):
+        pass
+    with pool.get(["eng"]):
+        pass
+    assert fake_lib.created == [("eng",), ("rus",)]
+    assert fake_lib.deleted == []
+
+
+def test_ok__pool_evict_oldest_idle(fake_lib: _FakeLib) -> None:
+    pool = tesseract._TessApiPool(2)  # pylint: disable=protected-access
+    for langs in [["eng"], ["rus"], ["eng"], ["deu"]]:
+        with pool.get(langs):
+            pass
+    assert fake_lib.created == [("eng",), ("rus",), ("deu",)]
+    assert [api[1] for api in fake_lib.deleted] == [("rus",)]
+
+
+def test_ok__pool_busy_engines_count(fake_lib: _FakeLib) -> None:
+    pool = tesseract._TessApiPool(2)  # pylint: disable=protected-access
+    max_alive = 0
+    max_alive_lock = threading.Lock()
+
+    def worker(langs: List[str]) -> None:
+        nonlocal max_alive
+        for _ in range(20):
+            with pool.get(langs):
+                with max_alive_lock:
+                    max_alive = max(max_alive, fake_lib.get_alive())
+                time.sleep(0.001)
+
+    threads = [
+        threading.Thread(target=worker, args=(langs,))
+        for langs in [["eng"], ["rus"], ["deu"], ["eng"], ["fra"]]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+    assert max_alive <= 2
+
+
+def test_fail__pool_create(fake_lib: _FakeLib, monkeypatch) -> None:  # type: ignore
+    pool = tesseract._TessApiPool(1)  # pylint: disable=protected-access
+
+    def broken_create(langs: Tuple[str, ...]) -> Any:
+        _ = langs
+        raise tesseract.OcrError("Can't initialize Tesseract")
+
+    monkeypatch.setattr(tesseract, "_tess_api_create", broken_create)
+    with pytest.raises(tesseract.OcrError):
+        with pool.get(["xxx"]):
+            pass
+
+    monkeypatch.setattr(tesseract, "_tess_api_create", fake_lib.create)
+    with pool.get(["eng"]):  # The slot has been released
+        pass
+    assert fake_lib.created == [("eng",)]
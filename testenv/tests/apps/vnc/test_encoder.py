@@ -0,0 +1,128 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import os
+import struct
+import zlib
+
+from typing import List
+from typing import Tuple
+
+from PIL import Image as PilImage
+
+import pytest
+
+from kvmd.apps.vnc.encoder import FbEncoder
+from kvmd.apps.vnc.rfb.encodings import RfbEncodings
+from kvmd.apps.vnc.rfb.encodings import RfbPixelFormat
+
+
+# =====
+_FORMATS = [
+    # (name, format, CPIXEL bytes of the packed 32-bit pixel)
+    ("rgb565le", RfbPixelFormat(16, 16, False, True, 31, 63, 31, 11, 5, 0), slice(None)),
+    ("rgb565be", RfbPixelFormat(16, 16, True, True, 31, 63, 31, 11, 5, 0), slice(None)),
+    ("bgr233", RfbPixelFormat(8, 8, False, True, 7, 7, 3, 0, 3, 6), slice(None)),
+    ("rgb888le", RfbPixelFormat(32, 24, False, True, 255, 255, 255, 16, 8, 0), slice(0, 3)),
+    ("rgb888be", RfbPixelFormat(32, 24, True, True, 255, 255, 255, 16, 8, 0), slice(1, 4)),
+    ("bgr888le_high", RfbPixelFormat(32, 24, False, True, 255, 255, 255, 8, 16, 24), slice(1, 4)),
+    ("rgb888be_high", RfbPixelFormat(32, 24, True, True, 255, 255, 255, 24, 16, 8), slice(0, 3)),
+    ("rgb101010le", RfbPixelFormat(32, 30, False, True, 1023, 1023, 1023, 20, 10, 0), slice(None)),
+    ("rgb101010be", RfbPixelFormat(32, 30, True, True, 1023, 1023, 1023, 20, 10, 0), slice(None)),
+]
+
+
+def _make_image(width: int, height: int) -> PilImage.Image:
+    image = PilImage.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    image.paste((10, 200, 30), (0, 0, min(width, 64), min(height, 64)))  # Solid ZRLE tile
+    return image
+
+
+def _pack_pixel(fmt: RfbPixelFormat, pixel: Tuple[int, int, int]) -> bytes:
+    value = 0
+    for (component, cmax, shift) in zip(pixel, [fmt.r_max, fmt.g_max, fmt.b_max], [fmt.r_shift, fmt.g_shift, fmt.b_shift]):
+        value |= ((component * cmax + 127) // 255) << shift
+    return struct.pack((">" if fmt.big_endian else "<") + {8: "B", 16: "H", 32: "L"}[fmt.bpp], value)
+
+
+def _pack_image(fmt: RfbPixelFormat, image: PilImage.Image, cpixel: slice=slice(None)) -> bytes:
+    rgb = image.tobytes()
+    return b"".join(_pack_pixel(fmt, pixel)[cpixel] for pixel in zip(rgb[0::3], rgb[1::3], rgb[2::3]))
+
+
+def _parse_length(payload: bytes) -> bytes:
+    (length,) = struct.unpack(">L", payload[:4])
+    assert length == len(payload) - 4
+    return payload[4:]
+
+
+def _encode(encoder: FbEncoder, image: PilImage.Image, encoding: int, fmt: RfbPixelFormat) -> bytes:
+    rects = encoder.encode(image, encoding, fmt, [(0, 0, image.width, image.height)])
+    assert len(rects) == 1
+    assert rects[0][:5] == (0, 0, image.width, image.height, encoding)
+    return rects[0][5]
+
+
+# =====
+@pytest.mark.parametrize("name, fmt, cpixel", _FORMATS)
+def test_ok__raw(name: str, fmt: RfbPixelFormat, cpixel: slice) -> None:
+    _ = (name, cpixel)
+    image = _make_image(100, 70)
+    assert _encode(FbEncoder(), image, RfbEncodings.RAW, fmt) == _pack_image(fmt, image)
+
+
+@pytest.mark.parametrize("name, fmt, cpixel", _FORMATS)
+def test_ok__zlib(name: str, fmt: RfbPixelFormat, cpixel: slice) -> None:
+    _ = (name, cpixel)
+    encoder = FbEncoder()
+    stream = zlib.decompressobj()
+    for _ in range(2):  # The stream lives through the whole connection
+        image = _make_image(100, 70)
+        data = stream.decompress(_parse_length(_encode(encoder, image, RfbEncodings.ZLIB, fmt)))
+        assert data == _pack_image(fmt, image)
+
+
+@pytest.mark.parametrize("name, fmt, cpixel", _FORMATS)
+def test_ok__zrle(name: str, fmt: RfbPixelFormat, cpixel: slice) -> None:
+    _ = name
+    encoder = FbEncoder()
+    stream = zlib.decompressobj()
+    for _ in range(2):
+        image = _make_image(150, 70)
+        data = stream.decompress(_parse_length(_encode(encoder, image, RfbEncodings.ZRLE, fmt)))
+
+        tiles: List[Tuple[int, bytes]] = []
+        for y in range(0, image.height, 64):
+            for x in range(0, image.width, 64):
+                tile = image.crop((x, y, min(x + 64, image.width), min(y + 64, image.height)))
+                if x == 0 and y == 0:
+                    tiles.append((1, _pack_image(fmt, tile.crop((0, 0, 1, 1)), cpixel)))
+                else:
+                    tiles.append((0, _pack_image(fmt, tile, cpixel)))
+
+        offset = 0
+        for (subencoding, expected) in tiles:
+            assert data[offset] == subencoding
+            offset += 1
+            assert data[offset:offset + len(expected)] == expected
+            offset += len(expected)
+        assert offset == len(data)
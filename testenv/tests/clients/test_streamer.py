@@ -0,0 +1,135 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import asyncio
+
+from typing import List
+from typing import Dict
+from typing import AsyncGenerator
+
+import pytest
+
+from kvmd.clients.streamer import StreamerTempError
+from kvmd.clients.streamer import StreamFormats
+from kvmd.clients.streamer import BaseStreamerClient
+
+
+# =====
+class _FakeStreamerClient(BaseStreamerClient):
+    def __init__(self, fmt: int, frames: List[Dict], ring_size: int=4) -> None:
+        super().__init__(ring_size)
+        self.__fmt = fmt
+        self.__frames = frames
+        self.reads = 0
+        self.active = 0
+        self.max_active = 0
+
+    def get_format(self) -> int:
+        return self.__fmt
+
+    async def _read_stream(self) -> AsyncGenerator[Dict, None]:
+        self.reads += 1
+        self.active += 1
+        self.max_active = max(self.active, self.max_active)
+        try:
+            for frame in self.__frames:
+                await asyncio.sleep(0.01)
+                yield frame
+        finally:
+            await asyncio.sleep(0.01)  # Медленное закрытие источника
+            self.active -= 1
+
+
+def _make_frames(count: int, fmt: int=StreamFormats.JPEG, key_every: int=1) -> List[Dict]:
+    return [
+        {
+            "online": True,
+            "width": 640,
+            "height": 480,
+            "data": str(number).encode(),
+            "format": fmt,
+            "key": (number % key_every == 0),
+        }
+        for number in range(count)
+    ]
+
+
+async def _collect(streamer: BaseStreamerClient) -> List[Dict]:
+    frames: List[Dict] = []
+    with pytest.raises(StreamerTempError):
+        async for frame in streamer.read_stream():
+            frames.append(frame)
+    return frames
+
+
+# =====
+@pytest.mark.asyncio
+async def test_ok__fan_out__single_reader() -> None:
+    frames = _make_frames(10)
+    streamer = _FakeStreamerClient(StreamFormats.JPEG, frames)
+    results = await asyncio.gather(*[_collect(streamer) for _ in range(3)])
+    assert streamer.reads == 1
+    for result in results:
+        assert [frame["data"] for frame in result] == [frame["data"] for frame in frames]
+        assert all(got is orig for (got, orig) in zip(result, frames))
+
+
+@pytest.mark.asyncio
+async def test_ok__fan_out__drop_old_jpeg() -> None:
+    frames = _make_frames(10)
+    streamer = _FakeStreamerClient(StreamFormats.JPEG, frames, ring_size=2)
+    received: List[Dict] = []
+    with pytest.raises(StreamerTempError):
+        async for frame in streamer.read_stream():
+            received.append(frame)
+            await asyncio.sleep(0.1)
+    assert len(received) < len(frames)
+    assert received[-1] is frames[-1]
+
+
+@pytest.mark.asyncio
+async def test_ok__fan_out__h264_resync_on_key() -> None:
+    frames = _make_frames(20, fmt=StreamFormats.H264, key_every=5)
+    streamer = _FakeStreamerClient(StreamFormats.H264, frames, ring_size=2)
+    received: List[Dict] = []
+    with pytest.raises(StreamerTempError):
+        async for frame in streamer.read_stream():
+            received.append(frame)
+            await asyncio.sleep(0.03)
+    assert received[0]["key"]
+    numbers = [int(frame["data"]) for frame in received]
+    for (prev, cur) in zip(numbers, numbers[1:]):
+        # Разрыв в последовательности допустим только перед ключевым фреймом
+        assert cur == prev + 1 or frames[cur]["key"]
+
+
+@pytest.mark.asyncio
+async def test_ok__fan_out__reader_restart() -> None:
+    frames = _make_frames(100)
+    streamer = _FakeStreamerClient(StreamFormats.JPEG, frames)
+    for _ in range(3):
+        stream = streamer.read_stream()
+        assert (await stream.__anext__()) is frames[0]
+        await stream.aclose()
+        assert streamer.active == 0
+    assert streamer.reads == 3
+    assert streamer.max_active == 1
@@ -52,3 +52,23 @@ async def test_ok__htpasswd_service(tmpdir) -> None:  # type: ignore
         assert (await service.authorize("user", "bar"))
         assert not (await service.authorize("admin", "foo"))
         assert not (await service.authorize("user", "foo"))
+
+
+@pytest.mark.asyncio
+async def test_ok__htpasswd_service__replace(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("htpasswd")))
+    tmp_path = os.path.abspath(str(tmpdir.join("htpasswd.tmp")))
+
+    htpasswd = passlib.apache.HtpasswdFile(path, new=True)
+    htpasswd.set_password("admin", "pass")
+    htpasswd.save()
+
+    async with get_configured_auth_service("htpasswd", file=path) as service:
+        assert (await service.authorize("admin", "pass"))
+
+        htpasswd.set_password("admin", "bar")
+        htpasswd.save(tmp_path)
+        os.rename(tmp_path, path)
+
+        assert (await service.authorize("admin", "bar"))
+        assert not (await service.authorize("admin", "pass"))
@@ -0,0 +1,123 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+from typing import List
+
+from kvmd.plugins.hid._events import coalesce_events
+from kvmd.plugins.hid.otg import events as otg
+from kvmd.plugins.hid._mcu import proto as mcu
+
+
+# =====
+def test_ok__otg_coalesce_events() -> None:
+    events: List[otg.BaseEvent] = [
+        otg.MouseMoveEvent(1, 1),
+        otg.MouseMoveEvent(2, 2),
+        otg.MouseButtonEvent("left", True),
+        otg.MouseMoveEvent(3, 3),
+        otg.MouseMoveEvent(4, 4),
+        otg.MouseRelativeEvent(100, -1),
+        otg.MouseRelativeEvent(20, -1),
+        otg.MouseRelativeEvent(20, -1),
+        otg.MouseWheelEvent(0, 1),
+        otg.MouseWheelEvent(0, 1),
+    ]
+    assert coalesce_events(events, otg.MouseMoveEvent, otg.MouseRelativeEvent) == [
+        otg.MouseMoveEvent(2, 2),
+        otg.MouseButtonEvent("left", True),
+        otg.MouseMoveEvent(4, 4),
+        otg.MouseRelativeEvent(120, -2),
+        otg.MouseRelativeEvent(20, -1),
+        otg.MouseWheelEvent(0, 1),
+        otg.MouseWheelEvent(0, 1),
+    ]
+
+
+def test_ok__mcu_coalesce_events() -> None:
+    events: List[mcu.BaseEvent] = [
+        mcu.MouseMoveEvent(1, 1),
+        mcu.KeyEvent("KeyA", True),
+        mcu.MouseMoveEvent(2, 2),
+        mcu.MouseMoveEvent(3, 3),
+        mcu.MouseRelativeEvent(-100, 0),
+        mcu.MouseRelativeEvent(-27, 5),
+    ]
+    assert coalesce_events(events, mcu.MouseMoveEvent, mcu.MouseRelativeEvent) == [
+        mcu.MouseMoveEvent(1, 1),
+        mcu.KeyEvent("KeyA", True),
+        mcu.MouseMoveEvent(3, 3),
+        mcu.MouseRelativeEvent(-127, 5),
+    ]
+
+
+def test_ok__mcu_pack_event() -> None:
+    for event in [
+        mcu.SetKeyboardOutputEvent("ps2"),
+        mcu.SetMouseOutputEvent("usb_win98"),
+        mcu.SetConnectedEvent(True),
+        mcu.KeyEvent("ShiftLeft", False),
+        mcu.MouseButtonEvent("down", True),
+        mcu.MouseMoveEvent(-32768, 32767),
+        mcu.MouseWheelEvent(-1, 1),
+    ]:
+        assert mcu.unpack_event(mcu.pack_event(event)) == event
+
+
+def test_ok__mcu_group_events() -> None:
+    events: List[mcu.BaseEvent] = [
+        mcu.SetConnectedEvent(True),
+        *[mcu.KeyEvent("KeyA", bool(index % 2)) for index in range(10)],
+        mcu.ClearEvent(),
+        mcu.MouseMoveEvent(1, 1),
+    ]
+    assert list(map(len, mcu.group_events(events, True))) == [1, 8, 2, 1, 1]
+    assert list(map(len, mcu.group_events(events, False))) == [1] * len(events)
+
+    events = [
+        mcu.KeyEvent("KeyA", True),
+        mcu.MouseRelativeEvent(1, 1),
+        mcu.MouseRelativeEvent(-1, 1),
+        mcu.MouseButtonEvent("left", True),
+        mcu.MouseMoveEvent(1, 1),
+        mcu.MouseWheelEvent(0, 1),
+        mcu.KeyEvent("KeyA", False),
+    ]
+    assert list(map(len, mcu.group_events(events, True))) == [1, 1, 1, 2, 1, 1]
+
+    request = mcu.make_batch_request(events[1:4])
+    assert len(request) == 3 + 3 * 5 + 2
+    assert request[:3] == b"\x33\x20\x03"
+    assert request[3:8] == events[1].make_command()
+    assert mcu.make_batch_request(events[:1]) == events[0].make_request()
+
+
+def test_ok__mcu_cached_requests() -> None:
+    assert mcu.REQUEST_PING == b"\x33\x01\x00\x00\x00\x00\x18\x38"  # Same as the bitwise CRC
+    for state in [False, True]:
+        for name in ["KeyA", "Enter", "ShiftLeft"]:
+            key = mcu.KeyEvent(name, state)
+            assert key.make_request() == mcu.BaseEvent.make_request(key)
+        for name in ["left", "down"]:
+            button = mcu.MouseButtonEvent(name, state)
+            assert button.make_request() == mcu.BaseEvent.make_request(button)
+    assert mcu.check_response(mcu.RESPONSE_LEGACY_OK)
+    assert not mcu.check_response(mcu.RESPONSE_LEGACY_OK[:2] + b"\x00\x00")
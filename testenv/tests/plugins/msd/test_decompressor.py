@@ -0,0 +1,130 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import os
+import zlib
+import gzip
+import lzma
+
+from typing import List
+
+import zstandard
+
+import pytest
+
+from kvmd.plugins.msd.decompressor import split_image_compression
+from kvmd.plugins.msd.decompressor import make_decompressor
+
+
+# =====
+_DATA = (os.urandom(300000) + bytes(3000000) + os.urandom(5000))
+
+
+def _compress(compression: str, data: bytes) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data)
+    elif compression == "xz":
+        return lzma.compress(data)
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _decompress(compression: str, data: bytes, chunk_size: int) -> bytes:
+    decompressor = make_decompressor(compression)
+    out: List[bytes] = []
+    for offset in range(0, len(data), chunk_size):
+        decompressor.decompress(data[offset:offset + chunk_size], out.append)
+    assert decompressor.finish(out.append)
+    assert max(map(len, out), default=0) <= 32 * 1024 * 1024
+    return b"".join(out)
+
+
+_COMPRESSIONS = ["gzip", "xz", "zstd"]
+
+
+# =====
+@pytest.mark.parametrize("name, result", [
+    ("image.iso.gz", ("image.iso", "gzip")),
+    ("image.img.XZ", ("image.img", "xz")),
+    ("image.img.zst", ("image.img", "zstd")),
+    ("image.iso", ("image.iso", "")),
+    (".gz", (".gz", "")),
+])
+def test_ok__split_image_compression(name: str, result: tuple) -> None:
+    assert split_image_compression(name) == result
+
+
+@pytest.mark.parametrize("compression", _COMPRESSIONS)
+@pytest.mark.parametrize("chunk_size", [1, 4099, 65536, 1024 * 1024 * 16])
+def test_ok__decompress_chunks(compression: str, chunk_size: int) -> None:
+    data = (_DATA if chunk_size > 1 else _DATA[:20000])
+    assert _decompress(compression, _compress(compression, data), chunk_size) == data
+
+
+@pytest.mark.parametrize("compression", _COMPRESSIONS)
+@pytest.mark.parametrize("chunk_size", [1000, 65536])
+def test_ok__decompress_multi_stream(compression: str, chunk_size: int) -> None:
+    parts = [_DATA[:100000], b"", _DATA[100000:]]
+    data = b"".join(_compress(compression, part) for part in parts)
+    assert _decompress(compression, data, chunk_size) == _DATA
+
+
+@pytest.mark.parametrize("compression", _COMPRESSIONS)
+@pytest.mark.parametrize("padding", [1, 512, 100000])
+def test_ok__decompress_zero_padding(compression: str, padding: int) -> None:
+    data = _compress(compression, _DATA) + bytes(padding)
+    assert _decompress(compression, data, 4096) == _DATA
+
+
+@pytest.mark.parametrize("compression", _COMPRESSIONS)
+@pytest.mark.parametrize("cut", [1, 10, 1000])
+def test_fail__decompress_truncated(compression: str, cut: int) -> None:
+    data = _compress(compression, _DATA)[:-cut]
+    decompressor = make_decompressor(compression)
+    out: List[bytes] = []
+    decompressor.decompress(data, out.append)
+    assert not decompressor.finish(out.append)
+    assert len(b"".join(out)) <= len(_DATA)
+
+
+@pytest.mark.parametrize("compression", _COMPRESSIONS)
+def test_fail__decompress_truncated_second_stream(compression: str) -> None:
+    data = _compress(compression, _DATA[:1000]) + _compress(compression, _DATA[1000:])[:-100]
+    decompressor = make_decompressor(compression)
+    decompressor.decompress(data, (lambda _: None))
+    assert not decompressor.finish(lambda _: None)
+
+
+@pytest.mark.parametrize("compression", _COMPRESSIONS)
+def test_fail__decompress_garbage(compression: str) -> None:
+    decompressor = make_decompressor(compression)
+    with pytest.raises((zlib.error, lzma.LZMAError, zstandard.ZstdError)):
+        decompressor.decompress(b"\1" * 1000, (lambda _: None))
+
+
+def test_ok__decompress_bomb_is_chunked() -> None:
+    data = gzip.compress(bytes(64 * 1024 * 1024))
+    decompressor = make_decompressor("gzip")
+    sizes: List[int] = []
+    decompressor.decompress(data, (lambda out: sizes.append(len(out))))
+    assert decompressor.finish(lambda _: None)
+    assert sum(sizes) == 64 * 1024 * 1024
+    assert max(sizes) <= 1024 * 1024
@@ -0,0 +1,85 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import os
+import gzip
+import hashlib
+
+import pytest
+
+from kvmd.plugins.msd import MsdImageCompressionError
+from kvmd.plugins.msd import MsdImageWriter
+
+
+# =====
+_DATA = (os.urandom(100000) + bytes(8 * 1024 * 1024) + os.urandom(100000) + bytes(100000))
+
+
+async def _write(path: str, data: bytes, compression: str="") -> MsdImageWriter:
+    writer = await MsdImageWriter(path, len(data), 1024 * 1024, compression).open()
+    try:
+        for offset in range(0, len(data), 65537):
+            await writer.write(data[offset:offset + 65537])
+        await writer.finish()
+    finally:
+        await writer.close()
+    return writer
+
+
+# =====
+@pytest.mark.asyncio
+async def test_ok__writer_sparse(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("image.img")))
+    writer = await _write(path, _DATA)
+
+    with open(path, "rb") as file:
+        assert file.read() == _DATA
+    st = os.stat(path)
+    assert st.st_size == len(_DATA)
+    assert st.st_blocks * 512 < 4 * 1024 * 1024  # Нули не записаны, а трейлер из нулей учтен ftruncate()
+
+    assert writer.get_image_size() == len(_DATA)
+    assert writer.get_sha256() == hashlib.sha256(_DATA).hexdigest()
+    assert writer.get_upload_sha256() == writer.get_sha256()
+
+
+@pytest.mark.asyncio
+async def test_ok__writer_gzip(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("image.img")))
+    data = gzip.compress(_DATA[:5000000]) + gzip.compress(_DATA[5000000:])
+    writer = await _write(path, data, "gzip")
+
+    with open(path, "rb") as file:
+        assert file.read() == _DATA
+    assert os.stat(path).st_size == len(_DATA)
+
+    assert writer.get_image_size() == len(_DATA)
+    assert writer.get_sha256() == hashlib.sha256(_DATA).hexdigest()
+    assert writer.get_upload_sha256() == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_fail__writer_gzip_truncated(tmpdir) -> None:  # type: ignore
+    path = os.path.abspath(str(tmpdir.join("image.img")))
+    data = gzip.compress(_DATA)[:-100]
+    with pytest.raises(MsdImageCompressionError):
+        await _write(path, data, "gzip")
@@ -0,0 +1,119 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+from kvmd.aiomulti import SharedRing
+from kvmd.aiomulti import AioProcessNotifier
+from kvmd.aiomulti import AioSharedFlags
+from kvmd.aiomulti import queue_get_last
+
+
+# =====
+@pytest.mark.asyncio
+async def test_ok__process_notifier() -> None:
+    notifier = AioProcessNotifier()
+    flags = AioSharedFlags({"foo": False, "bar": False}, notifier)
+
+    def worker() -> None:
+        time.sleep(0.1)
+        flags.update(foo=True)
+
+    proc = multiprocessing.Process(target=worker, daemon=True)
+    proc.start()
+    try:
+        await asyncio.wait_for(notifier.wait(), timeout=5)
+        assert (await flags.get()) == {"foo": True, "bar": False}
+    finally:
+        proc.join()
+
+
+@pytest.mark.asyncio
+async def test_ok__shared_flags__consistent() -> None:
+    notifier = AioProcessNotifier()
+    flags = AioSharedFlags({"foo": False, "bar": False}, notifier)
+
+    def worker() -> None:
+        for index in range(20000):
+            flags.update(foo=bool(index % 2), bar=bool(index % 2))
+
+    proc = multiprocessing.Process(target=worker, daemon=True)
+    proc.start()
+    try:
+        while proc.is_alive():
+            state = (await flags.get())
+            assert state["foo"] == state["bar"]
+    finally:
+        proc.join()
+
+
+@pytest.mark.asyncio
+async def test_ok__process_notifier__coalesce() -> None:
+    notifier = AioProcessNotifier()
+    for _ in range(100000):  # Overflows the pipe
+        notifier.notify()
+    await asyncio.wait_for(notifier.wait(), timeout=1)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(notifier.wait(), timeout=0.1)
+
+
+@pytest.mark.asyncio
+async def test_ok__queue_get_last() -> None:
+    q: "multiprocessing.Queue[int]" = multiprocessing.Queue()
+    assert (await queue_get_last(q, 0.1)) == (False, None)
+
+    def worker() -> None:
+        for number in range(5):
+            q.put(number)
+
+    proc = multiprocessing.Process(target=worker, daemon=True)
+    proc.start()
+    proc.join()
+    await asyncio.sleep(0.1)
+    assert (await queue_get_last(q, 1)) == (True, 4)
+
+
+# =====
+def test_ok__shared_ring() -> None:
+    ring = SharedRing("<Bh", 4)
+    assert ring.get_all() == []
+    assert not ring.wait(0)
+
+    def worker() -> None:
+        for number in range(5):
+            ring.put(number, -number)
+
+    proc = multiprocessing.Process(target=worker, daemon=True)
+    proc.start()
+    proc.join()
+    assert ring.wait(1)
+    assert ring.get_all() == [(0, 0), (1, -1), (2, -2), (3, -3)]  # The last one is overflowed
+    assert not ring.wait(0)
+
+    assert ring.put(1, 1)
+    assert ring.put(2, 2, clear=True)
+    assert ring.qsize() == 1
+    assert ring.get_all() == [(2, 2)]
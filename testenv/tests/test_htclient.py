@@ -0,0 +1,135 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import os
+
+from typing import List
+
+import aiohttp
+import aiohttp.web
+
+import pytest
+
+from kvmd import htclient
+
+
+# =====
+class _Server:
+    def __init__(self, data: bytes, drop_after: int=0, drops: int=0, range_fails: int=0, ranges: bool=True) -> None:
+        self.data = data
+        self.drop_after = drop_after
+        self.drops = drops
+        self.range_fails = range_fails
+        self.ranges = ranges
+        self.requested: List[str] = []
+
+    async def handle(self, request: aiohttp.web.Request) -> aiohttp.web.StreamResponse:
+        (first, last) = (0, len(self.data) - 1)
+        status = 200
+        headers = {"ETag": "\"foo\""}
+        if self.ranges:
+            headers["Accept-Ranges"] = "bytes"
+            if "Range" in request.headers:
+                self.requested.append(request.headers["Range"])
+                if self.range_fails:
+                    self.range_fails -= 1
+                    return aiohttp.web.Response(status=503)
+                (first, last) = map(int, request.headers["Range"][len("bytes="):].split("-"))
+                headers["Content-Range"] = f"bytes {first}-{last}/{len(self.data)}"
+                status = 206
+
+        body = self.data[first:last + 1]
+        response = aiohttp.web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        if self.drops and len(body) > self.drop_after:
+            self.drops -= 1
+            await response.write(body[:self.drop_after])
+            assert request.transport is not None
+            request.transport.close()  # Обрываем соединение посреди ответа
+            return response
+        await response.write(body)
+        return response
+
+
+@pytest.fixture(name="make_url")
+async def _make_url_fixture(aiohttp_server):  # type: ignore
+    async def make_url(server: _Server) -> str:
+        app = aiohttp.web.Application()
+        app.router.add_get("/image.img", server.handle)
+        return str((await aiohttp_server(app)).make_url("/image.img"))
+    return make_url
+
+
+async def _download(url: str, **kwargs) -> bytes:  # type: ignore
+    data = bytearray()
+    async with htclient.download(url, **kwargs) as remote:
+        async for chunk in remote.iter_chunked(65536):
+            data += chunk
+    return bytes(data)
+
+
+def _make_data() -> bytes:
+    return os.urandom(1024 * 1024 + 123)
+
+
+# =====
+@pytest.mark.asyncio
+async def test_ok__download(make_url) -> None:  # type: ignore
+    server = _Server(_make_data())
+    assert (await _download(await make_url(server))) == server.data
+    assert server.requested == []
+
+
+@pytest.mark.asyncio
+async def test_ok__download_resume(make_url) -> None:  # type: ignore
+    server = _Server(_make_data(), drop_after=100000, drops=2, range_fails=1)
+    assert (await _download(await make_url(server), retries=2)) == server.data
+    assert server.requested[0] == "bytes=100000-1048698"
+    assert server.requested[1] == "bytes=100000-1048698"  # After 503
+    assert server.requested[2] == "bytes=200000-1048698"
+    assert len(server.requested) == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ranges", [True, False])
+async def test_fail__download_resume(make_url, ranges: bool) -> None:  # type: ignore
+    server = _Server(_make_data(), drop_after=0, drops=10, ranges=ranges)  # Без прогресса
+    with pytest.raises(aiohttp.ClientPayloadError):
+        await _download(await make_url(server), retries=(1 if ranges else 5))
+    assert len(server.requested) == (1 if ranges else 0)
+
+
+@pytest.mark.asyncio
+async def test_ok__download_segments(make_url) -> None:  # type: ignore
+    server = _Server(_make_data(), drop_after=1000, drops=3, range_fails=2)
+    data = await _download(await make_url(server), retries=1, streams=3, segment_size=100000)
+    assert data == server.data
+    assert len(server.requested) == 11 + 2 + 2  # Куски, две докачки (первым оборван GET без Range) и повторы после 503
+
+
+@pytest.mark.asyncio
+async def test_fail__download_segments(make_url) -> None:  # type: ignore
+    server = _Server(_make_data(), range_fails=10)
+    with pytest.raises(aiohttp.ClientResponseError) as err:
+        await _download(await make_url(server), retries=1, streams=2, segment_size=100000)
+    assert err.value.status == 503
@@ -0,0 +1,74 @@
+# ========================================================================== #
+#                                                                            #
+#    KVMD - The main PiKVM daemon.                                           #
+#                                                                            #
+#    Copyright (C) 2018-2022  Maxim Devaev <mdevaev@gmail.com>               #
+#                                                                            #
+#    This program is free software: you can redistribute it and/or modify    #
+#    it under the terms of the GNU General Public License as published by    #
+#    the Free Software Foundation, either version 3 of the License, or       #
+#    (at your option) any later version.                                     #
+#                                                                            #
+#    This program is distributed in the hope that it will be useful,         #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of          #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           #
+#    GNU General Public License for more details.                            #
+#                                                                            #
+#    You should have received a copy of the GNU General Public License       #
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.  #
+#                                                                            #
+# ========================================================================== #
+
+
+import copy
+import json
+
+from typing import Dict
+from typing import Any
+
+import pytest
+
+from kvmd.tools import make_merge_patch
+
+
+# =====
+def _apply_merge_patch(target: Any, patch: Any) -> Any:
+    if not isinstance(patch, dict):
+        return patch
+    result = (copy.deepcopy(target) if isinstance(target, dict) else {})
+    for (key, value) in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = _apply_merge_patch(result.get(key), value)
+    return result
+
+
+# =====
+@pytest.mark.parametrize("src, dest", [
+    ({}, {}),
+    ({"a": 1}, {"a": 1}),
+    ({"a": 1}, {"a": 2}),
+    ({"a": 1}, {"a": True}),
+    ({"a": 1, "b": 2}, {"a": 1}),
+    ({"a": {"x": 1, "y": [1, 2]}}, {"a": {"x": 1, "y": [1, 2, None]}}),
+    ({"a": {"x": 1, "y": 2}}, {"a": {"x": 1}, "b": {"c": {"d": "e"}}}),
+    ({"a": None, "b": 1}, {"a": None, "b": 2}),
+    ({"images": {"foo.iso": {"size": 1}}}, {"images": {"bar.iso": {"size": 2}}}),
+])
+def test_ok__make_merge_patch(src: Dict, dest: Dict) -> None:
+    patch = make_merge_patch(src, dest)
+    assert patch is not None
+    assert _apply_merge_patch(src, patch) == dest
+    if json.dumps(src) == json.dumps(dest):
+        assert patch == {}
+
+
+@pytest.mark.parametrize("src, dest", [
+    ({"a": 1}, {"a": None}),
+    ({}, {"a": None}),
+    ({"a": {"b": 1}}, {"a": {"b": None}}),
+    ({"a": 1}, {"a": {"b": None}}),
+])
+def test_fail__make_merge_patch(src: Dict, dest: Dict) -> None:
+    assert make_merge_patch(src, dest) is None
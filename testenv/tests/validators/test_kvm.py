@@ -27,6 +27,7 @@ import pytest
 from kvmd.validators import ValidatorError
 from kvmd.validators.kvm import valid_atx_power_action
 from kvmd.validators.kvm import valid_atx_button
+from kvmd.validators.kvm import valid_msd_image_sha256
 from kvmd.validators.kvm import valid_info_fields
 from kvmd.validators.kvm import valid_log_seek
 from kvmd.validators.kvm import valid_stream_quality
@@ -60,6 +61,27 @@ def test_fail__valid_atx_button(arg: Any) -> None:
         print(valid_atx_button(arg))
 
 
+# =====
+@pytest.mark.parametrize("arg", [
+    "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+    " E3B0C44298FC1C149AFBF4C8996FB92427AE41E4649B934CA495991B7852B855 ",
+])
+def test_ok__valid_msd_image_sha256(arg: Any) -> None:
+    assert valid_msd_image_sha256(arg) == arg.strip().lower()
+
+
+@pytest.mark.parametrize("arg", [
+    "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b85",
+    "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b8555",
+    "x3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+    "",
+    None,
+])
+def test_fail__valid_msd_image_sha256(arg: Any) -> None:
+    with pytest.raises(ValidatorError):
+        print(valid_msd_image_sha256(arg))
+
+
 # =====
 @pytest.mark.parametrize("arg", [" foo ", "bar", "foo, ,bar,", " ", " , ", ""])
 def test_ok__valid_info_fields(arg: Any) -> None: